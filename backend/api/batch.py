@@ -0,0 +1,136 @@
+"""
+In-process execution of the sub-requests of POST /api/batch/.
+
+Each sub-request is dispatched straight to the view of ``api/urls.py`` it
+resolves to, inside the batch request: authentication, the couple context
+and the database connection are those of the batch, and WebSocket events of
+every sub-request are flushed together by ``BroadcastBufferMiddleware``.
+Middleware does not run again per sub-request, except the rate limit and
+input validation checks, which each sub-request is charged against as if it
+had been sent on its own; DRF authentication, permissions and throttling of
+each view run too. Sub-requests inherit the client's address, host and
+credentials only: conditional headers (If-None-Match, ...) and any other
+header of the batch request do not apply to them.
+
+The couple context is resolved once for the whole batch, so sub-requests see
+the couple as it was when the batch started. Each sub-request is allowed the
+budget of its view on top of the batch's own (see ``api/budgets.py``).
+
+In atomic mode the batch runs in one transaction that is rolled back, with
+its events, as soon as a sub-request fails; the sub-requests after it are
+not run. Otherwise every sub-request runs on its own.
+"""
+import json
+import logging
+from io import BytesIO
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.http import Http404
+from django.urls import resolve
+from .budgets import budget_for, charge_sub_request, view_action
+from .couples import REQUEST_ATTRIBUTE, get_couple_context
+from .middleware import InputValidationMiddleware, RateLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api'
+# Routes that cannot be part of a batch
+EXCLUDED_ROUTES = {'batch'}
+
+NOT_FOUND = {'detail': 'Not found.'}
+SERVER_ERROR = {'detail': 'An unexpected error occurred.'}
+NOT_RUN = {'detail': 'Not run: an earlier request of the batch failed.'}
+# The savepoint around each sub-request
+SUB_REQUEST_QUERIES = 2
+
+# Keys of the batch request's META its sub-requests inherit: where the client
+# connects from (rate limiting, absolute URLs) and its credentials
+INHERITED_META = (
+    'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL',
+    'HTTP_HOST', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_PROTO', 'HTTP_AUTHORIZATION',
+)
+# Middleware checks run again on each sub-request
+SUB_REQUEST_CHECKS = (
+    RateLimitMiddleware(lambda request: None),
+    InputValidationMiddleware(lambda request: None),
+)
+
+
+def build_sub_request(request, method, path, body):
+    """
+    A Django request for one sub-request, authenticated as the batch's user
+    and carrying the batch's couple context.
+    """
+    path, _, query_string = path.partition('?')
+    payload = b'' if body is None else json.dumps(body).encode()
+    sub_request = WSGIRequest({
+        **{key: request.META[key] for key in INHERITED_META if key in request.META},
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+        'wsgi.url_scheme': request.scheme,
+    })
+    sub_request.user = request.user
+    # Picked up by DRF in place of the authentication classes
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    setattr(sub_request, REQUEST_ATTRIBUTE, get_couple_context(request))
+    return sub_request
+
+
+def dispatch(request, method, path, body):
+    """Run one sub-request and return its ``{status, headers, body}``"""
+    try:
+        match = resolve(path.partition('?')[0][len(API_PREFIX):], urlconf='api.urls')
+    except Http404:
+        match = None
+    if match is None or match.url_name in EXCLUDED_ROUTES:
+        return {'status': 404, 'headers': {}, 'body': NOT_FOUND}
+
+    sub_request = build_sub_request(request, method, path, body)
+    sub_request.resolver_match = match
+    if (budget := budget_for(*view_action(match, method))) is not None:
+        charge_sub_request(budget, overhead_queries=SUB_REQUEST_QUERIES)
+    for check in SUB_REQUEST_CHECKS:
+        if (rejected := check.process_request(sub_request)) is not None:
+            return {'status': rejected.status_code, 'headers': dict(rejected.items()), 'body': json.loads(rejected.content)}
+    try:
+        # A savepoint, so a database error only undoes this sub-request
+        with transaction.atomic():
+            response = match.func(sub_request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception(f"Batch sub-request {method} {path} failed")
+        return {'status': 500, 'headers': {}, 'body': SERVER_ERROR}
+    return {
+        'status': response.status_code,
+        'headers': dict(response.items()),
+        'body': getattr(response, 'data', None),
+    }
+
+
+def run_batch(request, sub_requests, atomic=False):
+    """
+    Run sub-requests in order.
+
+    Returns:
+        (responses, committed): one response per sub-request, and whether the
+        writes of the batch were kept (always True when not atomic)
+    """
+    if not atomic:
+        return [dispatch(request, **sub_request) for sub_request in sub_requests], True
+
+    responses = []
+    with transaction.atomic():
+        for sub_request in sub_requests:
+            response = dispatch(request, **sub_request)
+            responses.append(response)
+            if response['status'] >= 400:
+                transaction.set_rollback(True)
+                break
+    committed = len(responses) == len(sub_requests) and responses[-1]['status'] < 400
+    responses += [{'status': 424, 'headers': {}, 'body': NOT_RUN}] * (len(sub_requests) - len(responses))
+    return responses, committed
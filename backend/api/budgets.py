@@ -0,0 +1,214 @@
+"""
+Per-action resource budgets.
+
+Every view declares, per action, the most database queries, cache calls and
+channel-layer sends one request may cost:
+
+    class TaskViewSet(...):
+        budgets = {
+            'list': Budget(queries=3, cache_calls=6),
+            ...
+        }
+
+Viewset actions are keyed by action name (``list``, ``retrieve``,
+``mark_as_read``, ...), plain API views by lower-case HTTP method. A
+request that runs others in process (POST /api/batch/) declares only its own
+overhead and is allowed the budget of every sub-request it runs on top
+(``charge_sub_request``). Budgets
+are measured on a request authenticated without a database lookup, as the
+test client's ``force_authenticate`` does; a token request adds the lookup
+of its user (``TOKEN_AUTHENTICATION_QUERIES``).
+
+The ``assert_within_budget`` fixture (``conftest.py``) enforces the budgets
+in tests; the query plan suite runs every route case under it.
+``RequestBudgetMiddleware`` measures a sample of production requests and
+logs the ones over budget (off unless ``REQUEST_BUDGET_SAMPLE_RATE`` is set).
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+TOKEN_AUTHENTICATION_QUERIES = 1
+
+# Cache methods that each cost one round trip to the cache server; calls a
+# backend makes internally (e.g. get_many looping over get) are not counted
+CACHE_METHODS = (
+    'get', 'set', 'add', 'delete', 'touch', 'incr', 'decr', 'has_key',
+    'get_many', 'set_many', 'delete_many', 'get_or_set', 'clear',
+)
+
+_current_meter = ContextVar('budget_meter', default=None)
+
+
+class Budget(NamedTuple):
+    """Most queries, cache calls and channel-layer sends of one request"""
+    queries: int
+    cache_calls: int = 0
+    channel_sends: int = 0
+    # Checked by the middleware only: test timings are not representative
+    milliseconds: Optional[int] = None
+
+    def plus(self, other):
+        """Sum of two budgets (the latency limits are not added)"""
+        return Budget(
+            self.queries + other.queries,
+            self.cache_calls + other.cache_calls,
+            self.channel_sends + other.channel_sends,
+            self.milliseconds,
+        )
+
+    def violations(self, meter, extra_queries=0):
+        """Descriptions of every limit the measured request went over"""
+        budget = self.plus(meter.allowance)
+        limits = (
+            ('queries', meter.queries, budget.queries + extra_queries),
+            ('cache calls', meter.cache_calls, budget.cache_calls),
+            ('channel sends', meter.channel_sends, budget.channel_sends),
+        )
+        return [f'{used} {name} (budget {limit})' for name, used, limit in limits if used > limit]
+
+
+class Meter:
+    """
+    Counts the queries, cache calls and channel-layer sends made in the
+    current thread while active. Use as a context manager.
+    """
+
+    def __init__(self):
+        self.queries = self.cache_calls = self.channel_sends = 0
+        # Budgets of the sub-requests the measured request ran
+        self.allowance = Budget(queries=0)
+        self._cache_depth = 0
+        self._stack = None
+        self._token = None
+
+    def __repr__(self):
+        return f"Meter(queries={self.queries}, cache_calls={self.cache_calls}, channel_sends={self.channel_sends})"
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def _counting(self, method):
+        def counted(*args, **kwargs):
+            if self._cache_depth == 0:
+                self.cache_calls += 1
+            self._cache_depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._cache_depth -= 1
+        return counted
+
+    def _instrument_cache(self, backend):
+        # Instance attributes shadow the backend's methods; the handler keeps
+        # one backend instance per thread, so other threads are unaffected
+        shadowed = {name: backend.__dict__[name] for name in CACHE_METHODS if name in backend.__dict__}
+
+        def restore():
+            for name in CACHE_METHODS:
+                if name in shadowed:
+                    setattr(backend, name, shadowed[name])
+                else:
+                    backend.__dict__.pop(name, None)
+
+        for name in CACHE_METHODS:
+            setattr(backend, name, self._counting(getattr(backend, name)))
+        self._stack.callback(restore)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._count_query))
+        for alias in settings.CACHES:
+            self._instrument_cache(caches[alias])
+        self._token = _current_meter.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_meter.reset(self._token)
+        self._stack.close()
+        return False
+
+
+def record_channel_sends(count):
+    """Count group sends made through the channel layer (see ``api.realtime``)"""
+    if (meter := _current_meter.get()) is not None:
+        meter.channel_sends += count
+
+
+def charge_sub_request(budget, overhead_queries=0):
+    """
+    Allow the measured request the budget of a sub-request it runs, plus
+    ``overhead_queries`` spent running it (see ``api.batch``)
+    """
+    if (meter := _current_meter.get()) is not None:
+        meter.allowance = meter.allowance.plus(budget).plus(Budget(queries=overhead_queries))
+
+
+def view_action(match, method):
+    """``(view class, action)`` a resolved URL dispatches a request to"""
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    actions = getattr(match.func, 'actions', None)
+    if actions is not None:
+        return view_class, actions.get(method.lower())
+    return view_class, method.lower()
+
+
+def budget_for(view_class, action):
+    """Declared budget of a view action, or None"""
+    return getattr(view_class, 'budgets', {}).get(action)
+
+
+def budget_for_request(method, path):
+    """Declared budget of the view action a request would be dispatched to"""
+    return budget_for(*view_action(resolve(path.partition('?')[0]), method))
+
+
+class RequestBudgetMiddleware:
+    """
+    Measure a sample of requests and log those over their view's budget.
+
+    Enabled by ``REQUEST_BUDGET_SAMPLE_RATE`` (0 to 1, 0 disables the
+    middleware entirely). It sits before ``BroadcastBufferMiddleware`` so
+    the sends flushed after the view are counted.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'REQUEST_BUDGET_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        started = time.monotonic()
+        with Meter() as meter:
+            response = self.get_response(request)
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        if request.resolver_match is not None:
+            view_class, action = view_action(request.resolver_match, request.method)
+            if (budget := budget_for(view_class, action)) is not None:
+                extra = TOKEN_AUTHENTICATION_QUERIES if 'HTTP_AUTHORIZATION' in request.META else 0
+                violations = budget.violations(meter, extra_queries=extra)
+                if budget.milliseconds is not None and elapsed_ms > budget.milliseconds:
+                    violations.append(f'{elapsed_ms:.0f} ms (budget {budget.milliseconds})')
+                if violations:
+                    logger.warning(
+                        f"Over budget: {request.method} {request.path} "
+                        f"[{view_class.__name__}.{action}]: {', '.join(violations)}"
+                    )
+        return response
@@ -0,0 +1,103 @@
+"""
+Side effects of deletes that cascade over many rows, done once per scope.
+
+Deleting a couple or an account removes hundreds of rows, and the
+``post_delete`` signals of each would write a tombstone, bump list versions,
+move list counts and push an ``inbox:deleted`` event per row. Inside
+``batched_deletes()`` the signals of ``api/signals.py`` collect that work on
+the current ``DeletedRows`` instead, and it is done when the block exits,
+still inside its transaction:
+
+- the tombstones are written with one bulk INSERT,
+- each (resource, scope) version is bumped and each count moved once,
+- each recipient gets a single ``inbox:bulk_deleted`` event,
+- each owner's cached profile document is dropped once.
+
+The statements Django runs for the cascade itself still grow with the row
+count (it deletes in chunks of 100); everything else is bounded by the
+number of scopes. Deletes outside the block keep their per-row signals.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from .models import DailyConnection, Tombstone
+from .profiles import invalidate_profile_document
+from .realtime import publish, user_group
+from .versions import bump_versions, couple_scope, track_count
+
+_deleted_rows = ContextVar('deleted_rows', default=None)
+
+
+class DeletedRows:
+    """Work collected from the delete signals of one ``batched_deletes`` block"""
+
+    def __init__(self):
+        self.tombstones = []
+        self.versions = defaultdict(set)  # scope -> resources
+        self.counts = Counter()  # (resource, scope) -> delta
+        self.inbox_ids = defaultdict(list)  # recipient id -> deleted item ids
+        self.profile_user_ids = set()
+        self.answer_connection_ids = set()
+
+    def bump(self, resources, scopes, delta=0, counted=None):
+        """
+        Bump ``resources`` in ``scopes`` and move the count of ``counted``
+        (default: the first resource) by ``delta``
+        """
+        for scope in scopes:
+            self.versions[scope].update(resources)
+            if delta:
+                self.counts[(counted or resources[0], scope)] += delta
+
+    def flush(self):
+        Tombstone.objects.bulk_create(self.tombstones)
+
+        if self.answer_connection_ids:
+            # Connections deleted with their answers bumped their couple's list themselves
+            couple_ids = (
+                DailyConnection.objects.filter(pk__in=self.answer_connection_ids)
+                .values_list('couple_id', flat=True).distinct()
+            )
+            for couple_id in couple_ids:
+                self.versions[couple_scope(couple_id)].add('daily-connections')
+
+        for scope, resources in self.versions.items():
+            bump_versions(sorted(resources), [scope])
+        for (resource, scope), delta in self.counts.items():
+            if delta:
+                track_count(resource, [scope], delta)
+
+        for recipient_id, item_ids in self.inbox_ids.items():
+            if len(item_ids) == 1:
+                publish([user_group(recipient_id)], 'inbox:deleted', {'id': item_ids[0]})
+            else:
+                publish([user_group(recipient_id)], 'inbox:bulk_deleted', {'ids': sorted(item_ids)})
+
+        if self.profile_user_ids:
+            invalidate_profile_document(*sorted(self.profile_user_ids))
+
+
+def deleted_rows():
+    """``DeletedRows`` of the enclosing ``batched_deletes`` block, or None"""
+    return _deleted_rows.get()
+
+
+@contextmanager
+def batched_deletes():
+    """
+    Run the block in a transaction and do the side effects of the rows it
+    deletes once per scope before it commits. Nested blocks join the
+    outermost one.
+    """
+    if _deleted_rows.get() is not None:
+        yield _deleted_rows.get()
+        return
+    rows = DeletedRows()
+    token = _deleted_rows.set(rows)
+    try:
+        with transaction.atomic():
+            yield rows
+            rows.flush()
+    finally:
+        _deleted_rows.reset(token)
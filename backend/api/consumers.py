@@ -1,11 +1,59 @@
+import asyncio
 import json
+import time
+from contextlib import suppress
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from .couples import get_couple_context_for_user
+from .realtime import EventLog, couple_group, encode_event, user_group
+from .websocket import ConnectionSlots, record
+
+# Close codes (4000-4999 are reserved for applications)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_IDLE = 4408
+CLOSE_TOO_MANY_CONNECTIONS = 4429
+
+PING_FRAME = encode_event('ping', {})
+SYNC_REQUIRED_FRAME = encode_event('sync:required', {})
+
+
+def _positions(last_seq):
+    """Stream name -> seq mapping sent by a client, as ints"""
+    return {str(stream): int(seq) for stream, seq in last_seq.items()}
 
 
 class SynkConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
-        self.room_group_name = f'user_{self.user_id}'
+        self.room_group_name = user_group(self.user_id)
+        self.couple_group_name = None
+        self.slot = None
+        self.heartbeat_task = None
+        
+        # Admission: an authenticated user may only open their own stream
+        user = self.scope.get('user')
+        if not (user and user.is_authenticated and str(user.pk) == str(self.user_id)):
+            await record('rejected')
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+        self.slot = await ConnectionSlots.acquire(user.pk, self.channel_name)
+        if self.slot is None:
+            await record('rejected')
+            await self.close(code=CLOSE_TOO_MANY_CONNECTIONS)
+            return
+        
+        # Read stream positions before joining: anything published in between
+        # is either replayed below or delivered live (and dropped by the client
+        # as already seen), never lost
+        couple_id = await self._get_couple_id()
+        streams = [self.room_group_name] + ([couple_group(couple_id)] if couple_id else [])
+        last_seq = self._requested_positions()
+        start = {
+            stream: last_seq[stream] if stream in last_seq else await EventLog.position(stream)
+            for stream in streams
+        }
         
         # Join room group
         await self.channel_layer.group_add(
@@ -13,18 +61,101 @@ class SynkConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
+        # Join the couple group so shared events need a single send per couple
+        if couple_id:
+            await self._join_couple(couple_id)
+        
         await self.accept()
+        await record('accepted')
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = asyncio.create_task(self._heartbeat())
+        await self._replay(start)
+    
+    def _requested_positions(self):
+        """``last_seq`` query parameter: JSON object of stream name -> last seen seq"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        with suppress(KeyError, ValueError, TypeError, AttributeError):
+            return _positions(json.loads(query['last_seq'][0]))
+        return {}
+    
+    async def _replay(self, start):
+        """Send each stream's frames published after ``start``, or ask for a full resync"""
+        replays = {stream: await EventLog.since(stream, seq) for stream, seq in start.items()}
+        if None in replays.values():
+            positions = {stream: await EventLog.position(stream) for stream in start}
+            await self.send(text_data=encode_event('stream:position', positions))
+            await self.send(text_data=SYNC_REQUIRED_FRAME)
+            return
+        await self.send(text_data=encode_event('stream:position', start))
+        for frames in replays.values():
+            for frame in frames:
+                await self.send(text_data=frame)
     
     async def disconnect(self, close_code):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        await self._leave_groups()
+        if self.slot is not None:
+            slot, self.slot = self.slot, None
+            await ConnectionSlots.release(self.scope['user'].pk, slot, self.channel_name)
+    
+    async def _leave_groups(self):
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if self.couple_group_name:
+            await self.channel_layer.group_discard(
+                self.couple_group_name,
+                self.channel_name
+            )
+            self.couple_group_name = None
+    
+    async def _heartbeat(self):
+        """Ping the client periodically and reap the socket once it goes quiet"""
+        while True:
+            await asyncio.sleep(settings.WEBSOCKET_HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > settings.WEBSOCKET_IDLE_TIMEOUT:
+                # Stop receiving group sends right away; the close handshake
+                # of a dead connection may take much longer
+                await record('reaped')
+                await self._leave_groups()
+                await self.close(code=CLOSE_IDLE)
+                return
+            await ConnectionSlots.touch(self.scope['user'].pk, self.slot, self.channel_name)
+            streams = [self.room_group_name] + ([self.couple_group_name] if self.couple_group_name else [])
+            await EventLog.touch(streams)
+            await self.send(text_data=PING_FRAME)
+    
+    @database_sync_to_async
+    def _get_couple_id(self):
+        return get_couple_context_for_user(self.scope['user'].pk).couple_id
+    
+    async def _join_couple(self, couple_id):
+        group_name = couple_group(couple_id)
+        if self.couple_group_name and self.couple_group_name != group_name:
+            await self.channel_layer.group_discard(self.couple_group_name, self.channel_name)
+        self.couple_group_name = group_name
+        await self.channel_layer.group_add(group_name, self.channel_name)
     
     # Receive message from WebSocket
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        self.last_seen = time.monotonic()
         text_data_json = json.loads(text_data)
+        if text_data_json.get('type') == 'pong':
+            return
+        if text_data_json.get('type') == 'replay':
+            # The client saw a gap in a stream: resend what followed its last frame
+            joined = {self.room_group_name, self.couple_group_name}
+            with suppress(ValueError, TypeError, AttributeError):
+                start = {
+                    stream: seq for stream, seq in _positions(text_data_json.get('last_seq') or {}).items()
+                    if stream in joined
+                }
+                if start:
+                    await self._replay(start)
+            return
         message = text_data_json['message']
         
         # Send message to room group
@@ -44,3 +175,21 @@ class SynkConsumer(AsyncWebsocketConsumer):
             'event': event['event'],
             'data': event['data']
         }))
+    
+    # Receive a pre-encoded frame from the channel layer (see api.realtime)
+    async def send_encoded(self, event):
+        await self.send(text_data=event['text'])
+    
+    # The user became part of a couple
+    async def couple_join(self, event):
+        await self._join_couple(event['couple_id'])
+        if 'text' in event:
+            await self.send_encoded(event)
+    
+    # The user's couple was dissolved
+    async def couple_leave(self, event):
+        if self.couple_group_name == couple_group(event['couple_id']):
+            await self.channel_layer.group_discard(self.couple_group_name, self.channel_name)
+            self.couple_group_name = None
+        if 'text' in event:
+            await self.send_encoded(event)
@@ -0,0 +1,143 @@
+"""
+Couple context resolution shared by viewsets, serializers and broadcasting.
+
+A user's couple membership is resolved at most once per request and the
+result (couple id and partner id) is cached per user across requests. The
+``Couple`` signals in ``api/signals.py`` invalidate the cached entry for both
+partners whenever a couple is created, changed or deleted.
+"""
+import logging
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from .models import Couple
+
+logger = logging.getLogger(__name__)
+
+COUPLE_CONTEXT_CACHE_TIMEOUT = 60 * 60  # 1 hour
+REQUEST_ATTRIBUTE = '_couple_context'
+
+
+def _cache_key(user_id):
+    return f"couple_context:{user_id}"
+
+
+class CoupleContext:
+    """
+    Snapshot of a user's couple membership.
+
+    When resolved from the database the ``Couple`` row is loaded together with
+    both users, so ``partner`` costs no extra query. When restored from the
+    cache only ids are known and the couple row is loaded lazily on first
+    access to ``couple`` or ``partner``.
+    """
+
+    __slots__ = ('user_id', 'couple_id', 'partner_id', '_couple')
+
+    def __init__(self, user_id, couple_id=None, partner_id=None, couple=None):
+        self.user_id = user_id
+        self.couple_id = couple_id
+        self.partner_id = partner_id
+        self._couple = couple
+
+    def __repr__(self):
+        return f"CoupleContext(user_id={self.user_id}, couple_id={self.couple_id}, partner_id={self.partner_id})"
+
+    @property
+    def is_coupled(self):
+        return self.couple_id is not None
+
+    @property
+    def user_ids(self):
+        """Ids of every user whose shared content is visible to this user"""
+        if self.is_coupled:
+            return [self.user_id, self.partner_id]
+        return [self.user_id]
+
+    @property
+    def content_filter(self):
+        """Lookup kwargs selecting the shared content rows visible to this user"""
+        if self.is_coupled:
+            return {'couple_id': self.couple_id}
+        return {'user_id': self.user_id}
+
+    @property
+    def couple(self):
+        """The ``Couple`` row with both users loaded, or None if not coupled"""
+        if self._couple is None and self.is_coupled:
+            self._couple = Couple.objects.select_related('user1', 'user2').filter(pk=self.couple_id).first()
+        return self._couple
+
+    @property
+    def partner(self):
+        """The partner ``User`` object, or None if not coupled"""
+        if (couple := self.couple) is None:
+            return None
+        return couple.user2 if couple.user1_id == self.user_id else couple.user1
+
+    @classmethod
+    def resolve(cls, user_id):
+        """Build a context from the database with a single query"""
+        # A user belongs to at most one couple; skipping the default ordering
+        # lets the planner answer from the user1/user2 indexes without a sort
+        couple = next(iter(Couple.objects.select_related('user1', 'user2').filter(
+            Q(user1_id=user_id) | Q(user2_id=user_id)
+        ).order_by()[:1]), None)
+        if couple is None:
+            return cls(user_id)
+        partner_id = couple.user2_id if couple.user1_id == user_id else couple.user1_id
+        return cls(user_id, couple_id=couple.pk, partner_id=partner_id, couple=couple)
+
+
+def get_couple_context_for_user(user):
+    """
+    Get the couple context for a user, using the per-user cache.
+
+    Args:
+        user: Django User object or user id
+
+    Returns:
+        CoupleContext for the user
+    """
+    user_id = getattr(user, 'pk', user)
+    key = _cache_key(user_id)
+
+    if (cached := cache.get(key)) is not None:
+        couple_id, partner_id = cached
+        return CoupleContext(user_id, couple_id=couple_id, partner_id=partner_id)
+
+    context = CoupleContext.resolve(user_id)
+    cache.set(key, (context.couple_id, context.partner_id), COUPLE_CONTEXT_CACHE_TIMEOUT)
+    return context
+
+
+def get_couple_context(request):
+    """
+    Get the couple context for the authenticated user of a request.
+
+    The context is memoized on the underlying Django request, so DRF views,
+    serializers and the broadcaster all share a single resolution.
+
+    Args:
+        request: Django HttpRequest or DRF Request
+
+    Returns:
+        CoupleContext for ``request.user``
+    """
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, REQUEST_ATTRIBUTE, None)
+
+    if context is None or context.user_id != request.user.pk:
+        context = get_couple_context_for_user(request.user)
+        setattr(http_request, REQUEST_ATTRIBUTE, context)
+    return context
+
+
+def invalidate_couple_context(*user_ids):
+    """Drop cached couple contexts for the given users"""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        # Again once committed: a read racing the transaction may have cached the old couple
+        transaction.on_commit(lambda: cache.delete_many(keys))
+    logger.debug(f"Invalidated couple context for users {user_ids}")
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import sys
+import time
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.throttling import UserRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Couple-scoped list endpoints; the detail of each list's first item is measured too
+DEFAULT_PATHS = [
+    '/api/tasks/',
+    '/api/milestones/',
+    '/api/activities/',
+    '/api/suggestions/',
+    '/api/collections/',
+    '/api/memories/',
+]
+
+
+def wsgi_get(handler, path, host, authorization):
+    """GET through the sync handler, as a WSGI worker serves it; returns (status, body)"""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': host,
+        'HTTP_AUTHORIZATION': authorization,
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    response = handler(environ, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+    try:
+        body = b''.join(response)
+    finally:
+        response.close()
+    return statuses[0], body
+
+
+async def asgi_get(handler, path, host, authorization):
+    """GET through the ASGI handler, as Daphne serves it; returns (status, body)"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', host.encode()), (b'authorization', authorization.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (host, 80),
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; Django cancels this once it has responded
+        await asyncio.Future()
+
+    status, chunks = None, []
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await handler(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the GET throughput of one sync (WSGI) worker with one ASGI (Daphne) worker '
+        'serving concurrent requests, in process. Run it with DEBUG=True: RateLimitMiddleware '
+        'would otherwise throttle the requests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            type=str,
+            default='testuser',
+            help='User the requests are authenticated as',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per endpoint and handler',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='Requests in flight at once on the ASGI worker',
+        )
+        parser.add_argument(
+            '--host',
+            type=str,
+            default='localhost',
+            help='Host header of the requests (must be in ALLOWED_HOSTS)',
+        )
+        parser.add_argument(
+            '--path',
+            dest='paths',
+            action='append',
+            help='Endpoint to measure, repeatable (default: the couple-scoped lists)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        host = options['host']
+        authorization = f'Bearer {AccessToken.for_user(self.user)}'
+        wsgi, asgi = WSGIHandler(), ASGIHandler()
+
+        paths = []
+        for path in options['paths'] or DEFAULT_PATHS:
+            paths.append(path)
+            if (pk := self.first_id(wsgi, path, host, authorization)) is not None:
+                paths.append(f'{path}{pk}/')
+
+        failed = 0
+        for path in paths:
+            # Warm up both handlers (middleware chain, URL resolver, connections)
+            wsgi_get(wsgi, path, host, authorization)
+            asyncio.run(asgi_get(asgi, path, host, authorization))
+
+            self.reset_throttle()
+            sync_rate, sync_failed = self.run_sync(wsgi, path, host, authorization, options['requests'])
+            self.reset_throttle()
+            asgi_rate, asgi_failed = asyncio.run(
+                self.run_async(asgi, path, host, authorization, options['requests'], options['concurrency'])
+            )
+            failed += sync_failed + asgi_failed
+            self.stdout.write(
+                f'{path:<40} sync {sync_rate:8.1f} req/s   asgi {asgi_rate:8.1f} req/s   '
+                f'({asgi_rate / sync_rate:.2f}x)'
+            )
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} response(s) were not 2xx; their timings are not comparable'))
+
+    def first_id(self, handler, path, host, authorization):
+        """Id of the first item listed by ``path``, None when empty or not a list"""
+        status, body = wsgi_get(handler, path, host, authorization)
+        if status != 200:
+            return None
+        data = json.loads(body)
+        items = data.get('results') if isinstance(data, dict) else data
+        if items and isinstance(items[0], dict):
+            return items[0].get('id')
+        return None
+
+    def reset_throttle(self):
+        """Start every run with an empty UserRateThrottle history"""
+        throttle = UserRateThrottle()
+        throttle.cache.delete(throttle.cache_format % {'scope': throttle.scope, 'ident': self.user.pk})
+
+    @staticmethod
+    def run_sync(handler, path, host, authorization, requests):
+        """Requests one after another, as a sync worker serves them; returns (req/s, non-2xx)"""
+        failed = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            status, _ = wsgi_get(handler, path, host, authorization)
+            failed += not 200 <= status < 300
+        return requests / (time.perf_counter() - started), failed
+
+    @staticmethod
+    async def run_async(handler, path, host, authorization, requests, concurrency):
+        """``concurrency`` clients sharing the requests on one event loop; returns (req/s, non-2xx)"""
+        remaining = iter(range(requests))
+        statuses = []
+
+        async def client():
+            for _ in remaining:
+                status, _ = await asgi_get(handler, path, host, authorization)
+                statuses.append(status)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return requests / elapsed, sum(not 200 <= status < 300 for status in statuses)
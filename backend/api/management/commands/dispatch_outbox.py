@@ -0,0 +1,81 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.outbox import dispatch_batch, outbox_stats, purge_dispatched
+
+
+class Command(BaseCommand):
+    help = 'Sends the WebSocket events written to the outbox (REALTIME_OUTBOX) through the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Events sent per batch',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.5,
+            help='Seconds to wait when no event is due',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=settings.REALTIME_OUTBOX_MAX_ATTEMPTS,
+            help='Sends tried before an event is given up',
+        )
+        parser.add_argument(
+            '--retention-hours',
+            type=float,
+            default=24,
+            help='Hours dispatched events are kept before being purged',
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=60,
+            help='Seconds between backlog reports',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send every event due now, then exit',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_attempts = options['max_attempts']
+        retention = timedelta(hours=options['retention_hours'])
+        dispatched = failed = 0
+        next_report = time.monotonic() + options['stats_interval']
+
+        try:
+            while True:
+                batch_dispatched, batch_failed = dispatch_batch(batch_size, max_attempts)
+                dispatched += batch_dispatched
+                failed += batch_failed
+
+                if batch_dispatched + batch_failed == 0:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+
+                if time.monotonic() >= next_report:
+                    purge_dispatched(timezone.now() - retention)
+                    self.report(dispatched, failed, max_attempts)
+                    next_report = time.monotonic() + options['stats_interval']
+        except KeyboardInterrupt:
+            pass
+        purge_dispatched(timezone.now() - retention)
+        self.report(dispatched, failed, max_attempts)
+
+    def report(self, dispatched, failed, max_attempts):
+        stats = outbox_stats(max_attempts)
+        self.stdout.write(
+            f"Outbox: {dispatched} dispatched, {failed} failed attempt(s); "
+            f"{stats['pending']} pending ({stats['dead']} dead), lag {stats['lag_seconds']}s"
+        )
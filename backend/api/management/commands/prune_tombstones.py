@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the tombstones of rows deleted more than SYNC_TOMBSTONE_RETENTION_DAYS ago; '
+        'clients syncing from an older cursor get a full sync. Run it daily.'
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {deleted} tombstone(s) older than {settings.SYNC_TOMBSTONE_RETENTION_DAYS} day(s)'
+        ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from api.models import UserProfile
+from api.profiles import invalidate_profile_document
+
+
+class Command(BaseCommand):
+    help = 'Creates the UserProfile rows missing for existing users, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Users examined per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the missing profiles without creating them',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        created = conflicts = 0
+        last_pk = 0
+
+        while True:
+            # Walk by primary key: rows repaired in a batch drop out of the filter
+            users = list(
+                User.objects.filter(profile__isnull=True, pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'username', 'email')[:batch_size]
+            )
+            if not users:
+                break
+            last_pk = users[-1].pk
+
+            # email_normalized is unique: skip users whose email is already taken
+            emails = {user.email.lower() for user in users}
+            taken = set(UserProfile.objects.filter(email_normalized__in=emails).values_list('email_normalized', flat=True))
+            profiles = []
+            for user in users:
+                email = user.email.lower()
+                if email in taken:
+                    conflicts += 1
+                    self.stdout.write(
+                        self.style.WARNING(f'Skipped "{user.username}": email "{email}" belongs to another profile')
+                    )
+                    continue
+                taken.add(email)
+                profiles.append(UserProfile(user=user, email_normalized=email))
+
+            if not dry_run and profiles:
+                UserProfile.objects.bulk_create(profiles)
+                # bulk_create sends no signals
+                invalidate_profile_document(*(profile.user_id for profile in profiles))
+            created += len(profiles)
+
+        verb = 'Would create' if dry_run else 'Created'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {created} missing profile(s); {conflicts} conflict(s)'))
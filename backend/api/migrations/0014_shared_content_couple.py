@@ -0,0 +1,82 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SHARED_MODELS = ['task', 'milestone', 'activity', 'suggestion', 'collection', 'memory']
+
+
+def backfill_couple(apps, schema_editor):
+    """Stamp existing couples on both partners' shared content"""
+    Couple = apps.get_model('api', 'Couple')
+    for couple in Couple.objects.all().iterator():
+        for model_name in SHARED_MODELS:
+            apps.get_model('api', model_name).objects.filter(
+                user_id__in=[couple.user1_id, couple.user2_id]
+            ).update(couple=couple)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_add_user_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activities', to='api.couple'),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='collections', to='api.couple'),
+        ),
+        migrations.AddField(
+            model_name='memory',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='memories', to='api.couple'),
+        ),
+        migrations.AddField(
+            model_name='milestone',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='milestones', to='api.couple'),
+        ),
+        migrations.AddField(
+            model_name='suggestion',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suggestions', to='api.couple'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='couple',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='api.couple'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['couple', '-created_at'], name='api_activit_couple__0aeb6d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['couple', '-created_at'], name='api_collect_couple__668ad9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memory',
+            index=models.Index(fields=['couple', '-created_at'], name='api_memory_couple__964dea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milestone',
+            index=models.Index(fields=['couple', '-created_at'], name='api_milesto_couple__a03a43_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suggestion',
+            index=models.Index(fields=['couple', '-created_at'], name='api_suggest_couple__e52390_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['couple', '-created_at'], name='api_task_couple__343570_idx'),
+        ),
+        migrations.RunPython(backfill_couple, migrations.RunPython.noop),
+    ]
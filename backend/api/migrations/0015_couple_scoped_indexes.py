@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_shared_content_couple'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='memory',
+            name='api_memory_couple__964dea_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-created_at'], name='api_activit_user_id_3893a3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['user', '-created_at'], name='api_collect_user_id_304bd9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memory',
+            index=models.Index(fields=['couple', '-date'], name='api_memory_couple__5445b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memory',
+            index=models.Index(fields=['user', '-date'], name='api_memory_user_id_790593_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milestone',
+            index=models.Index(fields=['user', '-created_at'], name='api_milesto_user_id_68d5dd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milestone',
+            index=models.Index(fields=['user', 'status'], name='api_milesto_user_id_d4b9c8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suggestion',
+            index=models.Index(fields=['user', '-created_at'], name='api_suggest_user_id_52d2b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', '-created_at'], name='api_task_user_id_5d7950_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'status'], name='api_task_user_id_bc28eb_idx'),
+        ),
+    ]
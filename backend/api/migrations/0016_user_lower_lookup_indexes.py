@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Expression indexes backing ``users_matching`` (case-insensitive username
+    and email lookups during registration and profile updates).
+
+    ``auth_user`` belongs to django.contrib.auth, so the indexes are created
+    with raw SQL; ``LOWER(...)`` expression indexes work on both SQLite and
+    PostgreSQL.
+    """
+
+    dependencies = [
+        ('api', '0015_couple_scoped_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS api_user_username_lower_idx ON auth_user (LOWER(username));',
+            reverse_sql='DROP INDEX IF EXISTS api_user_username_lower_idx;',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS api_user_email_lower_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX IF EXISTS api_user_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_user_lower_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='couplingcode',
+            index=models.Index(fields=['created_by', '-created_at'], name='api_couplin_created_87784e_idx'),
+        ),
+    ]
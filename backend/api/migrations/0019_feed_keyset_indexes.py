@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='activity',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name_plural': 'Activities'},
+        ),
+        migrations.AlterModelOptions(
+            name='inboxitem',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='memory',
+            options={'ordering': ['-date', '-id'], 'verbose_name_plural': 'Memories'},
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='api_activit_couple__0aeb6d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='api_activit_user_id_3893a3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='inboxitem',
+            name='api_inboxit_recipie_62df26_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='memory',
+            name='api_memory_couple__5445b3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='memory',
+            name='api_memory_user_id_790593_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['couple', '-created_at', '-id'], name='api_activit_couple__45e28e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_activit_user_id_311b5a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxitem',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='api_inboxit_recipie_919cda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memory',
+            index=models.Index(fields=['couple', '-date', '-id'], name='api_memory_couple__bbe748_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memory',
+            index=models.Index(fields=['user', '-date', '-id'], name='api_memory_user_id_785ee1_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='api_tombsto_deleted_d8b137_idx'),
+        ),
+    ]
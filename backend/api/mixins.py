@@ -1,41 +1,44 @@
 """
 Reusable mixins for ViewSets to avoid code duplication
 """
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.db.models import Q
-from .models import Couple
+import hashlib
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from .couples import get_couple_context, get_couple_context_for_user
+from .realtime import publish, publish_shared, user_group
+from .versions import ResourceVersions, context_scope
 
 
 class PartnerResolutionMixin:
     """
     Mixin for ViewSets that need access to both user's own data and partner's data.
     
-    Provides a helper method to resolve the partner in a couple relationship.
+    Provides helpers to resolve the partner in a couple relationship through the
+    request's CoupleContext, so the couple is looked up at most once per request.
     Useful for ViewSets like Task, Suggestion, Collection where coupled users
     should see each other's data.
     """
     
-    @staticmethod
-    def get_partner(user):
+    @property
+    def couple_context(self):
+        """CoupleContext for the requesting user, memoized on the request"""
+        return get_couple_context(self.request)
+    
+    def get_partner(self, user=None):
         """
         Get user's partner if coupled, otherwise None.
         
         Args:
-            user: Django User object
+            user: Django User object (defaults to the requesting user)
             
         Returns:
             User object (the partner) or None if user is not coupled
         """
-        try:
-            couple = Couple.objects.get(user1=user)
-            return couple.user2
-        except Couple.DoesNotExist:
-            try:
-                couple = Couple.objects.get(user2=user)
-                return couple.user1
-            except Couple.DoesNotExist:
-                return None
+        if user is None or user.pk == self.request.user.pk:
+            return self.couple_context.partner
+        return get_couple_context_for_user(user).partner
 
 
 class BroadcastMixin:
@@ -43,6 +46,7 @@ class BroadcastMixin:
     Mixin for ViewSets that broadcast WebSocket events to users.
     
     Provides broadcast methods to send real-time updates via Django Channels.
+    Events are deferred until the transaction commits and coalesced per request.
     
     Usage:
         class TaskViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
@@ -55,32 +59,17 @@ class BroadcastMixin:
         """
         Broadcast a WebSocket event to the current user and their partner (if coupled).
         
+        Coupled users get one send to the couple group, which both partners'
+        sockets join. The event is sent once the surrounding transaction
+        commits, together with the other events of this request (see
+        ``api.realtime``).
+        
         Args:
             event_type: String event type (e.g., 'task:created', 'suggestion:deleted')
             data: Serialized data to send to the client
         """
-        channel_layer = get_channel_layer()
-        # Send to current user
-        async_to_sync(channel_layer.group_send)(
-            f"user_{self.request.user.id}",
-            {
-                "type": "send_message",
-                "event": event_type,
-                "data": data
-            }
-        )
-        
-        # Send to partner if coupled
-        if hasattr(self, 'get_partner'):
-            if partner := self.get_partner(self.request.user):
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{partner.id}",
-                    {
-                        "type": "send_message",
-                        "event": event_type,
-                        "data": data
-                    }
-                )
+        couple_id = get_couple_context(self.request).couple_id
+        publish_shared(couple_id, self.request.user.id, event_type, data)
 
     def broadcast_to_user(self, user, event_type, data):
         """
@@ -91,12 +80,44 @@ class BroadcastMixin:
             event_type: String event type (e.g., 'inbox:created')
             data: Serialized data to send to the client
         """
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user.id}",
-            {
-                "type": "send_message",
-                "event": event_type,
-                "data": data
-            }
-        )
+        publish([user_group(user.id)], event_type, data)
+
+
+class VersionedListMixin:
+    """
+    Mixin for ViewSets whose list is tracked by a resource version (see
+    ``api.versions``).
+    
+    List responses carry an ETag derived from the version of
+    ``version_resource`` in the requester's scope. A request whose
+    ``If-None-Match`` matches it gets 304 Not Modified without running the
+    list query, the paginator or the serializer.
+    
+    Usage:
+        class TaskViewSet(VersionedListMixin, PartnerResolutionMixin, viewsets.ModelViewSet):
+            version_resource = 'tasks'
+    """
+    
+    version_resource = None
+    
+    def get_version_scope(self):
+        """Scope of the listed rows; the couple's shared content by default"""
+        return context_scope(get_couple_context(self.request))
+    
+    def get_list_etag(self, request):
+        scope = self.get_version_scope()
+        version = ResourceVersions.current(self.version_resource, scope)
+        # Pages, limits and renderers of the same version are different representations
+        fingerprint = f"{self.version_resource}:{scope}:{version}:{request.accepted_renderer.format}:{request.META.get('QUERY_STRING', '')}"
+        return '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+    
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        # Let browsers keep the list but always revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, Lower
 from django.contrib.auth.models import User
 from django.utils import timezone
 import secrets
@@ -6,6 +8,46 @@ import string
 import uuid
 
 
+class CoupleScopedQuerySet(models.QuerySet):
+    """
+    QuerySet for content shared between the partners of a couple.
+    
+    Ordering contract: ``for_couple`` filters on exactly one leading column
+    (``couple`` when the user is coupled, ``user`` otherwise) and keeps the
+    model's ``Meta.ordering``. Every model using this queryset declares both a
+    ``(couple, *ordering)`` and a ``(user, *ordering)`` index, so each list
+    query is a single index range scan that needs no separate sort step.
+    Callers that re-order must add a matching index.
+    """
+    
+    def for_couple(self, user):
+        """
+        Restrict to the rows visible to a user: the couple's rows if coupled,
+        otherwise the user's own rows.
+        
+        Args:
+            user: User object, user id or CoupleContext
+        """
+        from .couples import CoupleContext, get_couple_context_for_user
+        
+        context = user if isinstance(user, CoupleContext) else get_couple_context_for_user(user)
+        return self.filter(**context.content_filter)
+
+
+def users_matching(field, value):
+    """
+    Case-insensitive exact match on a ``User`` column.
+    
+    Compares ``LOWER(column)`` so the lookup is served by the expression
+    indexes created in migration 0016 instead of the ``__iexact`` LIKE scan.
+    
+    Args:
+        field: ``'username'`` or ``'email'``
+        value: Value to match regardless of case
+    """
+    return User.objects.alias(**{f'{field}_lower': Lower(field)}).filter(**{f'{field}_lower': value.lower()})
+
+
 class UserProfile(models.Model):
     """Extended user profile with UUID and enhanced data persistence"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -51,6 +93,9 @@ class Task(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tasks')
+    # Denormalized from the owner's couple so shared lists are one index range scan
+    # (indexed by the composite indexes in Meta)
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='tasks')
     title = models.CharField(max_length=200)
     category = models.CharField(max_length=100)
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
@@ -67,8 +112,17 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CoupleScopedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['couple', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'status']),
+        ]
     
     def __str__(self):
         return self.title
@@ -82,6 +136,7 @@ class Milestone(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='milestones')
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='milestones')
     name = models.CharField(max_length=200)
     date = models.CharField(max_length=100)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Upcoming')
@@ -89,8 +144,17 @@ class Milestone(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CoupleScopedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['couple', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'status']),
+        ]
     
     def __str__(self):
         return self.name
@@ -101,15 +165,26 @@ class Activity(models.Model):
     # For couples app, this will be the logged-in user's name or their partner's name
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='activities')
     activity_user = models.CharField(max_length=100)  # Name of the user who performed the activity
     action = models.CharField(max_length=100)
     item = models.CharField(max_length=200)
     timestamp = models.CharField(max_length=50)
     avatar = models.TextField()  # Supports both HTTP URLs and data URLs (SVG avatars)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CoupleScopedQuerySet.as_manager()
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Keyset pagination runs on (created_at, id), see api/pagination.py
+            models.Index(fields=['couple', '-created_at', '-id']),
+            models.Index(fields=['user', '-created_at', '-id']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+        ]
         verbose_name_plural = 'Activities'
     
     def __str__(self):
@@ -118,6 +193,7 @@ class Activity(models.Model):
 
 class Suggestion(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='suggestions')
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='suggestions')
     title = models.CharField(max_length=200)
     suggested_by = models.CharField(max_length=100)
     date = models.CharField(max_length=50)
@@ -127,9 +203,18 @@ class Suggestion(models.Model):
     excitement = models.IntegerField(default=0)  # 0-100
     tags = models.JSONField(default=list)  # List of tags
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CoupleScopedQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['couple', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+        ]
     
     def __str__(self):
         return self.title
@@ -137,13 +222,23 @@ class Suggestion(models.Model):
 
 class Collection(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collections')
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='collections')
     name = models.CharField(max_length=100)
     icon = models.CharField(max_length=50)
     color = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CoupleScopedQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['couple', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+        ]
     
     def __str__(self):
         return self.name
@@ -185,6 +280,20 @@ class Couple(models.Model):
         elif user == self.user2:
             return self.user1
         return None
+    
+    def link_shared_content(self):
+        """
+        Stamp this couple on both partners' shared content rows.
+        
+        Rows are unlinked automatically (SET_NULL) when the couple is deleted.
+        ``updated_at`` is bumped so the rows show up in each partner's next
+        delta sync.
+        """
+        now = timezone.now()
+        for model in COUPLE_SHARED_MODELS:
+            model.objects.filter(
+                user_id__in=[self.user1_id, self.user2_id]
+            ).update(couple=self, updated_at=now)
 
 
 class CouplingCode(models.Model):
@@ -198,6 +307,9 @@ class CouplingCode(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', '-created_at']),
+        ]
     
     def __str__(self):
         return f"Code {self.code} by {self.created_by.username}"
@@ -369,18 +481,119 @@ class InboxItem(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         indexes = [
-            models.Index(fields=['recipient', '-created_at']),
+            models.Index(fields=['recipient', '-created_at', '-id']),
             models.Index(fields=['recipient', 'is_read']),
+            models.Index(fields=['recipient', 'updated_at']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.recipient.username}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Read state as loaded, so the counter signals can tell an item being
+        # marked read or unread from an unrelated save
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Mark the item read (or unread) with a conditional UPDATE matching only
+        while the row still holds the loaded read state: of concurrent saves
+        flipping the same item, only the one that matched sets
+        ``_read_flipped`` and moves the counter.
+        """
+        self._read_flipped = False
+        was_read = getattr(self, '_loaded_is_read', None)
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or was_read is None or was_read == self.is_read or (
+            update_fields is not None and 'is_read' not in update_fields
+        ):
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            self._read_flipped = bool(
+                InboxItem.objects.filter(pk=self.pk, is_read=was_read).update(is_read=self.is_read)
+            )
+            super().save(*args, **kwargs)
+
+
+class InboxCounter(models.Model):
+    """
+    Per-user inbox counts, kept in step with ``InboxItem`` by the signals in
+    ``api/signals.py`` inside the transaction of each write, so badges are
+    read from one row instead of counting the inbox.
+    
+    A missing row is rebuilt from the inbox on first use.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='inbox_counter')
+    unread = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread of {self.total}"
+    
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recount a user's inbox into their counter row"""
+        counts = InboxItem.objects.filter(recipient_id=user_id).aggregate(
+            total=Count('id'),
+            unread=Count('id', filter=Q(is_read=False))
+        )
+        counter, created = cls.objects.update_or_create(user_id=user_id, defaults=counts)
+        return counter
+    
+    @classmethod
+    def for_user(cls, user_id):
+        """A user's counter, rebuilt if it does not exist yet"""
+        try:
+            return cls.objects.get(user_id=user_id)
+        except cls.DoesNotExist:
+            return cls.rebuild(user_id)
+    
+    @classmethod
+    def recount(cls, user_id):
+        """
+        Recount an existing counter row, locked so concurrent writes to it
+        are counted before or after, never lost. Returns None (and creates
+        nothing) when the user has no counter row.
+        """
+        with transaction.atomic():
+            if not list(cls.objects.select_for_update().filter(user_id=user_id).values_list('pk', flat=True)):
+                return None
+            counts = InboxItem.objects.filter(recipient_id=user_id).aggregate(
+                total=Count('id'),
+                unread=Count('id', filter=Q(is_read=False))
+            )
+            cls.objects.filter(user_id=user_id).update(**counts)
+        return cls(user_id=user_id, **counts)
+    
+    @classmethod
+    def apply(cls, user_id, unread=0, total=0, rebuild_missing=True):
+        """
+        Move a user's counts by the given deltas and return the counter.
+        
+        A missing row is rebuilt from the inbox, which already includes the
+        write being counted; with ``rebuild_missing=False`` (deletes, which
+        may be part of the user's own deletion) it is left missing and None
+        is returned.
+        """
+        # Clamped at 0 in case a bulk write that skipped the signals left the
+        # counts behind (deleting the row has it rebuilt)
+        updated = cls.objects.filter(user_id=user_id).update(
+            unread=Greatest(F('unread') + unread, 0),
+            total=Greatest(F('total') + total, 0)
+        )
+        if updated:
+            return cls.objects.get(user_id=user_id)
+        return cls.rebuild(user_id) if rebuild_missing else None
 
 class Memory(models.Model):
     """Shared memories for couples - photos and moments"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memories')
+    couple = models.ForeignKey('Couple', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='memories')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     date = models.DateField()  # When the memory was made
@@ -391,14 +604,77 @@ class Memory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CoupleScopedQuerySet.as_manager()
+    
     class Meta:
-        ordering = ['-date']
+        ordering = ['-date', '-id']
+        indexes = [
+            models.Index(fields=['couple', '-date', '-id']),
+            models.Index(fields=['user', '-date', '-id']),
+            models.Index(fields=['couple', 'updated_at']),
+            models.Index(fields=['user', 'updated_at']),
+        ]
         verbose_name_plural = 'Memories'
     
     def __str__(self):
         return self.title
 
 
+class Tombstone(models.Model):
+    """
+    Record of a deleted task, milestone, memory, etc. served by the delta sync
+    endpoint, so clients can drop rows removed since their last sync. A
+    ``couple`` tombstone per partner records a dissolved couple. Pruned after
+    ``SYNC_TOMBSTONE_RETENTION_DAYS`` (see ``api/sync.py``).
+    """
+    model = models.CharField(max_length=50)  # Model label, e.g. 'task'
+    object_id = models.BigIntegerField()
+    # Plain references without constraints: a tombstone outlives the row it
+    # describes, including an owner deleted in the same cascade
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    couple = models.ForeignKey('Couple', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, db_index=False, related_name='+')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['couple', 'deleted_at']),
+            models.Index(fields=['user', 'deleted_at']),
+            models.Index(fields=['deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A channel layer message waiting to be sent, written in the transaction of
+    the change that produced it when ``REALTIME_OUTBOX`` is on (see
+    ``api/outbox.py``). ``groups`` holds the groups still to be reached, so a
+    retry skips those a partial failure already delivered to.
+    """
+    groups = models.JSONField()
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Retries are held back until then
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The dispatcher's scan for pending events, oldest first
+            models.Index(fields=['dispatched_at', 'id']),
+        ]
+    
+    def __str__(self):
+        state = f"dispatched at {self.dispatched_at}" if self.dispatched_at else f"pending after {self.attempts} attempt(s)"
+        return f"Outbox event {self.pk} to {', '.join(self.groups)}: {state}"
+
+
 class DailyConnectionPrompt(models.Model):
     """Pool of prompts for daily connections to cycle through"""
     prompt_text = models.TextField(unique=True)
@@ -427,3 +703,5 @@ class DailyConnectionPrompt(models.Model):
         return self.prompt_text[:50]
 
 
+# Content tables that carry a denormalized couple_id and are shared between partners
+COUPLE_SHARED_MODELS = (Task, Milestone, Activity, Suggestion, Collection, Memory)
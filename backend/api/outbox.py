@@ -0,0 +1,115 @@
+"""
+Transactional outbox for WebSocket events.
+
+With ``REALTIME_OUTBOX`` on, ``publish_message`` (``api/realtime.py``) writes
+every event to ``OutboxEvent`` in the transaction of the change it reports,
+instead of sending it once the transaction commits. The ``dispatch_outbox``
+management command drains the table in batches:
+
+- Due events are locked (``SKIP LOCKED`` where supported, so several workers
+  can run), sent through the channel layer and marked dispatched.
+- A failed send is retried with exponential backoff, to the groups that were
+  not reached only. After ``REALTIME_OUTBOX_MAX_ATTEMPTS`` attempts the event
+  is left pending and counted as dead.
+- Dispatched events are purged after a retention period.
+
+``outbox_stats`` reports the backlog and its lag, also served by
+GET /api/realtime/stats/.
+"""
+import json
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .models import OutboxEvent
+from .realtime import send_group_messages
+
+logger = logging.getLogger(__name__)
+
+RETRY_BACKOFF_SECONDS = 2  # doubled on every failed attempt
+MAX_RETRY_BACKOFF_SECONDS = 5 * 60
+
+
+def retry_delay(attempts):
+    """How long an event that failed ``attempts`` times waits before its next try"""
+    return timedelta(seconds=min(RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_RETRY_BACKOFF_SECONDS))
+
+
+def _message_key(message):
+    return json.dumps(message, sort_keys=True)
+
+
+def dispatch_batch(batch_size=100, max_attempts=None):
+    """
+    Send one batch of due outbox events.
+
+    Identical sends of the batch (same group and message) go out once.
+
+    Returns:
+        (dispatched, failed): number of events sent to every group, and of
+        events kept for a retry
+    """
+    max_attempts = max_attempts or settings.REALTIME_OUTBOX_MAX_ATTEMPTS
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(dispatched_at__isnull=True, available_at__lte=now, attempts__lt=max_attempts)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0, 0
+
+        sends = {}
+        for event in events:
+            for group in event.groups:
+                sends.setdefault((group, _message_key(event.message)), (group, event.message))
+        errors = {
+            (group, _message_key(message)): error
+            for group, message, error in send_group_messages(list(sends.values()))
+        }
+
+        failed = 0
+        for event in events:
+            key = _message_key(event.message)
+            missed = [group for group in event.groups if (group, key) in errors]
+            if not missed:
+                event.dispatched_at = now
+                continue
+            failed += 1
+            event.attempts += 1
+            event.groups = missed
+            event.last_error = str(errors[(missed[0], key)])[:1000]
+            event.available_at = now + retry_delay(event.attempts)
+            if event.attempts >= max_attempts:
+                logger.error(f"Giving up outbox event {event.pk} after {event.attempts} attempts: {event.last_error}")
+        OutboxEvent.objects.bulk_update(events, ['dispatched_at', 'attempts', 'groups', 'last_error', 'available_at'])
+    return len(events) - failed, failed
+
+
+def purge_dispatched(older_than):
+    """Delete events dispatched before ``older_than``; returns how many"""
+    deleted, _ = OutboxEvent.objects.filter(dispatched_at__lt=older_than).delete()
+    return deleted
+
+
+def outbox_stats(max_attempts=None):
+    """
+    Backlog of the outbox.
+
+    Returns:
+        dict with ``pending`` (events not yet sent, dead ones included),
+        ``dead`` (events given up after the last attempt) and ``lag_seconds``
+        (age of the oldest pending event that is still retried, 0 when none)
+    """
+    max_attempts = max_attempts or settings.REALTIME_OUTBOX_MAX_ATTEMPTS
+    backlog = OutboxEvent.objects.filter(dispatched_at__isnull=True).aggregate(
+        pending=Count('id'),
+        dead=Count('id', filter=Q(attempts__gte=max_attempts)),
+        oldest=Min('created_at', filter=Q(attempts__lt=max_attempts)),
+    )
+    oldest = backlog.pop('oldest')
+    backlog['lag_seconds'] = round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0
+    return backlog
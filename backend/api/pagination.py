@@ -0,0 +1,199 @@
+"""
+Pagination classes.
+
+``PageNumberCountPagination`` is the default for every list. It pages by
+number like DRF's ``PageNumberPagination``; the ``count`` parameter picks how
+the total is obtained:
+
+- ``?count=true`` (default): ``COUNT(*)`` on the list's queryset.
+- ``?count=false``: no count at all. One extra row is fetched to report
+  ``has_next``.
+- ``?count=cached``: the list's row count kept per scope by
+  ``api.versions.ResourceCounts`` (views with a ``version_resource``, plain
+  list action only); other lists fall back to ``COUNT(*)``.
+
+``FeedPagination`` (activities, inbox, memories, daily connections) keeps
+that behaviour, so existing clients see no change, and switches to keyset
+pagination when the request carries a ``cursor`` parameter (empty for the
+first page). In keyset mode a page is read with a single index range query
+starting right after the last row of the previous page: there is no
+``COUNT(*)`` and no ``OFFSET``, so the hundredth page costs the same as the
+first. Whether a next page exists is known by fetching one extra row. The
+keyset is a time column plus the primary key as tie-breaker, matching the
+``(..., -created_at, -id)`` / ``(..., -date, -id)`` indexes of the feed
+models.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.core.paginator import Paginator as DjangoPaginator
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .versions import ResourceCounts
+
+COUNT_EXACT, COUNT_NONE, COUNT_CACHED = 'true', 'false', 'cached'
+
+
+class PageNumberCountPagination(PageNumberPagination):
+    """Page number pagination with an exact, cached or skipped total count"""
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = request.query_params.get(self.count_query_param, COUNT_EXACT).lower()
+        self.known_count = None
+        if self.count_mode == COUNT_NONE:
+            return self.paginate_without_count(queryset, request)
+        if self.count_mode == COUNT_CACHED:
+            self.known_count = self.cached_count(queryset, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, object_list, per_page):
+        # Called by PageNumberPagination; hands a cached count to the paginator
+        # so Django's Paginator does not run COUNT(*) itself
+        paginator = DjangoPaginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+    def cached_count(self, queryset, view):
+        """Count from ResourceCounts, or None when the view's list is not tracked"""
+        resource = getattr(view, 'version_resource', None)
+        if resource is None or getattr(view, 'action', None) != 'list':
+            return None
+        return ResourceCounts.get(resource, view.get_version_scope(), queryset.count)
+
+    def paginate_without_count(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            self.page_number = int(page_number)
+        except ValueError:
+            self.page_number = 0
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1]) if self.page_number > 0 else []
+        if not rows and self.page_number != 1:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.count_mode != COUNT_NONE:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.count_mode != COUNT_NONE:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.count_mode != COUNT_NONE:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('has_next', self.has_next),
+            ('results', data)
+        ]))
+
+
+class FeedPagination(PageNumberCountPagination):
+    """
+    Page numbers by default, keyset pagination on ``keyset`` with ``?cursor=``.
+
+    Keyset responses contain ``next`` (None on the last page) and ``results``.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # (time field, primary key), both descending: newest first
+    keyset = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        queryset = queryset.order_by(*self.keyset)
+        if position := self.decode_cursor(request, queryset.model):
+            queryset = self.after(queryset, position)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.rows = rows[:page_size]
+        return self.rows
+
+    def after(self, queryset, position):
+        """
+        Rows strictly after ``position`` in keyset order.
+
+        Written as a range on the time column (which the index serves) minus
+        the rows of the boundary instant already returned.
+        """
+        (time_field, id_field), (value, pk) = self.keyset, position
+        descending = time_field.startswith('-')
+        time_name, id_name = time_field.lstrip('-'), id_field.lstrip('-')
+        return queryset.filter(
+            **{f"{time_name}__{'lte' if descending else 'gte'}": value}
+        ).exclude(
+            **{time_name: value, f"{id_name}__{'gte' if descending else 'lte'}": pk}
+        )
+
+    def encode_cursor(self, row):
+        time_name, id_name = (field.lstrip('-') for field in self.keyset)
+        position = json.dumps([getattr(row, time_name).isoformat(), getattr(row, id_name)])
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """Position (time value, pk) encoded in the cursor, None for the first page"""
+        if not (encoded := request.query_params.get(self.cursor_query_param)):
+            return None
+        time_name = self.keyset[0].lstrip('-')
+        try:
+            raw_value, pk = json.loads(urlsafe_b64decode(encoded.encode()))
+            return model._meta.get_field(time_name).to_python(raw_value), int(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.keyset_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.rows[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+class DateFeedPagination(FeedPagination):
+    """Feeds ordered by their ``date`` (memories, daily connections)"""
+    keyset = ('-date', '-id')
+
+
+class ActivityPagination(FeedPagination):
+    """The activity feed: 50 per page, page size set with ``?limit=``"""
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 100
@@ -0,0 +1 @@
+"""PostgreSQL database backend drawing its connections from a per-process pool"""
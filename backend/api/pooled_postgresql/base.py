@@ -0,0 +1,44 @@
+"""
+PostgreSQL backend whose connections come from a per-process pool.
+
+Django opens a connection per thread and, with ``CONN_MAX_AGE`` 0, closes
+it at the end of every request. Here "opening" checks a connection out of
+the pool of the database alias and "closing" returns it, so requests from
+any thread (Daphne's thread pool, gunicorn threads) reuse warm connections
+instead of paying a TCP and authentication handshake each. Pool sizing
+comes from ``OPTIONS['pool']`` (see ``pool.POOL_DEFAULTS``).
+"""
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+
+class DatabaseWrapper(PostgreSQLDatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None  # pool of the current connection
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        # One pool per database, not per alias: the test runner points an
+        # alias at the test database on the fly
+        name = (
+            f"{self.alias}:{conn_params.get('user', '')}@{conn_params.get('host', '')}:"
+            f"{conn_params.get('port', '')}/{conn_params.get('dbname', '')}"
+        )
+        self.pool = get_pool(name, self.settings_dict['OPTIONS'].get('pool', {}))
+        connection = self.pool.getconn(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # Set by the parent when it opens a connection, needed on reuse too
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
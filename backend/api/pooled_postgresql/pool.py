@@ -0,0 +1,238 @@
+"""
+Thread-safe pool of psycopg2 connections with saturation and wait metrics.
+
+psycopg2's own ``ThreadedConnectionPool`` raises as soon as it is exhausted
+and never checks or recycles connections, so the pool is implemented here:
+
+- Up to ``max_size`` connections are open; a checkout beyond that waits up to
+  ``timeout`` seconds for one to be returned, then raises ``PoolTimeout``.
+- Idle connections are reused most recently returned first. One idle for
+  more than ``check_after`` seconds is pinged before reuse, one idle for more
+  than ``max_idle`` seconds is closed (keeping at least ``min_size`` open),
+  and any older than ``max_lifetime`` seconds is replaced.
+- A connection returned inside a transaction is rolled back; a broken one is
+  closed.
+
+``pool_stats`` reports every pool of the process (one per database), served by
+GET /api/database/stats/.
+"""
+import logging
+import threading
+import time
+from collections import deque
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    'min_size': 2,
+    'max_size': 20,
+    'timeout': 10,  # seconds a checkout waits for a free connection
+    'check_after': 30,  # seconds idle before a connection is pinged on checkout
+    'max_idle': 5 * 60,
+    'max_lifetime': 60 * 60,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection was freed within the pool timeout"""
+
+
+class ConnectionPool:
+    def __init__(self, name, min_size=2, max_size=20, timeout=10, check_after=30, max_idle=300, max_lifetime=3600):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f"Invalid pool size for {name}: min_size={min_size}, max_size={max_size}")
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+
+        self._condition = threading.Condition()
+        self._idle = deque()  # (connection, returned at)
+        self._opened_at = {}  # connection -> opened at, for every open connection
+        self._reserved = 0  # connections being opened
+        self._waiting = 0
+        self._closed = False
+        self._counters = dict.fromkeys(
+            ('checkouts', 'waits', 'timeouts', 'opened', 'closed', 'failed_checks'), 0
+        )
+        self._wait_seconds = self._max_wait_seconds = 0.0
+
+    @property
+    def size(self):
+        return len(self._opened_at) + self._reserved
+
+    def getconn(self, connect):
+        """
+        Check out a connection, opening one with ``connect()`` while the pool
+        is below ``max_size``.
+
+        Raises:
+            PoolTimeout: every connection stayed checked out for ``timeout`` seconds
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._condition:
+                entry = None
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self.size < self.max_size:
+                    self._reserved += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No connection free in pool {self.name} after {self.timeout}s "
+                            f"({self.max_size} checked out)"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    self._condition.wait(remaining)
+                    self._waiting -= 1
+                    continue
+
+            # Connecting and pinging happen outside the lock
+            if entry is None:
+                connection = self._open(connect)
+            else:
+                connection, returned_at = entry
+                if not self._reusable(connection, returned_at):
+                    self._discard(connection)
+                    continue
+
+            with self._condition:
+                self._counters['checkouts'] += 1
+                if waited:
+                    wait = time.monotonic() - started
+                    self._counters['waits'] += 1
+                    self._wait_seconds += wait
+                    self._max_wait_seconds = max(self._max_wait_seconds, wait)
+            return connection
+
+    def putconn(self, connection):
+        """Return a connection checked out with ``getconn``"""
+        if not (self._closed or connection.closed or self._expired(connection)):
+            try:
+                if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                logger.warning(f"Closing connection of pool {self.name} that failed to roll back", exc_info=True)
+            else:
+                with self._condition:
+                    self._idle.append((connection, time.monotonic()))
+                    self._condition.notify()
+                return
+        self._discard(connection)
+
+    def close(self):
+        """Close the idle connections; checked out ones are closed when returned"""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+            self._closed = True
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._reserved -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._reserved -= 1
+            self._opened_at[connection] = time.monotonic()
+            self._counters['opened'] += 1
+        return connection
+
+    def _expired(self, connection):
+        return time.monotonic() - self._opened_at[connection] >= self.max_lifetime
+
+    def _reusable(self, connection, returned_at):
+        if connection.closed or self._expired(connection):
+            return False
+        idle = time.monotonic() - returned_at
+        if idle >= self.max_idle and self.size > self.min_size:
+            return False
+        if idle >= self.check_after:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                if not connection.autocommit:
+                    connection.rollback()
+            except psycopg2.Error:
+                with self._condition:
+                    self._counters['failed_checks'] += 1
+                logger.warning(f"Dropping broken connection of pool {self.name}")
+                return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._condition:
+            self._opened_at.pop(connection, None)
+            self._counters['closed'] += 1
+            self._condition.notify()
+
+    def stats(self):
+        """
+        Current state and counters since startup.
+
+        Returns:
+            dict with ``size`` (open connections), ``idle``, ``in_use``,
+            ``waiting`` (checkouts blocked right now), ``saturation`` (in_use /
+            max_size), the checkout, wait, timeout, opened, closed and
+            failed health check counters, and the total and longest wait in ms
+        """
+        with self._condition:
+            in_use = self.size - len(self._idle)
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': in_use,
+                'waiting': self._waiting,
+                'saturation': round(in_use / self.max_size, 3),
+                **self._counters,
+                'wait_ms_total': round(self._wait_seconds * 1000, 3),
+                'wait_ms_max': round(self._max_wait_seconds * 1000, 3),
+            }
+
+
+def get_pool(name, options):
+    """The pool named ``name``, created with the sizing ``options`` on first use"""
+    with _pools_lock:
+        if (pool := _pools.get(name)) is None:
+            pool = _pools[name] = ConnectionPool(name, **{**POOL_DEFAULTS, **options})
+        return pool
+
+
+def pool_stats():
+    """``ConnectionPool.stats`` of every pool of this process, by pool name"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.stats() for name, pool in pools.items()}
+
+
+def close_pools():
+    """Close and forget every pool (for tests and process shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
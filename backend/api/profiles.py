@@ -0,0 +1,68 @@
+"""
+Cached profile documents served by GET /api/users/me/.
+
+A user's full profile (account fields, profile, preferences and the
+employment, education, skill and project sections) is serialized once and
+cached per user. The signals in ``api/signals.py`` drop the cached document
+whenever any of its rows is saved or deleted, so the next read rebuilds it.
+"""
+import logging
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from .models import UserProfile, UserPreferences, Employment, Education, Skill, Project
+from .serializers import UserDetailSerializer
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DOCUMENT_CACHE_TIMEOUT = 60 * 60  # 1 hour
+# Many-relations of UserDetailSerializer, loaded with one query each
+PROFILE_SECTIONS = ('employment_history', 'education_history', 'skills', 'projects')
+# Models whose rows make up a profile document, besides User itself
+PROFILE_MODELS = (UserProfile, UserPreferences, Employment, Education, Skill, Project)
+
+
+def _cache_key(user_id):
+    return f"profile_document:{user_id}"
+
+
+def profile_queryset():
+    """Users with every relation of the profile document loaded in a fixed number of queries"""
+    return User.objects.select_related('profile', 'preferences').prefetch_related(*PROFILE_SECTIONS)
+
+
+def build_profile_document(user_id):
+    """Serialize a user's profile from the database (one query plus one per section)"""
+    return UserDetailSerializer(profile_queryset().get(pk=user_id)).data
+
+
+def get_profile_document(user):
+    """
+    Get a user's profile document, using the per-user cache.
+
+    Args:
+        user: Django User object or user id
+
+    Returns:
+        The ``UserDetailSerializer`` representation of the user
+    """
+    user_id = getattr(user, 'pk', user)
+    key = _cache_key(user_id)
+
+    if (document := cache.get(key)) is not None:
+        return document
+
+    document = build_profile_document(user_id)
+    # add, not set: an invalidation since the build must not be overwritten
+    cache.add(key, document, PROFILE_DOCUMENT_CACHE_TIMEOUT)
+    return document
+
+
+def invalidate_profile_document(*user_ids):
+    """Drop cached profile documents for the given users"""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        # Again once committed: a read racing the transaction may have cached the old rows
+        transaction.on_commit(lambda: cache.delete_many(keys))
+    logger.debug(f"Invalidated profile document for users {user_ids}")
@@ -0,0 +1,375 @@
+"""
+Transaction-aware, coalesced dispatch of WebSocket events.
+
+Events are never sent while the database transaction that produced them is
+still open: ``publish`` defers each event with ``transaction.on_commit``, so
+a rolled-back write never reaches a client. Committed events raised during an
+HTTP request are collected in a per-request ``BroadcastBuffer`` (installed by
+``BroadcastBufferMiddleware``) and flushed once when the response is ready.
+Identical events are de-duplicated; the groups are sent to concurrently,
+each group's events in order, in a single event-loop hop. Under ASGI the
+flush is awaited on the event loop itself (``asend_group_messages``).
+Events published outside a request (management commands, shell) are sent
+as soon as their transaction commits.
+
+With ``REALTIME_OUTBOX`` on, events are instead written to the outbox table
+in the transaction of the change and sent by the ``dispatch_outbox`` worker
+(see ``api/outbox.py``): requests no longer wait on the channel layer, and
+an event survives a process that dies before sending it.
+
+Every frame sent to a group (a "stream") is stamped with the stream name and
+a per-stream sequence number and kept in a bounded ring in the replay cache
+(``EventLog``), so a reconnecting socket can replay what it missed.
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+from .budgets import record_channel_sends
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_current_buffer = ContextVar('broadcast_buffer', default=None)
+
+
+def user_group(user_id):
+    """Channel group every socket of a user joins"""
+    return f"user_{user_id}"
+
+
+def couple_group(couple_id):
+    """Channel group shared by the sockets of both partners of a couple"""
+    return f"couple_{couple_id}"
+
+
+def encode_event(event_type, data):
+    """
+    Encode the WebSocket frame for an event.
+
+    Frames are encoded once, when the event is published, and travel through
+    the channel layer as text; consumers write them to every socket as-is.
+    """
+    return json.dumps({'event': event_type, 'data': data}, cls=JSONEncoder)
+
+
+def build_message(event_type, data):
+    """Channel layer message handled by ``SynkConsumer.send_encoded``"""
+    return {
+        "type": "send_encoded",
+        "text": encode_event(event_type, data)
+    }
+
+
+class EventLog:
+    """
+    Per-stream sequence numbers and replay ring stored in the replay cache
+    (``settings.REPLAY_CACHE``).
+
+    ``events:{stream}:seq`` holds the last sequence number of a stream and
+    ``events:{stream}:{seq % size}`` the frame sent with that number. A new
+    counter starts at the current time in microseconds rather than 0, so a
+    counter lost from the cache restarts far ahead of every number a client
+    has seen and the gap forces a resync instead of a wrong replay.
+
+    Frames expire ``WEBSOCKET_REPLAY_TTL`` seconds after they were sent.
+    Counters expire as long after the last socket on the stream stopped
+    refreshing them with ``touch``, so nothing is kept for streams nobody
+    listens to anymore.
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.REPLAY_CACHE]
+
+    @staticmethod
+    def _seq_key(stream):
+        return f"events:{stream}:seq"
+
+    @staticmethod
+    def _slot_key(stream, seq):
+        return f"events:{stream}:{seq % settings.WEBSOCKET_REPLAY_BUFFER_SIZE}"
+
+    @staticmethod
+    def _initial_seq():
+        return time.time_ns() // 1000
+
+    @classmethod
+    def append(cls, stream, text):
+        """Number a frame, store it in the ring and return the stamped frame"""
+        key, ring, ttl = cls._seq_key(stream), cls._cache(), settings.WEBSOCKET_REPLAY_TTL
+        ring.add(key, cls._initial_seq(), ttl)
+        try:
+            seq = ring.incr(key)
+        except ValueError:
+            seq = cls._initial_seq()
+            ring.set(key, seq, ttl)
+        # Splice the stream position into the already encoded frame
+        frame = f'{{"stream": "{stream}", "seq": {seq}, {text[1:]}'
+        ring.set(cls._slot_key(stream, seq), (seq, frame), ttl)
+        return frame
+
+    @classmethod
+    async def position(cls, stream):
+        """Sequence number of the last frame sent on a stream"""
+        key, ring = cls._seq_key(stream), cls._cache()
+        await ring.aadd(key, cls._initial_seq(), settings.WEBSOCKET_REPLAY_TTL)
+        return await ring.aget(key)
+
+    @classmethod
+    async def touch(cls, streams):
+        """Keep the counters of the streams a live socket listens to"""
+        for stream in streams:
+            await cls._cache().atouch(cls._seq_key(stream), settings.WEBSOCKET_REPLAY_TTL)
+
+    @classmethod
+    async def since(cls, stream, last_seq):
+        """
+        Frames sent on a stream after ``last_seq``, oldest first.
+
+        Returns None when they can no longer all be replayed (the gap is
+        larger than the ring, or the counter was reset) and the client must
+        resynchronize from the REST API instead.
+        """
+        current = await cls.position(stream)
+        if last_seq > current or current - last_seq > settings.WEBSOCKET_REPLAY_BUFFER_SIZE:
+            return None
+        missed = range(last_seq + 1, current + 1)
+        entries = await cls._cache().aget_many([cls._slot_key(stream, seq) for seq in missed])
+        frames = []
+        for seq in missed:
+            entry = entries.get(cls._slot_key(stream, seq))
+            if entry is None or entry[0] != seq:
+                return None
+            frames.append(entry[1])
+        return frames
+
+
+def _sequenced(group, message):
+    if 'text' not in message:
+        return message
+    return {**message, 'text': EventLog.append(group, message['text'])}
+
+
+def _sequence_all(sends):
+    return [(group, _sequenced(group, message)) for group, message in sends]
+
+
+def _failures(sends, errors):
+    return [(group, message, error) for (group, message), error in zip(sends, errors) if error is not None]
+
+
+class BroadcastBuffer:
+    """
+    Ordered, de-duplicated collection of pending group sends.
+
+    Two sends are identical when they target the same group with the same
+    message; only the first is kept. Messages are flat dicts of hashable
+    values (the frame is already encoded), so they are compared as-is.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, group, message):
+        key = (group, frozenset(message.items()))
+        self._pending.setdefault(key, (group, message))
+
+    def _take(self):
+        sends, self._pending = list(self._pending.values()), {}
+        return sends
+
+    def flush(self):
+        """Send everything collected so far and empty the buffer"""
+        if self._pending:
+            send_group_messages(self._take())
+
+    async def aflush(self):
+        """``flush`` for callers on the event loop"""
+        if self._pending:
+            await asend_group_messages(self._take())
+
+
+async def _send_concurrently(channel_layer, sends):
+    """
+    The error of each send, None for those that succeeded.
+
+    Different groups are sent to concurrently; the sends to one group go out
+    one after another, in order, so its frames reach the layer in sequence.
+    """
+    by_group = {}
+    for index, (group, _) in enumerate(sends):
+        by_group.setdefault(group, []).append(index)
+    errors = [None] * len(sends)
+
+    async def send_in_order(indexes):
+        for index in indexes:
+            group, message = sends[index]
+            try:
+                await channel_layer.group_send(group, message)
+            except Exception as e:
+                logger.error(f"Error broadcasting {message['type']} to {group}: {e}", exc_info=e)
+                errors[index] = e
+
+    await asyncio.gather(*(send_in_order(indexes) for indexes in by_group.values()))
+    return errors
+
+
+def send_group_messages(sends):
+    """
+    Send ``(group, message)`` pairs through the channel layer concurrently.
+
+    Failures are logged per send and never raised: a broken channel layer must
+    not fail the request that produced the event.
+
+    Returns:
+        ``(group, message, error)`` for every send that failed
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not sends:
+        return []
+    record_channel_sends(len(sends))
+    try:
+        errors = async_to_sync(_send_concurrently)(channel_layer, _sequence_all(sends))
+    except Exception as e:
+        logger.error(f"Error flushing {len(sends)} broadcast(s): {str(e)}", exc_info=True)
+        errors = [e] * len(sends)
+    return _failures(sends, errors)
+
+
+async def asend_group_messages(sends):
+    """
+    ``send_group_messages`` for callers already on the event loop.
+
+    The sends are awaited directly instead of through ``async_to_sync``. Only
+    the sequence numbering, which goes through the (synchronous) cache, runs
+    in a worker thread, once for the whole batch.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not sends:
+        return []
+    record_channel_sends(len(sends))
+    try:
+        sequenced = await sync_to_async(_sequence_all, thread_sensitive=False)(sends)
+        errors = await _send_concurrently(channel_layer, sequenced)
+    except Exception as e:
+        logger.error(f"Error flushing {len(sends)} broadcast(s): {str(e)}", exc_info=True)
+        errors = [e] * len(sends)
+    return _failures(sends, errors)
+
+
+def _dispatch(groups, message):
+    buffer = _current_buffer.get()
+    if buffer is None:
+        send_group_messages([(group, message) for group in groups])
+        return
+    for group in groups:
+        buffer.add(group, message)
+
+
+def publish(groups, event_type, data):
+    """
+    Queue a WebSocket event for one or more channel groups.
+
+    The event is released when the current transaction commits (immediately in
+    autocommit mode) and then sent with the rest of the request's events.
+
+    Args:
+        groups: Iterable of channel group names (see ``user_group``)
+        event_type: String event type (e.g., 'task:created')
+        data: Serialized data to send to the client
+    """
+    publish_message(groups, build_message(event_type, data))
+
+
+def publish_message(groups, message):
+    """
+    Queue a raw channel layer message (any consumer handler ``type``) for one
+    or more channel groups, with the same commit and batching rules as
+    ``publish``. Message values must be hashable and JSON serializable; pass
+    event payloads as a frame from ``encode_event``.
+    """
+    groups = tuple(dict.fromkeys(groups))
+    if not groups:
+        return
+    if settings.REALTIME_OUTBOX:
+        # Committed or rolled back together with the change it reports
+        OutboxEvent.objects.create(groups=list(groups), message=message)
+        return
+    transaction.on_commit(lambda: _dispatch(groups, message))
+
+
+def publish_shared(couple_id, user_id, event_type, data):
+    """
+    Queue an event about content shared by a couple.
+
+    Coupled users get a single send to the couple group, which reaches the
+    sockets of both partners; single users get it on their own group.
+
+    Args:
+        couple_id: Couple id, or None when the user is not coupled
+        user_id: Id of the user that triggered the event
+        event_type: String event type (e.g., 'task:created')
+        data: Serialized data to send to the client
+    """
+    group = couple_group(couple_id) if couple_id else user_group(user_id)
+    publish([group], event_type, data)
+
+
+@contextmanager
+def buffered_broadcasts():
+    """Collect the events dispatched inside the block and flush them once at its end"""
+    buffer = BroadcastBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+        buffer.flush()
+
+
+class BroadcastBufferMiddleware:
+    """
+    Collect the events published while handling a request and flush them
+    once, after the view has returned.
+
+    Sync and async capable. Under ASGI it is the innermost middleware and
+    runs on the event loop, so the flush awaits the channel layer there
+    instead of blocking the request's thread through ``async_to_sync``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with buffered_broadcasts():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The view runs in a thread with a copy of this context, which
+        # still holds the same buffer object
+        buffer = BroadcastBuffer()
+        token = _current_buffer.set(buffer)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_buffer.reset(token)
+            await buffer.aflush()
@@ -1,11 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import prefetch_related_objects
 from .models import (
     Task, Milestone, Activity, Suggestion, Collection, UserPreferences,
     Couple, CouplingCode, UserProfile, Employment, Education, Skill, Project,
-    DailyConnection, DailyConnectionAnswer, InboxItem, Memory
+    DailyConnection, DailyConnectionAnswer, InboxItem, InboxCounter, Memory, users_matching
 )
 from .security import InputValidator, sanitize_input
+from .couples import get_couple_context
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,36 @@ MAX_FIELD_LENGTHS = {
     'code': 50,
 }
 
+# Most creates, updates and deletes accepted by one POST /api/tasks/bulk/
+MAX_BULK_TASK_OPERATIONS = 200
+# Most sub-requests accepted by one POST /api/batch/
+MAX_BATCH_REQUESTS = 20
+
+
+class EagerLoadingMixin:
+    """
+    Declares the relations a serializer reads, so they are loaded in a fixed
+    number of queries instead of one query per row.
+    
+    ``setup_eager_loading`` applies them to a queryset (list views, sync,
+    bootstrap); ``load_related`` fills whatever is not loaded yet on
+    instances already in memory (signal-side serializations), without
+    refetching relations that are cached.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        # select_related() without fields would follow every foreign key
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        return queryset.prefetch_related(*cls.prefetch_related_fields)
+    
+    @classmethod
+    def load_related(cls, instances):
+        prefetch_related_objects(list(instances), *cls.select_related_fields, *cls.prefetch_related_fields)
+
 
 class BaseModelSerializer(serializers.ModelSerializer):
     """Base serializer with common validation and sanitization."""
@@ -114,7 +146,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Username can only contain letters, numbers, dot, hyphen, and underscore.')
         
         # Check if username already exists
-        if User.objects.filter(username__iexact=value).exists():
+        if users_matching('username', value).exists():
             raise serializers.ValidationError('A user with this username already exists.')
         
         return value
@@ -130,7 +162,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(str(e)) from e
         
         # Check if email already exists
-        if User.objects.filter(email__iexact=value).exists():
+        if users_matching('email', value).exists():
             raise serializers.ValidationError('A user with this email already exists.')
         
         return value
@@ -303,28 +335,78 @@ class TaskSerializer(serializers.ModelSerializer):
 
 
 
-class CoupleSerializer(serializers.ModelSerializer):
-    user1 = UserSerializer(read_only=True)
-    user2 = UserSerializer(read_only=True)
-    partner = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Couple
-        fields = ['id', 'user1', 'user2', 'partner', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
-
-    def get_partner(self, obj):
-        request = self.context.get('request')
-        if request and request.user and (partner := obj.get_partner(request.user)):
-            return UserSerializer(partner).data
-        return None
-
-
-class CouplingCodeSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = CouplingCode
-        fields = ['id', 'code', 'expires_at', 'created_at']
-        read_only_fields = ['id', 'code', 'expires_at', 'created_at']
+class TaskBulkSerializer(serializers.Serializer):
+    """
+    Body of POST /api/tasks/bulk/: lists of tasks to create, partial updates
+    (each with the ``id`` of the task) and ids of tasks to delete.
+    
+    Every entry is validated with TaskSerializer against the tasks visible to
+    the user (``context['tasks']``); errors are reported per entry, in the
+    order of the request. ``validated_data`` holds the validated create data,
+    ``(task, changes)`` pairs and the tasks to delete.
+    """
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    
+    def validate(self, attrs):
+        operations = len(attrs['create']) + len(attrs['update']) + len(attrs['delete'])
+        if not operations:
+            raise serializers.ValidationError('Nothing to do.')
+        if operations > MAX_BULK_TASK_OPERATIONS:
+            raise serializers.ValidationError(f'At most {MAX_BULK_TASK_OPERATIONS} operations per request.')
+        
+        # One query for every task referenced by an update or a delete
+        referenced = [item.get('id') for item in attrs['update']] + attrs['delete']
+        tasks = self.context['tasks'].in_bulk(
+            [int(pk) for pk in referenced if str(pk).isdigit()]
+        )
+        seen = set()
+        
+        def lookup(pk):
+            if not str(pk).isdigit() or int(pk) not in tasks:
+                raise serializers.ValidationError({'id': ['Task not found.']})
+            if int(pk) in seen:
+                raise serializers.ValidationError({'id': ['Task appears more than once in the request.']})
+            seen.add(int(pk))
+            return tasks[int(pk)]
+        
+        errors, creates, updates, deletes = {}, [], [], []
+        
+        create_errors = []
+        for item in attrs['create']:
+            serializer = TaskSerializer(data=item, context=self.context)
+            if serializer.is_valid():
+                creates.append(serializer.validated_data)
+            create_errors.append(serializer.errors)
+        
+        update_errors = []
+        for item in attrs['update']:
+            changes = {field: value for field, value in item.items() if field != 'id'}
+            try:
+                task = lookup(item.get('id'))
+            except serializers.ValidationError as e:
+                update_errors.append(e.detail)
+                continue
+            serializer = TaskSerializer(task, data=changes, partial=True, context=self.context)
+            if serializer.is_valid():
+                updates.append((task, serializer.validated_data))
+            update_errors.append(serializer.errors)
+        
+        delete_errors = []
+        for pk in attrs['delete']:
+            try:
+                deletes.append(lookup(pk))
+                delete_errors.append({})
+            except serializers.ValidationError as e:
+                delete_errors.append(e.detail)
+        
+        for key, entry_errors in (('create', create_errors), ('update', update_errors), ('delete', delete_errors)):
+            if any(entry_errors):
+                errors[key] = entry_errors
+        if errors:
+            raise serializers.ValidationError(errors)
+        return {'create': creates, 'update': updates, 'delete': deletes}
 
 
 class MilestoneSerializer(serializers.ModelSerializer):
@@ -475,9 +557,12 @@ class CoupleSerializer(serializers.ModelSerializer):
     def get_partner(self, obj):
         """Return partner info based on current user"""
         request = self.context.get('request')
-        if request and request.user and (partner := obj.get_partner(request.user)):
-            return UserSerializer(partner).data
-        return None
+        if not (request and request.user and request.user.is_authenticated):
+            return None
+        # Reuse the request's couple context (partner row already loaded) when it describes this couple
+        couple_context = get_couple_context(request)
+        partner = couple_context.partner if couple_context.couple_id == obj.pk else obj.get_partner(request.user)
+        return UserSerializer(partner).data if partner else None
 
 
 class CouplingCodeSerializer(serializers.ModelSerializer):
@@ -574,7 +659,9 @@ class UserDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username']
 
 
-class DailyConnectionAnswerSerializer(serializers.ModelSerializer):
+class DailyConnectionAnswerSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+    
     user_id = serializers.IntegerField(source='user.id', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
     
@@ -584,7 +671,9 @@ class DailyConnectionAnswerSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'connection', 'answered_at', 'updated_at']
 
 
-class DailyConnectionSerializer(serializers.ModelSerializer):
+class DailyConnectionSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    prefetch_related_fields = ('answers__user',)
+    
     answers = DailyConnectionAnswerSerializer(many=True, read_only=True)
     
     class Meta:
@@ -593,7 +682,9 @@ class DailyConnectionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class InboxItemSerializer(serializers.ModelSerializer):
+class InboxItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('sender', 'connection_answer__user')
+    
     sender_name = serializers.CharField(source='sender.username', read_only=True)
     connection_answer = DailyConnectionAnswerSerializer(read_only=True)
     
@@ -604,7 +695,16 @@ class InboxItemSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at', 'sender_name', 'connection_answer']
 
-class MemorySerializer(serializers.ModelSerializer):
+
+class InboxCounterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InboxCounter
+        fields = ['unread', 'total']
+        read_only_fields = fields
+
+class MemorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('milestone',)
+    
     milestone_name = serializers.CharField(source='milestone.name', read_only=True)
     
     class Meta:
@@ -618,3 +718,27 @@ class MemorySerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class BatchSubRequestSerializer(serializers.Serializer):
+    """One sub-request of POST /api/batch/"""
+    METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+    
+    method = serializers.CharField()
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False, default=None)
+    
+    def validate_method(self, value):
+        value = value.upper()
+        if value not in self.METHODS:
+            raise serializers.ValidationError(f'Method must be one of: {", ".join(self.METHODS)}')
+        return value
+    
+    def validate_path(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError('Path must start with /api/.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Body of POST /api/batch/: ordered sub-requests and whether they are all-or-nothing"""
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_REQUESTS)
+    atomic = serializers.BooleanField(default=False)
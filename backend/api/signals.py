@@ -3,13 +3,23 @@ Django signals for API app
 """
 import logging
 from contextlib import suppress
-from django.db.models.signals import post_save, post_delete, pre_delete
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, Couple, InboxItem
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .serializers import InboxItemSerializer
+from django.utils import timezone
+from .models import (
+    UserProfile, Couple, InboxItem, InboxCounter, Tombstone, Task, Milestone, Activity, Suggestion, Collection,
+    Memory, DailyConnection, DailyConnectionAnswer, COUPLE_SHARED_MODELS
+)
+from .serializers import InboxCounterSerializer, InboxItemSerializer
+from .cascades import deleted_rows
+from .couples import get_couple_context_for_user, invalidate_couple_context
+from .profiles import PROFILE_MODELS, invalidate_profile_document
+from .realtime import build_message, publish, publish_message, user_group
+from .sync import COUPLE_TOMBSTONE, SYNCED_MODELS, tombstone_label
+from .versions import bump_versions, content_scopes, couple_scope, track_count, user_scope
 
 logger = logging.getLogger(__name__)
 
@@ -19,68 +29,242 @@ def create_user_profile(sender, instance, created, **kwargs):
     """
     Create a UserProfile whenever a new User is created.
     This ensures every user has a UUID and normalized email stored.
+
+    A failure is logged and does not undo the user: the profile is left for
+    the ``reconcile_profiles`` command to create.
     """
-    if created:
-        try:
-            # Use get_or_create in case the profile was already created
-            profile, created_profile = UserProfile.objects.get_or_create(
-                user=instance,
-                defaults={
-                    'email_normalized': instance.email.lower()
-                }
-            )
-            if created_profile:
-                logger.info(f'Created UserProfile for user {instance.username}: {profile.id_uuid}')
-            else:
-                logger.debug(f'UserProfile already exists for user {instance.username}: {profile.id_uuid}')
-        except Exception as e:
-            # Log error but don't break user creation
-            logger.error(f'Failed to create UserProfile for user {instance.username}: {e}')
-            import traceback
-            traceback.print_exc()
+    if not created:
+        return
+    try:
+        # A savepoint, so a failed insert leaves the caller's transaction usable
+        with transaction.atomic():
+            profile = UserProfile.objects.create(user=instance, email_normalized=instance.email.lower())
+        logger.info(f'Created UserProfile for user {instance.username}: {profile.id_uuid}')
+    except Exception as e:
+        logger.error(f'Failed to create UserProfile for user {instance.username}: {e}')
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the profile's email_normalized in sync with the user's email.
+
+    The profile is written only when the email actually changed: saves that
+    leave ``email`` out of ``update_fields`` (e.g. ``last_login``) are skipped,
+    and otherwise one conditional UPDATE touches the row only on a mismatch.
+    """
+    if created or (update_fields is not None and 'email' not in update_fields):
+        return
+    email = instance.email.lower()
+    if User.profile.is_cached(instance):
+        # The loaded profile tells without a query (None: the user has none)
+        if (profile := getattr(instance, 'profile', None)) is None or profile.email_normalized == email:
+            return
+        profile.email_normalized = email
+    UserProfile.objects.filter(user=instance).exclude(email_normalized=email).update(
+        email_normalized=email, updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Couple)
+def invalidate_couple_context_on_save(sender, instance, **kwargs):
+    """Drop both partners' cached couple context when a couple is created or changed"""
+    invalidate_couple_context(instance.user1_id, instance.user2_id)
+
+
+@receiver(pre_delete, sender=Couple)
+def invalidate_couple_context_on_delete(sender, instance, **kwargs):
+    """Drop both partners' cached couple context when a couple is dissolved"""
+    invalidate_couple_context(instance.user1_id, instance.user2_id)
+
+
+def invalidate_profile_document_on_change(sender, instance, **kwargs):
+    """Drop the owner's cached profile document when a row of it is saved or deleted"""
+    user_id = instance.pk if sender is User else instance.user_id
+    if 'created' not in kwargs and (rows := deleted_rows()) is not None:
+        rows.profile_user_ids.add(user_id)
+        return
+    invalidate_profile_document(user_id)
+
+
+for profile_model in (User, *PROFILE_MODELS):
+    post_save.connect(
+        invalidate_profile_document_on_change,
+        sender=profile_model,
+        dispatch_uid=f'profile_document_{profile_model.__name__}'
+    )
+    post_delete.connect(
+        invalidate_profile_document_on_change,
+        sender=profile_model,
+        dispatch_uid=f'profile_document_delete_{profile_model.__name__}'
+    )
+
+
+@receiver(post_save, sender=Couple)
+def link_shared_content_on_couple(sender, instance, created, **kwargs):
+    """Stamp a new couple on both partners' existing tasks, milestones, memories, etc."""
+    if created:
+        instance.link_shared_content()
+
+
+def assign_couple_to_shared_content(sender, instance, **kwargs):
+    """
+    Fill the denormalized couple on new shared content rows.
+    Views pass it explicitly; this covers rows created through other paths.
+    """
+    if instance._state.adding and instance.couple_id is None:
+        instance.couple_id = get_couple_context_for_user(instance.user_id).couple_id
+
+
+for shared_model in COUPLE_SHARED_MODELS:
+    pre_save.connect(
+        assign_couple_to_shared_content,
+        sender=shared_model,
+        dispatch_uid=f'assign_couple_{shared_model.__name__}'
+    )
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """
+    Record a deleted row for the delta sync endpoint.
+    Covers view deletes as well as cascades (e.g. an account deletion),
+    whose tombstones are written together (see ``api/cascades.py``).
+    """
+    if sender is InboxItem:
+        owner_id, couple_id = instance.recipient_id, None
+    else:
+        owner_id, couple_id = instance.user_id, instance.couple_id
+    tombstone = Tombstone(
+        model=tombstone_label(sender),
+        object_id=instance.pk,
+        user_id=owner_id,
+        couple_id=couple_id
+    )
+    if (rows := deleted_rows()) is not None:
+        rows.tombstones.append(tombstone)
+    else:
+        tombstone.save()
+
+
+for synced_model in SYNCED_MODELS:
+    post_delete.connect(
+        record_tombstone,
+        sender=synced_model,
+        dispatch_uid=f'tombstone_{synced_model.__name__}'
+    )
+
+
+@receiver(post_delete, sender=Couple)
+def record_couple_tombstones(sender, instance, **kwargs):
+    """
+    Record a dissolved couple for both partners: the rows of each partner
+    leave the other's scope without being deleted, so their next delta sync
+    is a full one.
+    """
+    tombstones = [
+        Tombstone(model=COUPLE_TOMBSTONE, object_id=instance.pk, user_id=user_id)
+        for user_id in (instance.user1_id, instance.user2_id)
+    ]
+    if (rows := deleted_rows()) is not None:
+        rows.tombstones.extend(tombstones)
+    else:
+        Tombstone.objects.bulk_create(tombstones)
+
+
+# List endpoints whose responses show rows of each shared content model; the
+# first one lists the model itself (memories show the name of their milestone)
+CONTENT_LISTS = {
+    Task: ('tasks',),
+    Milestone: ('milestones', 'memories'),
+    Activity: ('activities',),
+    Suggestion: ('suggestions',),
+    Collection: ('collections',),
+    Memory: ('memories',),
+}
+
+
+def _count_delta(kwargs):
+    """+1 for a created row, -1 for a deleted one, 0 for an update"""
+    if 'created' not in kwargs:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+def bump_content_versions(sender, instance, **kwargs):
+    """Invalidate the list ETags (and move the counts) of a saved or deleted shared content row"""
+    if (rows := deleted_rows()) is not None and 'created' not in kwargs:
+        rows.bump(CONTENT_LISTS[sender], content_scopes(instance), delta=-1)
+        return
+    bump_versions(CONTENT_LISTS[sender], content_scopes(instance))
+    if delta := _count_delta(kwargs):
+        track_count(CONTENT_LISTS[sender][0], content_scopes(instance), delta)
+
+
+for content_model in CONTENT_LISTS:
+    post_save.connect(bump_content_versions, sender=content_model, dispatch_uid=f'versions_{content_model.__name__}')
+    post_delete.connect(bump_content_versions, sender=content_model, dispatch_uid=f'versions_delete_{content_model.__name__}')
+
+
+@receiver([post_save, post_delete], sender=InboxItem)
+def bump_inbox_version(sender, instance, **kwargs):
+    """Invalidate the recipient's inbox list ETag and move its count"""
+    if (rows := deleted_rows()) is not None and 'created' not in kwargs:
+        rows.bump(['inbox'], [user_scope(instance.recipient_id)], delta=-1)
+        return
+    bump_versions(['inbox'], [user_scope(instance.recipient_id)])
+    if delta := _count_delta(kwargs):
+        track_count('inbox', [user_scope(instance.recipient_id)], delta)
+
+
+@receiver([post_save, post_delete], sender=DailyConnection)
+def bump_daily_connection_version(sender, instance, **kwargs):
+    """Invalidate the couple's daily connection list ETag and move its count"""
+    if (rows := deleted_rows()) is not None and 'created' not in kwargs:
+        rows.bump(['daily-connections'], [couple_scope(instance.couple_id)], delta=-1)
+        return
+    bump_versions(['daily-connections'], [couple_scope(instance.couple_id)])
+    if delta := _count_delta(kwargs):
+        track_count('daily-connections', [couple_scope(instance.couple_id)], delta)
+
+
+@receiver([post_save, post_delete], sender=DailyConnectionAnswer)
+def bump_daily_connection_answer_versions(sender, instance, **kwargs):
     """
-    Save the user's profile whenever the user is saved.
-    This keeps the profile's email_normalized in sync with the user's email.
+    Invalidate the daily connection list of the couple and, when an answer is
+    edited, the inboxes showing it
     """
-    with suppress(Exception):
-        if hasattr(instance, 'profile'):
-            instance.profile.save()
+    if (rows := deleted_rows()) is not None and 'created' not in kwargs:
+        rows.answer_connection_ids.add(instance.connection_id)
+        return
+    # The connection is already gone when the answer is removed with it
+    with suppress(DailyConnection.DoesNotExist):
+        bump_versions(['daily-connections'], [couple_scope(instance.connection.couple_id)])
+    if kwargs.get('created') is False:
+        recipients = instance.inbox_items.values_list('recipient_id', flat=True)
+        bump_versions(['inbox'], [user_scope(recipient_id) for recipient_id in recipients])
 
 
 @receiver(post_save, sender=Couple)
 def notify_partners_on_couple(sender, instance, created, **kwargs):
     """
     When a couple relationship is created, notify both partners in real-time.
-    This sends the couple:coupled event when users connect via coupling code.
+    This sends the couple:coupled event when users connect via coupling code,
+    and moves their open sockets into the couple's channel group.
     """
     if created:
-        try:
-            channel_layer = get_channel_layer()
-            
-            # Notify both users
-            for user in [instance.user1, instance.user2]:
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{user.id}",
-                    {
-                        "type": "send_message",
-                        "event": "couple:coupled",
-                        "data": {}
-                    }
-                )
-            logger.info(f"Notified users {instance.user1.id} and {instance.user2.id} of coupling")
-        except Exception as e:
-            logger.error(f"Error notifying partners on couple creation: {str(e)}", exc_info=True)
+        publish_message(
+            [user_group(instance.user1_id), user_group(instance.user2_id)],
+            {**build_message("couple:coupled", {}), "type": "couple.join", "couple_id": instance.pk}
+        )
+        logger.info(f"Notified users {instance.user1_id} and {instance.user2_id} of coupling")
 
 
 @receiver(pre_delete, sender=Couple)
 def notify_partner_on_uncouple(sender, instance, **kwargs):
     """
     When a couple relationship is deleted (either directly or via cascade when a user is deleted),
-    notify the remaining partner in real-time.
+    notify the remaining partner in real-time. Open sockets of both users leave
+    the couple's channel group.
     """
     # Determine which user is being deleted and which remains
     # Both users might still exist (direct uncouple), or one might be deleted (cascade)
@@ -99,19 +283,16 @@ def notify_partner_on_uncouple(sender, instance, **kwargs):
             partner = user2
     
     # Send real-time notification to the remaining partner
+    leave = {"type": "couple.leave", "couple_id": instance.pk}
     if partner:
-        with suppress(Exception):
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{partner.id}",
-                {
-                    "type": "send_message",
-                    "event": "couple:uncoupled",
-                    "data": {
-                        "message": "Your partner has deleted their account. You have been uncoupled."
-                    }
-                }
-            )
+        publish_message([user_group(partner.id)], {
+            **build_message("couple:uncoupled", {
+                "message": "Your partner has deleted their account. You have been uncoupled."
+            }),
+            **leave
+        })
+    other_ids = {instance.user1_id, instance.user2_id} - {getattr(partner, 'id', None)}
+    publish_message([user_group(user_id) for user_id in other_ids], leave)
 
 
 @receiver(post_save, sender=InboxItem)
@@ -121,23 +302,14 @@ def broadcast_inbox_item_update(sender, instance, created, **kwargs):
     This ensures inbox updates are sent via WebSocket when items are created or modified.
     """
     try:
-        channel_layer = get_channel_layer()
+        InboxItemSerializer.load_related([instance])
         serialized_data = InboxItemSerializer(instance).data
         
         event_type = "inbox:created" if created else "inbox:updated"
-        group_name = f"user_{instance.recipient.id}"
+        group_name = user_group(instance.recipient_id)
         
         logger.info(f"Broadcasting {event_type} for inbox item {instance.id} to group {group_name}")
-        
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "send_message",
-                "event": event_type,
-                "data": serialized_data
-            }
-        )
-        logger.info(f"Successfully broadcast {event_type}")
+        publish([group_name], event_type, serialized_data)
     except Exception as e:
         logger.error(f"Error broadcasting inbox item: {str(e)}", exc_info=True)
 
@@ -147,15 +319,76 @@ def broadcast_inbox_item_deletion(sender, instance, **kwargs):
     """
     Broadcast inbox item deletion to the recipient in real-time.
     """
-    with suppress(Exception):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{instance.recipient.id}",
-            {
-                "type": "send_message",
-                "event": "inbox:deleted",
-                "data": {"id": instance.id}
-            }
-        )
+    if (rows := deleted_rows()) is not None:
+        rows.inbox_ids[instance.recipient_id].append(instance.id)
+        return
+    publish([user_group(instance.recipient_id)], "inbox:deleted", {"id": instance.id})
+
 
+def publish_inbox_counts(counter):
+    """Push a user's inbox counts to their sockets"""
+    publish([user_group(counter.user_id)], "inbox:counts", InboxCounterSerializer(counter).data)
 
+
+@receiver(post_save, sender=InboxItem)
+def count_saved_inbox_item(sender, instance, created, **kwargs):
+    """Count a new inbox item, or one marked read or unread, in its recipient's counter"""
+    was_read = getattr(instance, '_loaded_is_read', None)
+    instance._loaded_is_read = instance.is_read
+    if created:
+        counter = InboxCounter.apply(instance.recipient_id, unread=int(not instance.is_read), total=1)
+    elif was_read is None:
+        # Saved without having been loaded: the previous state is unknown
+        counter = InboxCounter.rebuild(instance.recipient_id)
+    elif getattr(instance, '_read_flipped', False):
+        # This save changed the row's read state (see InboxItem.save)
+        counter = InboxCounter.apply(instance.recipient_id, unread=1 if was_read else -1)
+    else:
+        return
+    publish_inbox_counts(counter)
+
+
+_pending_recount = ContextVar('pending_inbox_recount', default=None)
+
+
+class InboxRecount:
+    """
+    Recipients whose inbox items were deleted in the current transaction,
+    recounted and pushed once each when it commits.
+    """
+    
+    def __init__(self):
+        self.user_ids = set()
+        self.ran = False
+    
+    def __call__(self):
+        if self.ran:
+            return
+        self.ran = True
+        for user_id in sorted(self.user_ids):
+            # Users deleted with their inbox have no counter left
+            if (counter := InboxCounter.recount(user_id)) is not None:
+                publish_inbox_counts(counter)
+
+
+def recount_inbox_on_commit(user_id):
+    """Add a user to the pending ``InboxRecount`` and have it run when the transaction commits"""
+    recount = _pending_recount.get()
+    if recount is None or recount.ran:
+        recount = InboxRecount()
+        _pending_recount.set(recount)
+    recount.user_ids.add(user_id)
+    # Registered again with every delete: the first call does the work and
+    # the rest return. A recount left pending by a rolled back transaction
+    # joins the next one, where recounting its users again is harmless.
+    transaction.on_commit(recount)
+
+
+@receiver(post_delete, sender=InboxItem)
+def count_deleted_inbox_item(sender, instance, **kwargs):
+    """
+    Recount the recipient's inbox once the delete commits, from the database
+    rather than the deleted row's possibly outdated read state; a cascade
+    deleting many items sends a single ``inbox:counts`` per recipient.
+    """
+    recount_inbox_on_commit(instance.recipient_id)
@@ -0,0 +1,138 @@
+"""
+Delta sync: the shared content and inbox rows changed since a cursor.
+
+Each synced model is read with a single range query on ``updated_at`` over
+the couple (or single user) scope, backed by the ``(couple, updated_at)`` and
+``(user, updated_at)`` indexes. Deleted rows are reported from ``Tombstone``
+rows, written by the ``post_delete`` signals in ``api/signals.py``.
+
+The cursor is the server time at which the previous sync started. Rows are
+read from ``CURSOR_OVERLAP`` before it, so a row saved by a transaction that
+was still open when the previous sync ran is not missed; clients apply
+changes as idempotent upserts, so the overlap only costs a few repeated rows.
+
+Tombstones are kept for ``SYNC_TOMBSTONE_RETENTION_DAYS`` (pruned by the
+``prune_tombstones`` command). A cursor older than that, or one from before
+the user's couple was dissolved (recorded as a ``couple`` tombstone per
+partner, since the partner's rows leave the user's scope without being
+deleted), gets a full sync instead: ``full_sync`` is true and clients
+replace their rows with the response rather than merging it.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.serializers import ValidationError
+from .models import Task, Milestone, Activity, Suggestion, Collection, Memory, InboxItem, Couple, Tombstone
+from .serializers import (
+    TaskSerializer, MilestoneSerializer, ActivitySerializer, SuggestionSerializer,
+    CollectionSerializer, MemorySerializer, InboxItemSerializer
+)
+
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+# Response key -> (model, serializer, related rows the serializer reads)
+SHARED_RESOURCES = {
+    'tasks': (Task, TaskSerializer, ()),
+    'milestones': (Milestone, MilestoneSerializer, ()),
+    'activities': (Activity, ActivitySerializer, ()),
+    'suggestions': (Suggestion, SuggestionSerializer, ()),
+    'collections': (Collection, CollectionSerializer, ()),
+    'memories': (Memory, MemorySerializer, MemorySerializer.select_related_fields),
+}
+INBOX_RESOURCE = 'inbox'
+SYNCED_MODELS = tuple(model for model, _, _ in SHARED_RESOURCES.values()) + (InboxItem,)
+
+
+def tombstone_label(model):
+    """Value stored in ``Tombstone.model`` for rows of a synced model"""
+    return model._meta.model_name
+
+
+# Written for each partner when a couple is dissolved
+COUPLE_TOMBSTONE = tombstone_label(Couple)
+
+
+def tombstone_retention():
+    """How long tombstones are kept, and so the oldest cursor a delta sync accepts"""
+    return timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def prune_tombstones(now=None):
+    """Delete tombstones older than the retention period; returns how many"""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=(now or timezone.now()) - tombstone_retention()).delete()
+    return deleted
+
+
+def parse_cursor(value):
+    """
+    Parse the ``since`` query parameter.
+
+    Returns None when no cursor was given (the first sync returns everything);
+    raises ValidationError for a malformed one.
+    """
+    if not value:
+        return None
+    cursor = parse_datetime(value)
+    if cursor is None:
+        raise ValidationError({'since': 'Invalid cursor. Use the cursor returned by the previous sync.'})
+    if timezone.is_naive(cursor):
+        cursor = timezone.make_aware(cursor, dt_timezone.utc)
+    return cursor
+
+
+def changes_since(request, context, since):
+    """
+    Rows visible to the requesting user that changed after ``since``.
+
+    Args:
+        request: Request of the user syncing (passed to the serializers)
+        context: The user's CoupleContext
+        since: Cursor from ``parse_cursor``, or None for a full sync
+
+    Returns:
+        Dict with the next ``cursor``, the serialized ``changes`` and the ids
+        of ``deleted`` rows, each keyed by resource name, and ``full_sync``:
+        whether every visible row was returned (no cursor, one older than
+        the tombstone retention, or the couple was dissolved since)
+    """
+    cursor = timezone.now()
+    lower_bound = since - CURSOR_OVERLAP if since else None
+    if lower_bound and lower_bound < cursor - tombstone_retention():
+        # Rows deleted since may have lost their tombstones
+        lower_bound = None
+    serializer_context = {'request': request}
+
+    deleted = {name: [] for name in (*SHARED_RESOURCES, INBOX_RESOURCE)}
+    if lower_bound:
+        shared_names = {tombstone_label(model): name for name, (model, _, _) in SHARED_RESOURCES.items()}
+        resource_names = {**shared_names, tombstone_label(InboxItem): INBOX_RESOURCE}
+        recent = Tombstone.objects.filter(deleted_at__gte=lower_bound)
+        tombstones = [
+            row
+            for queryset in (
+                recent.filter(model__in=list(shared_names), **context.content_filter),
+                recent.filter(model__in=[tombstone_label(InboxItem), COUPLE_TOMBSTONE], user_id=context.user_id),
+            )
+            for row in queryset.order_by('deleted_at').values_list('model', 'object_id')
+        ]
+        if any(label == COUPLE_TOMBSTONE for label, _ in tombstones):
+            # The partner's rows left this user's scope without being deleted
+            lower_bound = None
+        else:
+            for label, object_id in tombstones:
+                deleted[resource_names[label]].append(object_id)
+
+    def changed(queryset):
+        if lower_bound:
+            queryset = queryset.filter(updated_at__gte=lower_bound)
+        return queryset.order_by('updated_at')
+
+    changes = {}
+    for name, (model, serializer_class, related) in SHARED_RESOURCES.items():
+        queryset = changed(model.objects.for_couple(context).select_related(*related))
+        changes[name] = serializer_class(queryset, many=True, context=serializer_context).data
+    inbox = changed(InboxItemSerializer.setup_eager_loading(InboxItem.objects.filter(recipient_id=context.user_id)))
+    changes[INBOX_RESOURCE] = InboxItemSerializer(inbox, many=True, context=serializer_context).data
+
+    return {'cursor': cursor.isoformat(), 'full_sync': lower_bound is None, 'changes': changes, 'deleted': deleted}
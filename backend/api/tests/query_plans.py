@@ -0,0 +1,107 @@
+"""
+EXPLAIN helpers for the query plan regression suite.
+
+Statements captured while exercising the API are re-run through the
+database's planner. A statement is reported when it reads one of the
+``LARGE_TABLES`` with a sequential (full) scan, or when it needs a sort
+that an index should have provided:
+
+- SQLite: ``EXPLAIN QUERY PLAN``; ``SCAN <table>`` on a large table and
+  ``USE TEMP B-TREE FOR ORDER BY`` on paginated (LIMIT) queries.
+- PostgreSQL: ``EXPLAIN (ANALYZE, FORMAT JSON)`` for SELECTs and plain
+  ``EXPLAIN`` for writes, with ``enable_seqscan`` off so a Seq Scan means no
+  usable index exists; Seq Scans on large tables, sorts that spill to disk
+  and explicit sorts under a LIMIT are reported.
+"""
+import json
+import re
+from django.db import connection
+
+# Tables that grow with usage; every access to them must be index-backed
+LARGE_TABLES = {
+    'auth_user',
+    'api_userprofile',
+    'api_couple',
+    'api_task',
+    'api_milestone',
+    'api_activity',
+    'api_suggestion',
+    'api_collection',
+    'api_memory',
+    'api_inboxitem',
+    'api_dailyconnection',
+    'api_dailyconnectionanswer',
+}
+
+EXPLAINABLE_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+LIMIT_CLAUSE = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+
+def is_explainable(sql):
+    """Return True for statements the planner can explain"""
+    return sql.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS)
+
+
+def plan_violations(sql):
+    """
+    Explain a statement and describe every plan regression found.
+
+    Args:
+        sql: Executable SQL statement (parameters already interpolated)
+
+    Returns:
+        List of human-readable violation strings (empty when the plan is fine)
+    """
+    if connection.vendor == 'postgresql':
+        return _postgresql_violations(sql)
+    if connection.vendor == 'sqlite':
+        return _sqlite_violations(sql)
+    return []
+
+
+def _sqlite_violations(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+
+    violations = []
+    for detail in details:
+        if (match := SQLITE_SCAN.match(detail)) and match.group(1) in LARGE_TABLES:
+            violations.append(f'full scan: {detail}')
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY') and LIMIT_CLAUSE.search(sql):
+            violations.append(f'sort not served by an index: {detail}')
+    return violations
+
+
+def _postgresql_violations(sql):
+    analyze = 'ANALYZE, ' if sql.lstrip().upper().startswith('SELECT') else ''
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            cursor.execute(f'EXPLAIN ({analyze}FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+        finally:
+            cursor.execute('RESET enable_seqscan')
+
+    violations = []
+    _walk_postgresql_plan(plan[0]['Plan'], None, violations)
+    return violations
+
+
+def _walk_postgresql_plan(node, parent, violations):
+    node_type = node.get('Node Type')
+    relation = node.get('Relation Name')
+
+    if node_type == 'Seq Scan' and relation in LARGE_TABLES:
+        violations.append(f'sequential scan on {relation}')
+    if node_type in ('Sort', 'Incremental Sort'):
+        if node.get('Sort Space Type') == 'Disk':
+            violations.append(f"temp-file sort ({node.get('Sort Method')}) on {node.get('Sort Key')}")
+        elif parent is not None and parent.get('Node Type') == 'Limit':
+            violations.append(f"sort not served by an index on {node.get('Sort Key')}")
+
+    for child in node.get('Plans', []):
+        _walk_postgresql_plan(child, node, violations)
@@ -3,12 +3,17 @@ Tests for API pagination handling
 Tests that the API correctly handles Django REST Framework paginated responses
 """
 import pytest
+from datetime import date
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from api.models import Task, Collection
+from api.models import Task, Collection, Activity, Memory, InboxItem
+from api.pagination import DateFeedPagination, PageNumberCountPagination
 
 User = get_user_model()
 
@@ -131,3 +136,149 @@ class TestAPIPaginationHandling:
         assert 'name' in item
         assert 'icon' in item
 
+
+
+@pytest.mark.django_db
+class TestFeedKeysetPagination:
+    """Test opt-in cursor pagination of the time-ordered feeds"""
+    
+    def setup_method(self):
+        """Setup test client and user"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='feeduser',
+            email='feed@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+    
+    def create_activities(self, count):
+        """Create activities sharing one created_at, so only the id breaks ties"""
+        Activity.objects.bulk_create(
+            Activity(user=self.user, activity_user='Me', action='added', item=f'Item {i}', timestamp='now', avatar='')
+            for i in range(count)
+        )
+        Activity.objects.update(created_at=timezone.now())
+    
+    def walk(self, url):
+        """Follow next links from url and return every page"""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+    
+    def test_cursor_pages_cover_feed_once(self):
+        """Test following next links visits every row once, newest first"""
+        self.create_activities(7)
+        pages = self.walk('/api/activities/?cursor=&limit=3')
+        assert [len(page['results']) for page in pages] == [3, 3, 1]
+        ids = [int(item['id']) for page in pages for item in page['results']]
+        assert ids == sorted(Activity.objects.values_list('id', flat=True), reverse=True)
+        assert 'count' not in pages[0]
+    
+    def test_deep_page_runs_no_count_or_offset(self):
+        """Test a later page is one range query without COUNT or OFFSET"""
+        self.create_activities(5)
+        next_url = self.client.get('/api/activities/?cursor=&limit=2').data['next']
+        with CaptureQueriesContext(connection) as captured:
+            assert len(self.client.get(next_url).data['results']) == 2
+        activity_sql = [q['sql'] for q in captured.captured_queries if 'api_activity' in q['sql']]
+        assert len(activity_sql) == 1
+        assert 'COUNT' not in activity_sql[0] and 'OFFSET' not in activity_sql[0]
+    
+    def test_limit_sets_page_size(self):
+        """Test ?limit= is the activity page size in page number mode too"""
+        self.create_activities(4)
+        response = self.client.get('/api/activities/?limit=3')
+        assert response.data['count'] == 4
+        assert len(response.data['results']) == 3
+        assert response.data['next'] is not None
+    
+    def test_date_ordered_feed(self, monkeypatch):
+        """Test memories page on (date, id)"""
+        monkeypatch.setattr(DateFeedPagination, 'page_size', 2)
+        for day in (1, 2, 3):
+            Memory.objects.create(user=self.user, title=f'Day {day}', date=date(2024, 1, day))
+        pages = self.walk('/api/memories/?cursor=')
+        assert len(pages) == 2
+        assert [item['title'] for page in pages for item in page['results']] == ['Day 3', 'Day 2', 'Day 1']
+    
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is a 404 like other out-of-range pages"""
+        assert self.client.get('/api/inbox/?cursor=bogus').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCountModes:
+    """Test ?count=false and ?count=cached on page number lists"""
+    
+    def setup_method(self):
+        """Setup test client and user"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='countuser',
+            email='count@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+    
+    def create_tasks(self, count):
+        Task.objects.bulk_create(Task(user=self.user, title=f'Task {i}', category='Fun') for i in range(count))
+    
+    def count_queries(self, url, table='api_task'):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        sql = [q['sql'] for q in captured.captured_queries if table in q['sql']]
+        return response, [q for q in sql if 'COUNT(' in q]
+    
+    def test_count_false_skips_count(self, monkeypatch):
+        """Test count=false reports has_next from one extra row, without COUNT"""
+        monkeypatch.setattr(PageNumberCountPagination, 'page_size', 2)
+        self.create_tasks(3)
+        response, counts = self.count_queries('/api/tasks/?count=false')
+        assert not counts
+        assert 'count' not in response.data
+        assert response.data['has_next'] is True
+        assert len(response.data['results']) == 2
+        assert response.data['previous'] is None
+        
+        last = self.client.get(response.data['next'])
+        assert last.data['has_next'] is False
+        assert last.data['next'] is None
+        assert len(last.data['results']) == 1
+        assert 'page=' not in last.data['previous']
+    
+    def test_count_false_page_out_of_range(self):
+        """Test an empty page past the end is a 404 as in the default mode"""
+        assert self.client.get('/api/tasks/?count=false').status_code == status.HTTP_200_OK
+        assert self.client.get('/api/tasks/?count=false&page=2').status_code == status.HTTP_404_NOT_FOUND
+        assert self.client.get('/api/tasks/?count=false&page=x').status_code == status.HTTP_404_NOT_FOUND
+    
+    def test_count_cached_is_maintained(self, django_capture_on_commit_callbacks):
+        """Test count=cached is counted once, then moved by inserts and deletes"""
+        self.create_tasks(3)
+        response, counts = self.count_queries('/api/tasks/?count=cached')
+        assert response.data['count'] == 3 and len(counts) == 1
+        response, counts = self.count_queries('/api/tasks/?count=cached')
+        assert response.data['count'] == 3 and not counts
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            task = Task.objects.create(user=self.user, title='New', category='Fun')
+        response, counts = self.count_queries('/api/tasks/?count=cached')
+        assert response.data['count'] == 4 and not counts
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            task.delete()
+        assert self.client.get('/api/tasks/?count=cached').data['count'] == 3
+    
+    def test_count_cached_falls_back_for_untracked_lists(self):
+        """Test a filtered list without its own counter still counts the table"""
+        sender = User.objects.create_user(username='sender', email='sender@example.com', password='TestPass123!')
+        InboxItem.objects.create(recipient=self.user, sender=sender, item_type='message', title='Hi')
+        InboxItem.objects.create(recipient=self.user, sender=sender, item_type='message', title='Read', is_read=True)
+        response, counts = self.count_queries('/api/inbox/unread/?count=cached', table='api_inboxitem')
+        assert response.data['count'] == 1 and len(counts) == 1
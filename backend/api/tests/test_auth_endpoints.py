@@ -9,13 +9,16 @@ Tests for:
 """
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from api.models import UserProfile, Couple, CouplingCode
+from api.models import UserProfile, Couple, CouplingCode, UserPreferences, Employment, Skill, Project
+from api.profiles import PROFILE_SECTIONS
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 
 User = get_user_model()
 
@@ -262,6 +265,54 @@ class TestUserRegistration:
         self._verify_registration_result(response, expect_coupled=False)
 
 
+@pytest.mark.django_db
+class TestRegistrationWrites:
+    """Test registration and later user saves write the profile only as needed"""
+
+    def register(self, **extra):
+        return APIClient().post('/api/register/', {
+            'username': 'newcomer', 'email': 'Newcomer@Example.com',
+            'password': 'SecurePass123!', 'password_confirm': 'SecurePass123!', **extra
+        })
+
+    def writes(self, captured):
+        return [q['sql'].split()[0] for q in captured.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+    def test_registration_writes_user_and_profile_once(self):
+        """Test one user insert, one profile insert and one last-login update"""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.register()
+        assert response.status_code == status.HTTP_201_CREATED
+        assert self.writes(captured) == ['INSERT', 'INSERT', 'UPDATE']
+        profile = UserProfile.objects.get(user__username='newcomer')
+        assert profile.email_normalized == 'newcomer@example.com'
+        assert profile.last_login_at is not None
+
+    def test_registration_is_one_transaction(self, mocker):
+        """Test a failure after the user insert leaves no user behind"""
+        mocker.patch('api.views.UserProfile.objects.filter', side_effect=RuntimeError)
+        assert self.register().status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert not User.objects.filter(username='newcomer').exists()
+
+    def test_user_saves_skip_profile_unless_email_changes(self, user):
+        """Test saves that keep the email leave the profile alone"""
+        user = User.objects.select_related('profile').get(pk=user.pk)
+        with CaptureQueriesContext(connection) as captured:
+            user.first_name = 'Renamed'
+            user.save()
+            user.save(update_fields=['last_login'])
+        assert [q['sql'] for q in captured.captured_queries if 'api_userprofile' in q['sql']] == []
+
+        user.email = 'Changed@Example.com'
+        user.save()
+        assert UserProfile.objects.get(user=user).email_normalized == 'changed@example.com'
+        # Also without the profile loaded
+        user = User.objects.get(pk=user.pk)
+        user.email = 'again@example.com'
+        user.save()
+        assert UserProfile.objects.get(user=user).email_normalized == 'again@example.com'
+
+
 @pytest.mark.django_db
 class TestUserLogin:
     """Test POST /api/token/ endpoint (SimpleJWT login)"""
@@ -499,6 +550,69 @@ class TestUpdateUserProfile:
         assert self.user.last_name == 'Name'
 
 
+@pytest.mark.django_db
+class TestCachedProfileDocument:
+    """Test GET /api/users/me/ serves a cached document kept fresh by signals"""
+
+    def setup_method(self):
+        self.client = APIClient()
+
+    def get_profile(self):
+        response = self.client.get('/api/users/me/')
+        assert response.status_code == status.HTTP_200_OK
+        return response.data['data']
+
+    def test_cold_read_is_bounded_and_warm_read_is_free(self, user, django_assert_num_queries):
+        """Test a rebuild costs the same queries however many rows, a cached read none"""
+        for i in range(5):
+            Skill.objects.create(user=user, name=f'Skill {i}')
+            Project.objects.create(user=user, title=f'Project {i}', description='', start_date=date(2024, 1, i + 1))
+        self.client.force_authenticate(user=user)
+
+        # The user with profile and preferences, then one query per section
+        with django_assert_num_queries(1 + len(PROFILE_SECTIONS)):
+            assert len(self.get_profile()['skills']) == 5
+        with django_assert_num_queries(0):
+            assert len(self.get_profile()['projects']) == 5
+
+    def test_section_changes_invalidate(self, user):
+        """Test saving and deleting section rows is reflected on the next read"""
+        self.client.force_authenticate(user=user)
+        assert self.get_profile()['employment_history'] == []
+
+        job = Employment.objects.create(user=user, company='Synk', position='Engineer', start_date=date(2024, 1, 1))
+        assert [e['company'] for e in self.get_profile()['employment_history']] == ['Synk']
+
+        job.position = 'Lead'
+        job.save()
+        assert self.get_profile()['employment_history'][0]['position'] == 'Lead'
+
+        job.delete()
+        assert self.get_profile()['employment_history'] == []
+
+    def test_preferences_and_account_changes_invalidate(self, user):
+        """Test preferences and user field changes are reflected on the next read"""
+        self.client.force_authenticate(user=user)
+        assert self.get_profile()['preferences'] is None
+
+        UserPreferences.objects.create(user=user, anniversary=date(2024, 2, 14))
+        assert self.get_profile()['preferences']['anniversary'] == '2024-02-14'
+
+        user.first_name = 'Renamed'
+        user.save()
+        assert self.get_profile()['first_name'] == 'Renamed'
+
+    def test_documents_are_per_user(self, user, user2):
+        """Test one user's change leaves another user's cached document alone"""
+        self.client.force_authenticate(user=user)
+        self.get_profile()
+        Skill.objects.create(user=user2, name='Baking')
+        self.client.force_authenticate(user=user2)
+        assert [s['name'] for s in self.get_profile()['skills']] == ['Baking']
+        self.client.force_authenticate(user=user)
+        assert self.get_profile()['skills'] == []
+
+
 @pytest.mark.django_db
 class TestUserLogout:
     """Test POST /api/auth/logout/ endpoint"""
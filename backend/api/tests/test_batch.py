@@ -0,0 +1,137 @@
+"""
+Tests for the batch request endpoint
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.batch import SUB_REQUEST_CHECKS
+from api.couples import invalidate_couple_context
+from api.middleware import ENDPOINT_RATE_LIMITS, InputValidationMiddleware
+from api.models import Activity, InboxItem, Memory, Task
+from api.serializers import MAX_BATCH_REQUESTS
+
+
+def batch(client, requests, atomic=False):
+    return client.post('/api/batch/', {'requests': requests, 'atomic': atomic}, format='json')
+
+
+@pytest.mark.django_db
+class TestBatchView:
+    """Test POST /api/batch/"""
+
+    def test_requires_authentication(self):
+        """Test anonymous clients are rejected"""
+        response = batch(APIClient(), [{'method': 'GET', 'path': '/api/tasks/'}])
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_runs_sub_requests_in_order(self, client_for, user, user2, couple):
+        """Test a chain of writes and reads runs in one round trip as the batch's user"""
+        item = InboxItem.objects.create(recipient=user, sender=user2, item_type='message', title='Hi')
+        response = batch(client_for(user), [
+            {'method': 'POST', 'path': '/api/memories/', 'body': {'title': 'Picnic', 'date': '2024-05-01'}},
+            {'method': 'POST', 'path': '/api/activities/', 'body': {
+                'user': 'Me', 'action': 'added', 'item': 'Picnic', 'timestamp': 'now', 'avatar': 'me.png'
+            }},
+            {'method': 'post', 'path': f'/api/inbox/{item.id}/mark_as_read/'},
+            {'method': 'GET', 'path': '/api/memories/?count=false'},
+        ])
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['committed'] is True
+        statuses = [sub['status'] for sub in response.data['responses']]
+        assert statuses == [201, 201, 200, 200]
+
+        memory = Memory.objects.get(title='Picnic')
+        assert (memory.user_id, memory.couple_id) == (user.id, couple.id)
+        assert Activity.objects.filter(item='Picnic', couple=couple).exists()
+        assert InboxItem.objects.get(id=item.id).is_read is True
+        listing = response.data['responses'][3]
+        assert [m['title'] for m in listing['body']['results']] == ['Picnic']
+        assert 'ETag' in listing['headers']
+
+    def test_conditional_headers_stay_on_the_batch(self, client_for, user, task):
+        """Test an If-None-Match sent with the batch does not turn a sub-request into a 304"""
+        client = client_for(user)
+        etag = client.get('/api/tasks/')['ETag']
+        response = client.post(
+            '/api/batch/', {'requests': [{'method': 'GET', 'path': '/api/tasks/'}]},
+            format='json', HTTP_IF_NONE_MATCH=etag
+        )
+        listing, = response.data['responses']
+        assert listing['status'] == status.HTTP_200_OK
+        assert [t['title'] for t in listing['body']['results']] == ['Test Task']
+
+    def test_sub_requests_are_rate_limited(self, client_for, user, settings, monkeypatch):
+        """Test each sub-request counts against the rate limit like a request of its own"""
+        settings.DEBUG = False
+        monkeypatch.setitem(ENDPOINT_RATE_LIMITS, '/api/', {'rate': 1, 'interval': 3600})
+        response = batch(client_for(user), [{'method': 'GET', 'path': '/api/tasks/'}] * 3)
+        assert [sub['status'] for sub in response.data['responses']] == [200, 200, 429]
+        assert response.data['responses'][2]['body']['error_code'] == 'RATE_LIMIT_EXCEEDED'
+
+    def test_sub_requests_are_validated(self, client_for, user, monkeypatch):
+        """Test an oversized sub-request body is rejected before its view runs"""
+        validation = next(check for check in SUB_REQUEST_CHECKS if isinstance(check, InputValidationMiddleware))
+        monkeypatch.setattr(validation, 'MAX_REQUEST_SIZE', 64)
+        response = batch(client_for(user), [
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'x' * 100, 'category': 'Fun'}},
+        ])
+        assert response.data['responses'][0]['status'] == 413
+        assert not Task.objects.exists()
+
+    def test_independent_failures(self, client_for, user):
+        """Test without atomic a failing sub-request does not stop the others"""
+        response = batch(client_for(user), [
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {'category': 'Fun'}},
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'Kept', 'category': 'Fun'}},
+            {'method': 'GET', 'path': '/api/nowhere/'},
+        ])
+        assert [sub['status'] for sub in response.data['responses']] == [400, 201, 404]
+        assert response.data['committed'] is True
+        assert Task.objects.filter(title='Kept').exists()
+
+    def test_atomic_rolls_back(self, client_for, user, django_capture_on_commit_callbacks):
+        """Test with atomic the first failure undoes earlier writes and skips the rest"""
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = batch(client_for(user), [
+                {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'Undone', 'category': 'Fun'}},
+                {'method': 'PATCH', 'path': '/api/tasks/999999/', 'body': {'status': 'Planning'}},
+                {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'Skipped', 'category': 'Fun'}},
+            ], atomic=True)
+        assert response.data['committed'] is False
+        assert [sub['status'] for sub in response.data['responses']] == [201, 404, 424]
+        assert not Task.objects.filter(title__in=['Undone', 'Skipped']).exists()
+        # The events and version bumps of the undone write are dropped with it
+        assert not callbacks
+
+    def test_cannot_nest_batches(self, client_for, user):
+        """Test the batch endpoint is not reachable from a batch"""
+        response = batch(client_for(user), [
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}},
+        ])
+        assert response.data['responses'][0]['status'] == 404
+
+    def test_sub_requests_keep_view_permissions(self, client_for, user, user2):
+        """Test a sub-request is authenticated as the batch user, not elevated"""
+        response = batch(client_for(user), [{'method': 'GET', 'path': '/api/realtime/stats/'}])
+        assert response.data['responses'][0]['status'] == 403
+
+    def test_rejects_invalid_batches(self, client_for, user):
+        """Test empty, oversized and malformed batches are 400"""
+        client = client_for(user)
+        assert batch(client, []).status_code == status.HTTP_400_BAD_REQUEST
+        too_many = [{'method': 'GET', 'path': '/api/tasks/'}] * (MAX_BATCH_REQUESTS + 1)
+        assert batch(client, too_many).status_code == status.HTTP_400_BAD_REQUEST
+        assert batch(client, [{'method': 'TRACE', 'path': '/api/tasks/'}]).status_code == status.HTTP_400_BAD_REQUEST
+        assert batch(client, [{'method': 'GET', 'path': '/admin/'}]).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_shares_couple_context(self, client_for, user, user2, couple):
+        """Test the couple is resolved once for the whole batch"""
+        invalidate_couple_context(user.id)
+        requests = [{'method': 'GET', 'path': path} for path in ('/api/tasks/', '/api/milestones/', '/api/suggestions/')]
+        with CaptureQueriesContext(connection) as captured:
+            response = batch(client_for(user), requests)
+        assert [sub['status'] for sub in response.data['responses']] == [200, 200, 200]
+        assert len([q for q in captured.captured_queries if 'FROM "api_couple"' in q['sql']]) == 1
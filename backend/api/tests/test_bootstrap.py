@@ -0,0 +1,91 @@
+"""
+Tests for the app startup endpoint
+"""
+import pytest
+from datetime import date
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.models import Activity, DailyConnection, InboxItem, Memory, Task
+
+# Queries of a warm bootstrap (couple context cached): one per board, the
+# inbox page and unread count, preferences, the couple row and today's
+# connection with its answers. It must not grow with the amount of data.
+BOOTSTRAP_QUERY_BUDGET = 12
+
+
+def seed(couple, rows):
+    """Shared tasks and memories plus inbox items for user1 (bulk_create skips the couple signal)"""
+    user, partner = couple.user1, couple.user2
+    Task.objects.bulk_create(
+        Task(user=owner, couple=couple, title=f'Task {i}', category='Fun')
+        for i in range(rows) for owner in (user, partner)
+    )
+    Memory.objects.bulk_create(
+        Memory(user=user, couple=couple, title=f'Memory {i}', date=date.today()) for i in range(rows)
+    )
+    InboxItem.objects.bulk_create(
+        InboxItem(recipient=user, sender=partner, item_type='message', title=f'Hi {i}')
+        for i in range(rows)
+    )
+
+
+@pytest.mark.django_db
+class TestBootstrapView:
+    """Test GET /api/bootstrap/"""
+
+    def test_requires_authentication(self):
+        """Test anonymous clients are rejected"""
+        assert APIClient().get('/api/bootstrap/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_returns_startup_data(self, client_for, user, user2, couple, task, activity):
+        """Test every piece of startup data is in the response"""
+        seed(couple, 2)
+        InboxItem.objects.filter(title='Hi 0').update(is_read=True)
+
+        response = client_for(user).get('/api/bootstrap/')
+        assert response.status_code == status.HTTP_200_OK
+        data = response.data
+        assert data['user']['username'] == user.username
+        assert data['couple']['is_coupled'] is True
+        assert data['couple']['partner']['id'] == user2.id
+        assert data['preferences']['anniversary'] == '2024-01-15'
+        assert len(data['boards']['tasks']['results']) == 5
+        assert data['boards']['tasks']['has_more'] is False
+        assert [a['id'] for a in data['boards']['activities']['results']] == [str(activity.id)]
+        assert len(data['boards']['memories']['results']) == 2
+        assert len(data['boards']['inbox']['results']) == 2
+        assert data['inbox_unread_count'] == 1
+        assert data['daily_connection']['id'] == DailyConnection.objects.get(couple=couple).id
+
+    def test_single_user(self, client_for, user):
+        """Test an uncoupled user gets a placeholder connection"""
+        response = client_for(user).get('/api/bootstrap/')
+        assert response.data['couple'] == {'is_coupled': False, 'partner': None}
+        assert response.data['daily_connection']['id'] is None
+        assert response.data['boards']['tasks'] == {'results': [], 'has_more': False}
+
+    def test_boards_are_capped_at_a_page(self, client_for, user, settings):
+        """Test a board only returns its first page and flags the rest"""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'PAGE_SIZE': 3}
+        Task.objects.bulk_create(Task(user=user, title=f'Task {i}', category='Fun') for i in range(4))
+        Activity.objects.bulk_create(
+            Activity(user=user, activity_user='Me', action='added', item=f'Item {i}', timestamp='now', avatar='')
+            for i in range(4)
+        )
+
+        boards = client_for(user).get('/api/bootstrap/').data['boards']
+        assert len(boards['tasks']['results']) == 3
+        assert boards['tasks']['has_more'] is True
+        # The activity feed keeps its own page size
+        assert len(boards['activities']['results']) == 4
+
+    @pytest.mark.parametrize('rows', [1, 20])
+    def test_query_budget(self, client_for, user, user2, couple, rows, django_assert_max_num_queries):
+        """Test a warm bootstrap stays within a fixed number of queries"""
+        seed(couple, rows)
+        client = client_for(user)
+        client.get('/api/bootstrap/')
+
+        with django_assert_max_num_queries(BOOTSTRAP_QUERY_BUDGET):
+            assert client.get('/api/bootstrap/').status_code == status.HTTP_200_OK
@@ -0,0 +1,91 @@
+"""
+Tests for the request budget meter and middleware
+"""
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+
+from api import budgets
+from api.budgets import Budget, Meter, budget_for_request, charge_sub_request, record_channel_sends
+from api.realtime import publish, user_group
+from api.views import PlanDateView, TaskViewSet
+
+
+@pytest.mark.django_db
+class TestMeter:
+    """Test what the meter counts"""
+
+    def test_counts_queries_cache_calls_and_sends(self):
+        """Test queries, top-level cache calls and channel sends are counted"""
+        with Meter() as meter:
+            User.objects.count()
+            cache.get_or_set('budget-key', 1)
+            cache.get_many(['budget-key', 'other'])
+            record_channel_sends(2)
+        assert (meter.queries, meter.cache_calls, meter.channel_sends) == (1, 2, 2)
+
+    def test_stops_counting_on_exit(self):
+        """Test nothing is counted once the block is left"""
+        with Meter() as meter:
+            pass
+        User.objects.count()
+        cache.get('budget-key')
+        record_channel_sends(1)
+        assert (meter.queries, meter.cache_calls, meter.channel_sends) == (0, 0, 0)
+        assert 'get' not in vars(caches['default'])
+
+    def test_counts_flushed_broadcasts(self, user, django_capture_on_commit_callbacks):
+        """Test events published through the channel layer are counted"""
+        with Meter() as meter:
+            with django_capture_on_commit_callbacks(execute=True):
+                publish([user_group(user.id)], 'task:created', {'id': 1})
+        assert meter.channel_sends == 1
+
+
+class TestBudget:
+    """Test budget lookup and checks"""
+
+    def test_violations(self):
+        """Test only the limits exceeded are reported"""
+        meter = Meter()
+        meter.queries, meter.cache_calls = 3, 1
+        budget = Budget(queries=2, cache_calls=1)
+        assert budget.violations(meter) == ['3 queries (budget 2)']
+        assert budget.violations(meter, extra_queries=1) == []
+
+    def test_sub_requests_add_their_budgets(self):
+        """Test a request running sub-requests is allowed their budgets on top of its own"""
+        with Meter() as meter:
+            charge_sub_request(Budget(queries=3, cache_calls=2, channel_sends=1), overhead_queries=2)
+            charge_sub_request(Budget(queries=1))
+        meter.queries, meter.cache_calls, meter.channel_sends = 8, 3, 1
+        assert Budget(queries=2, cache_calls=1).violations(meter) == []
+        meter.queries = 9
+        assert Budget(queries=2, cache_calls=1).violations(meter) == ['9 queries (budget 8)']
+
+    def test_budget_for_request(self):
+        """Test routes resolve to the budget of their view action"""
+        assert budget_for_request('GET', '/api/tasks/?count=false') == TaskViewSet.budgets['list']
+        assert budget_for_request('PATCH', '/api/tasks/1/') == TaskViewSet.budgets['partial_update']
+        assert budget_for_request('GET', '/api/ai/plan-date/') == PlanDateView.budgets['get']
+
+
+@pytest.mark.django_db
+class TestRequestBudgetMiddleware:
+    """Test the sampling middleware"""
+
+    def test_logs_requests_over_budget(self, client_for, user, settings, monkeypatch, mocker):
+        """Test a sampled request over its budget is logged"""
+        settings.REQUEST_BUDGET_SAMPLE_RATE = 1
+        monkeypatch.setattr(PlanDateView, 'budgets', {'get': Budget(queries=0)})
+        warning = mocker.patch.object(budgets.logger, 'warning')
+        assert client_for(user).get('/api/ai/plan-date/').status_code == 200
+        warning.assert_called_once()
+        assert 'Over budget: GET /api/ai/plan-date/ [PlanDateView.get]' in warning.call_args.args[0]
+
+    def test_quiet_within_budget(self, client_for, user, settings, mocker):
+        """Test requests within budget are not logged"""
+        settings.REQUEST_BUDGET_SAMPLE_RATE = 1
+        warning = mocker.patch.object(budgets.logger, 'warning')
+        assert client_for(user).get('/api/ai/plan-date/').status_code == 200
+        warning.assert_not_called()
@@ -0,0 +1,95 @@
+"""
+Tests for the batched side effects of cascading deletes
+"""
+from datetime import date, timedelta
+import pytest
+
+from api.budgets import Meter
+from api.cascades import batched_deletes
+from api.models import DailyConnection, DailyConnectionAnswer, InboxItem, Task, Tombstone
+from api.versions import ResourceCounts, ResourceVersions, couple_scope, user_scope
+
+
+def seed_connections(couple, days):
+    """Daily connections answered by both partners, each answer shared to the other's inbox"""
+    for day in range(days):
+        connection = DailyConnection.objects.create(
+            couple=couple, date=date.today() - timedelta(days=day), prompt=f'Prompt {day}'
+        )
+        for author, recipient in ((couple.user1, couple.user2), (couple.user2, couple.user1)):
+            answer = DailyConnectionAnswer.objects.create(connection=connection, user=author, answer_text='Answer')
+            InboxItem.objects.create(
+                recipient=recipient, sender=author, item_type='connection_answer',
+                title='Answer shared', connection_answer=answer
+            )
+
+
+@pytest.mark.django_db
+class TestBatchedDeletes:
+    """Test the side effects of rows deleted inside batched_deletes"""
+
+    def test_side_effects_done_once_per_scope(self, user, user2, couple, mocker, django_capture_on_commit_callbacks):
+        """Test tombstones, versions and events of a couple deletion are batched per scope"""
+        seed_connections(couple, 3)
+        inbox_ids = {
+            recipient.id: sorted(InboxItem.objects.filter(recipient=recipient).values_list('id', flat=True))
+            for recipient in (user, user2)
+        }
+        inbox_before = ResourceVersions.current('inbox', user_scope(user.id))
+        ResourceCounts.get('daily-connections', couple_scope(couple.id), lambda: 3)
+        publish = mocker.patch('api.cascades.publish')
+
+        couple_id = couple.id
+        with django_capture_on_commit_callbacks(execute=True):
+            with batched_deletes():
+                couple.delete()
+
+        assert Tombstone.objects.filter(model='inboxitem').count() == 6
+        assert ResourceVersions.current('inbox', user_scope(user.id)) == inbox_before + 1
+        assert ResourceCounts.get('daily-connections', couple_scope(couple_id), lambda: None) == 0
+        assert sorted(call.args for call in publish.call_args_list) == sorted(
+            ([f'user_{recipient_id}'], 'inbox:bulk_deleted', {'ids': ids})
+            for recipient_id, ids in inbox_ids.items()
+        )
+
+    def test_cost_does_not_grow_with_rows(self, user, user2, couple, django_capture_on_commit_callbacks):
+        """Test deleting more rows costs no more cache calls or channel sends"""
+        def delete_connections(days):
+            seed_connections(couple, days)
+            with Meter() as meter, django_capture_on_commit_callbacks(execute=True):
+                with batched_deletes():
+                    DailyConnection.objects.filter(couple=couple).delete()
+            return meter.cache_calls, meter.channel_sends
+
+        delete_connections(1)  # Fills the version and sequence counters
+        assert delete_connections(2) == delete_connections(8)
+
+    def test_answers_deleted_alone_bump_their_couple(self, user, couple, django_capture_on_commit_callbacks):
+        """Test answers deleted without their connection still invalidate the couple's list"""
+        seed_connections(couple, 1)
+        before = ResourceVersions.current('daily-connections', couple_scope(couple.id))
+        with django_capture_on_commit_callbacks(execute=True):
+            with batched_deletes():
+                DailyConnectionAnswer.objects.filter(user=user).delete()
+        assert ResourceVersions.current('daily-connections', couple_scope(couple.id)) == before + 1
+
+    def test_failed_block_rolls_back(self, user, task):
+        """Test a block that raises deletes nothing and records no tombstone"""
+        task_id = task.id
+        with pytest.raises(RuntimeError):
+            with batched_deletes():
+                task.delete()
+                raise RuntimeError
+        assert Task.objects.filter(id=task_id).exists()
+        assert not Tombstone.objects.exists()
+
+    def test_nested_blocks_flush_once(self, user, task, mocker):
+        """Test a block inside another leaves the work to the outer one"""
+        bulk_create = mocker.spy(Tombstone.objects, 'bulk_create')
+        task_id = task.id
+        with batched_deletes():
+            with batched_deletes():
+                task.delete()
+            assert not bulk_create.called
+        bulk_create.assert_called_once()
+        assert Tombstone.objects.filter(model='task', object_id=task_id).exists()
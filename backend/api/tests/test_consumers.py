@@ -1,10 +1,21 @@
 """
 Tests for API WebSocket consumers
 """
+import asyncio
+import json
 import pytest
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.tokens import AccessToken
 from synk_backend.asgi import application
+from api.consumers import CLOSE_IDLE, CLOSE_TOO_MANY_CONNECTIONS, CLOSE_UNAUTHORIZED
+from api.models import Couple
+from api.realtime import build_message, send_group_messages
+from api.websocket import ConnectionSlots, connection_stats
 
 
 @pytest.fixture
@@ -18,29 +29,53 @@ def channel_layer(settings):
     return get_channel_layer()
 
 
-@pytest.mark.django_db
-@pytest.mark.asyncio
-async def test_synk_consumer_connect_disconnect(channel_layer):
-    """Test consumer connect and disconnect"""
-    communicator = WebsocketCommunicator(
-        application,
-        "/ws/1/"
-    )
+@pytest.fixture
+def socket_user(db):
+    """User that opens the sockets in these tests"""
+    return User.objects.create_user(username='socket_user', password='testpass123')
+
+
+def make_couple():
+    """Create two users and couple them"""
+    user1 = User.objects.create_user(username='socket_one', email='one@example.com', password='testpass123')
+    user2 = User.objects.create_user(username='socket_two', email='two@example.com', password='testpass123')
+    return Couple.objects.create(user1=user1, user2=user2)
+
+
+async def open_stream(communicator):
+    """Connect and consume the initial stream:position frame; returns the positions"""
     connected, _ = await communicator.connect()
     assert connected
+    frame = await communicator.receive_json_from()
+    assert frame["event"] == "stream:position"
+    return frame["data"]
+
+
+def communicator_for(user, user_id=None, token=True, last_seq=None):
+    """WebSocket communicator for a user's stream, authenticated with a JWT"""
+    path = f"/ws/{user_id or user.id}/"
+    if token:
+        path += f"?token={AccessToken.for_user(user)}"
+    if last_seq is not None:
+        path += f"&last_seq={quote(json.dumps(last_seq))}"
+    return WebsocketCommunicator(application, path)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_synk_consumer_connect_disconnect(channel_layer, socket_user):
+    """Test consumer connect and disconnect"""
+    communicator = communicator_for(socket_user)
+    await open_stream(communicator)
     await communicator.disconnect()
 
 
-@pytest.mark.django_db
+@pytest.mark.django_db(transaction=True)
 @pytest.mark.asyncio
-async def test_synk_consumer_receive_send(channel_layer):
+async def test_synk_consumer_receive_send(channel_layer, socket_user):
     """Test consumer receive and send_message"""
-    communicator = WebsocketCommunicator(
-        application,
-        "/ws/42/"
-    )
-    connected, _ = await communicator.connect()
-    assert connected
+    communicator = communicator_for(socket_user)
+    await open_stream(communicator)
 
     # Send message from client
     await communicator.send_json_to({
@@ -55,20 +90,16 @@ async def test_synk_consumer_receive_send(channel_layer):
     await communicator.disconnect()
 
 
-@pytest.mark.django_db
+@pytest.mark.django_db(transaction=True)
 @pytest.mark.asyncio
-async def test_synk_consumer_send_message_type(channel_layer):
+async def test_synk_consumer_send_message_type(channel_layer, socket_user):
     """Test that send_message handler is invoked by group_send"""
-    communicator = WebsocketCommunicator(
-        application,
-        "/ws/99/"
-    )
-    connected, _ = await communicator.connect()
-    assert connected
+    communicator = communicator_for(socket_user)
+    await open_stream(communicator)
 
     # Simulate channel layer sending to consumer (as views do)
     await channel_layer.group_send(
-        "user_99",
+        f"user_{socket_user.id}",
         {
             "type": "send_message",
             "event": "task:updated",
@@ -81,3 +112,230 @@ async def test_synk_consumer_send_message_type(channel_layer):
     assert response["data"]["title"] == "Updated"
 
     await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_synk_consumer_writes_encoded_frames(channel_layer, socket_user):
+    """Test pre-encoded frames are written to the socket unchanged"""
+    communicator = communicator_for(socket_user)
+    await open_stream(communicator)
+
+    message = build_message("task:updated", {"id": 1, "title": "Updated"})
+    await channel_layer.group_send(f"user_{socket_user.id}", message)
+
+    assert await communicator.receive_from() == message["text"]
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_synk_consumer_joins_couple_group(channel_layer):
+    """Test a coupled user's socket receives events sent to the couple group"""
+    couple = await database_sync_to_async(make_couple)()
+    user1 = await database_sync_to_async(User.objects.get)(pk=couple.user1_id)
+    communicator = communicator_for(user1)
+    await open_stream(communicator)
+
+    await channel_layer.group_send(
+        f"couple_{couple.id}",
+        {"type": "send_message", "event": "task:created", "data": {"id": 1}}
+    )
+
+    response = await communicator.receive_json_from()
+    assert response["event"] == "task:created"
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_synk_consumer_follows_coupling_changes(channel_layer, socket_user):
+    """Test couple.join / couple.leave move the socket in and out of the couple group"""
+    communicator = communicator_for(socket_user)
+    await open_stream(communicator)
+
+    await channel_layer.group_send(
+        f"user_{socket_user.id}",
+        {**build_message("couple:coupled", {}), "type": "couple.join", "couple_id": 3}
+    )
+    assert (await communicator.receive_json_from())["event"] == "couple:coupled"
+
+    await channel_layer.group_send("couple_3", {"type": "send_message", "event": "task:updated", "data": {}})
+    assert (await communicator.receive_json_from())["event"] == "task:updated"
+
+    await channel_layer.group_send(f"user_{socket_user.id}", {"type": "couple.leave", "couple_id": 3})
+    assert await communicator.receive_nothing()
+    await channel_layer.group_send("couple_3", {"type": "send_message", "event": "task:updated", "data": {}})
+    assert await communicator.receive_nothing()
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestAdmission:
+    """Test authentication and the per-user connection cap"""
+
+    async def test_rejects_missing_token(self, channel_layer, socket_user):
+        """Test an unauthenticated socket is refused"""
+        connected, code = await communicator_for(socket_user, token=False).connect()
+        assert not connected
+        assert code == CLOSE_UNAUTHORIZED
+        assert connection_stats()['rejected'] == 1
+
+    async def test_rejects_invalid_token(self, channel_layer, socket_user):
+        """Test a forged token is refused"""
+        communicator = WebsocketCommunicator(application, f"/ws/{socket_user.id}/?token=not-a-jwt")
+        connected, _ = await communicator.connect()
+        assert not connected
+
+    async def test_rejects_other_users_stream(self, channel_layer, socket_user):
+        """Test a valid token cannot subscribe to someone else's events"""
+        connected, code = await communicator_for(socket_user, user_id=socket_user.id + 1).connect()
+        assert not connected
+        assert code == CLOSE_UNAUTHORIZED
+
+    async def test_caps_concurrent_sockets(self, channel_layer, socket_user, settings):
+        """Test sockets over the per-user cap are refused until one closes"""
+        settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER = 1
+        first = communicator_for(socket_user)
+        await open_stream(first)
+
+        connected, code = await communicator_for(socket_user).connect()
+        assert not connected
+        assert code == CLOSE_TOO_MANY_CONNECTIONS
+
+        await first.disconnect()
+        again = communicator_for(socket_user)
+        await open_stream(again)
+        await again.disconnect()
+        assert connection_stats() == {'accepted': 2, 'rejected': 1, 'reaped': 0}
+
+    async def test_release_is_idempotent(self, socket_user, settings):
+        """Test releasing a slot again does not free the slot of another socket"""
+        settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER = 1
+        slot = await ConnectionSlots.acquire(socket_user.id, 'first')
+        await ConnectionSlots.release(socket_user.id, slot, 'first')
+        assert await ConnectionSlots.acquire(socket_user.id, 'second') == slot
+
+        await ConnectionSlots.release(socket_user.id, slot, 'first')
+        assert await ConnectionSlots.acquire(socket_user.id, 'third') is None
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestHeartbeat:
+    """Test server pings and idle reaping"""
+
+    @pytest.fixture(autouse=True)
+    def fast_heartbeat(self, settings):
+        settings.WEBSOCKET_HEARTBEAT_INTERVAL = 0.05
+        settings.WEBSOCKET_IDLE_TIMEOUT = 0.12
+
+    async def test_pong_keeps_socket_alive(self, channel_layer, socket_user):
+        """Test a client answering pings is not reaped"""
+        communicator = communicator_for(socket_user)
+        await open_stream(communicator)
+        for _ in range(4):
+            assert (await communicator.receive_json_from())["event"] == "ping"
+            await communicator.send_json_to({"type": "pong"})
+        await communicator.disconnect()
+        assert connection_stats()['reaped'] == 0
+
+    async def test_heartbeat_keeps_slot(self, channel_layer, socket_user, settings):
+        """Test a live socket holds its slot for longer than the slot expiry"""
+        settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER = 1
+        communicator = communicator_for(socket_user)
+        await open_stream(communicator)
+        for _ in range(8):  # ~0.4s, past the 0.24s expiry
+            assert (await communicator.receive_json_from())["event"] == "ping"
+            await communicator.send_json_to({"type": "pong"})
+
+        connected, code = await communicator_for(socket_user).connect()
+        assert (connected, code) == (False, CLOSE_TOO_MANY_CONNECTIONS)
+        await communicator.disconnect()
+
+    async def test_slot_of_crashed_worker_expires(self, socket_user, settings):
+        """Test a slot nobody refreshes is given back after twice the idle timeout"""
+        settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER = 1
+        assert await ConnectionSlots.acquire(socket_user.id, 'crashed') == 0
+        assert await ConnectionSlots.acquire(socket_user.id, 'next') is None
+        await asyncio.sleep(0.3)
+        assert await ConnectionSlots.acquire(socket_user.id, 'next') == 0
+
+    async def test_silent_socket_is_reaped(self, channel_layer, socket_user):
+        """Test a socket that stops answering is closed and leaves its groups"""
+        communicator = communicator_for(socket_user)
+        await open_stream(communicator)
+
+        output = await communicator.receive_output(timeout=1)
+        while output["type"] == "websocket.send":
+            output = await communicator.receive_output(timeout=1)
+        assert output == {"type": "websocket.close", "code": CLOSE_IDLE}
+        assert connection_stats()['reaped'] == 1
+
+        await channel_layer.group_send(f"user_{socket_user.id}", build_message("task:updated", {}))
+        assert await communicator.receive_nothing()
+        await communicator.disconnect()
+
+
+def publish_now(group, *events):
+    """Send events to a group through the sequencing dispatch path"""
+    return sync_to_async(send_group_messages)([(group, build_message(event, {})) for event in events])
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+class TestReplay:
+    """Test sequence numbers and replay on reconnect"""
+
+    async def test_reconnect_replays_missed_frames(self, channel_layer, socket_user):
+        """Test a socket resuming from last_seq receives only what it missed"""
+        stream = f"user_{socket_user.id}"
+        communicator = communicator_for(socket_user)
+        positions = await open_stream(communicator)
+        await publish_now(stream, 'task:created')
+        seen = await communicator.receive_json_from()
+        assert (seen["stream"], seen["seq"]) == (stream, positions[stream] + 1)
+        await communicator.disconnect()
+
+        await publish_now(stream, 'task:updated', 'task:deleted')
+        communicator = communicator_for(socket_user, last_seq={stream: seen["seq"], 'user_999': 0})
+        assert await open_stream(communicator) == {stream: seen["seq"]}
+        replayed = [await communicator.receive_json_from() for _ in range(2)]
+        assert [frame["event"] for frame in replayed] == ['task:updated', 'task:deleted']
+        assert [frame["seq"] for frame in replayed] == [seen["seq"] + 1, seen["seq"] + 2]
+        assert await communicator.receive_nothing()
+        await communicator.disconnect()
+
+    async def test_gap_larger_than_buffer_requires_sync(self, channel_layer, socket_user, settings):
+        """Test a client that missed more than the ring holds is told to resync"""
+        settings.WEBSOCKET_REPLAY_BUFFER_SIZE = 2
+        stream = f"user_{socket_user.id}"
+        communicator = communicator_for(socket_user)
+        positions = await open_stream(communicator)
+        await communicator.disconnect()
+
+        await publish_now(stream, 'task:created', 'task:updated', 'task:deleted')
+        communicator = communicator_for(socket_user, last_seq=positions)
+        assert await open_stream(communicator) == {stream: positions[stream] + 3}
+        assert (await communicator.receive_json_from())["event"] == "sync:required"
+        await communicator.disconnect()
+
+    async def test_gap_triggers_replay_on_open_socket(self, channel_layer, socket_user):
+        """Test a client that detected a gap gets the frames after its last seen one resent"""
+        stream = f"user_{socket_user.id}"
+        communicator = communicator_for(socket_user)
+        positions = await open_stream(communicator)
+        await publish_now(stream, 'task:created', 'task:updated')
+        live = [await communicator.receive_json_from() for _ in range(2)]
+
+        # The client only saw task:updated and asks from its last contiguous position
+        await communicator.send_json_to({'type': 'replay', 'last_seq': {stream: positions[stream], 'user_999': 0}})
+        assert await communicator.receive_json_from() == {'event': 'stream:position', 'data': {stream: positions[stream]}}
+        replayed = [await communicator.receive_json_from() for _ in range(2)]
+        assert replayed == live
+        assert await communicator.receive_nothing()
+        await communicator.disconnect()
@@ -0,0 +1,150 @@
+"""
+Tests for request-scoped and cached couple context resolution
+"""
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.couples import _cache_key, get_couple_context, get_couple_context_for_user
+from api.models import Couple, Memory, Task
+
+
+def couple_queries(captured):
+    """Return the captured queries that touch the couple table"""
+    return [q for q in captured.captured_queries if 'api_couple' in q['sql']]
+
+
+@pytest.mark.django_db
+class TestCoupleContext:
+    """Test CoupleContext resolution and caching"""
+
+    def test_uncoupled_user(self, user):
+        """Test context for a user without a couple"""
+        context = get_couple_context_for_user(user)
+        assert not context.is_coupled
+        assert context.partner is None
+        assert context.user_ids == [user.id]
+
+    def test_coupled_user_resolves_partner(self, user, user2, couple):
+        """Test both partners resolve the same couple"""
+        context = get_couple_context_for_user(user)
+        assert context.couple_id == couple.id
+        assert context.partner_id == user2.id
+        assert context.user_ids == [user.id, user2.id]
+        assert get_couple_context_for_user(user2).partner_id == user.id
+
+    def test_cached_across_calls(self, user, couple):
+        """Test the second resolution is served from the cache"""
+        get_couple_context_for_user(user)
+        with CaptureQueriesContext(connection) as captured:
+            context = get_couple_context_for_user(user)
+        assert context.couple_id == couple.id
+        assert not couple_queries(captured)
+
+    def test_invalidated_when_couple_created(self, user, user2):
+        """Test a cached 'not coupled' entry is dropped on coupling"""
+        assert not get_couple_context_for_user(user).is_coupled
+        couple = Couple.objects.create(user1=user, user2=user2)
+        assert get_couple_context_for_user(user).couple_id == couple.id
+        assert get_couple_context_for_user(user2).couple_id == couple.id
+
+    def test_invalidated_when_couple_deleted(self, user, user2, couple):
+        """Test a cached couple entry is dropped on uncoupling"""
+        assert get_couple_context_for_user(user).is_coupled
+        couple.delete()
+        assert not get_couple_context_for_user(user).is_coupled
+        assert not get_couple_context_for_user(user2).is_coupled
+
+    def test_invalidated_again_on_commit(self, user, user2, couple, django_capture_on_commit_callbacks):
+        """Test an old couple cached by a read racing the uncoupling is dropped once it commits"""
+        with django_capture_on_commit_callbacks(execute=True):
+            couple.delete()
+            # Another request, still seeing the committed couple, caches it again
+            cache.set(_cache_key(user.id), (couple.id, user2.id))
+        assert cache.get(_cache_key(user.id)) is None
+
+    def test_memoized_on_request(self, user, couple):
+        """Test the context is resolved once per request"""
+        request = APIRequestFactory().get('/api/tasks/')
+        request.user = user
+        first = get_couple_context(request)
+        with CaptureQueriesContext(connection) as captured:
+            assert get_couple_context(request) is first
+            assert first.partner is not None
+        assert not captured.captured_queries
+
+
+@pytest.mark.django_db
+class TestCoupleContextInViews:
+    """Test that views resolve the couple at most once per request"""
+
+    def test_task_create_uses_single_couple_lookup(self, user, user2, couple):
+        """Test creating a task costs at most one couple query"""
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as captured:
+            response = client.post('/api/tasks/', {'title': 'Shared', 'category': 'Fun'})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(couple_queries(captured)) <= 1
+
+    def test_couple_status_includes_partner(self, user, user2, couple):
+        """Test the couple endpoint returns the partner from the context"""
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/couple/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['is_coupled'] is True
+        assert response.data['partner']['id'] == user2.id
+
+
+@pytest.mark.django_db
+class TestSharedContentCouple:
+    """Test the denormalized couple on shared content rows"""
+
+    def test_new_rows_get_couple(self, user, user2, couple):
+        """Test rows created while coupled carry the couple"""
+        task = Task.objects.create(user=user2, title='After coupling', category='Fun')
+        assert task.couple_id == couple.id
+
+    def test_uncoupled_rows_have_no_couple(self, user):
+        """Test rows created while single have no couple"""
+        task = Task.objects.create(user=user, title='Solo', category='Fun')
+        assert task.couple_id is None
+
+    def test_coupling_links_existing_rows(self, user, user2):
+        """Test forming a couple stamps both partners' existing content"""
+        task = Task.objects.create(user=user, title='Before coupling', category='Fun')
+        memory = Memory.objects.create(user=user2, title='Trip', date='2024-06-01')
+        couple = Couple.objects.create(user1=user, user2=user2)
+        task.refresh_from_db()
+        memory.refresh_from_db()
+        assert task.couple_id == couple.id
+        assert memory.couple_id == couple.id
+
+    def test_uncoupling_unlinks_rows(self, user, user2, couple):
+        """Test dissolving a couple clears the couple on shared content"""
+        task = Task.objects.create(user=user, title='Shared', category='Fun')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.delete('/api/couple/uncouple/')
+        assert response.status_code == status.HTTP_200_OK
+        task.refresh_from_db()
+        assert task.couple_id is None
+
+    def test_coupling_code_shares_existing_boards(self, user, user2):
+        """Test partners see each other's earlier tasks after using a coupling code"""
+        Task.objects.create(user=user, title='Mine', category='Fun')
+        Task.objects.create(user=user2, title='Theirs', category='Fun')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        code = client.post('/api/coupling-codes/').data['code']
+        client.force_authenticate(user=user2)
+        response = client.post('/api/coupling-codes/use/', {'code': code})
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = client.get('/api/tasks/')
+        titles = {task['title'] for task in response.data['results']}
+        assert titles == {'Mine', 'Theirs'}
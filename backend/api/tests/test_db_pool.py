@@ -0,0 +1,202 @@
+"""
+Tests for the pooled PostgreSQL backend and its connection pool
+"""
+import threading
+import psycopg2
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+from rest_framework.test import APIClient
+
+from api.pooled_postgresql.base import DatabaseWrapper
+from api.pooled_postgresql.pool import ConnectionPool, PoolTimeout, close_pools, get_pool, pool_stats
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection; no PostgreSQL server runs in the tests"""
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = True
+        self.broken = False
+        self.status = TRANSACTION_STATUS_IDLE
+        self.executed = []
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if connection.broken:
+                    raise psycopg2.OperationalError('server closed the connection unexpectedly')
+                connection.executed.append(sql)
+        return Cursor()
+
+
+@pytest.fixture(autouse=True)
+def clear_pools():
+    yield
+    close_pools()
+
+
+class TestConnectionPool:
+    """Test checkout, return, waiting and health checks"""
+
+    def test_reuses_returned_connections(self):
+        """Test a returned connection is handed out again instead of opening one"""
+        pool = ConnectionPool('test', max_size=2)
+        connection = pool.getconn(FakeConnection)
+        pool.putconn(connection)
+        assert pool.getconn(FakeConnection) is connection
+        stats = pool.stats()
+        assert (stats['opened'], stats['checkouts'], stats['in_use'], stats['saturation']) == (1, 2, 1, 0.5)
+
+    def test_times_out_when_exhausted(self):
+        """Test a checkout beyond max_size waits for the timeout, then raises"""
+        pool = ConnectionPool('test', min_size=0, max_size=1, timeout=0.05)
+        pool.getconn(FakeConnection)
+        with pytest.raises(PoolTimeout):
+            pool.getconn(FakeConnection)
+        stats = pool.stats()
+        assert (stats['timeouts'], stats['saturation'], stats['waiting']) == (1, 1.0, 0)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        """Test a blocked checkout is served as soon as a connection comes back and its wait is recorded"""
+        pool = ConnectionPool('test', min_size=0, max_size=1, timeout=5)
+        connection = pool.getconn(FakeConnection)
+        threading.Timer(0.05, pool.putconn, [connection]).start()
+        assert pool.getconn(FakeConnection) is connection
+        stats = pool.stats()
+        assert (stats['opened'], stats['waits']) == (1, 1)
+        assert stats['wait_ms_max'] >= 40
+        assert stats['wait_ms_total'] == stats['wait_ms_max']
+
+    def test_rolls_back_connection_returned_in_transaction(self):
+        """Test an open transaction does not leak to the next checkout"""
+        pool = ConnectionPool('test')
+        connection = pool.getconn(FakeConnection)
+        connection.status = TRANSACTION_STATUS_INTRANS
+        pool.putconn(connection)
+        assert pool.getconn(FakeConnection).get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+    def test_pings_idle_connection_and_drops_broken_one(self):
+        """Test a connection idle past check_after is checked, and replaced when broken"""
+        pool = ConnectionPool('test', check_after=0)
+        healthy = pool.getconn(FakeConnection)
+        pool.putconn(healthy)
+        assert pool.getconn(FakeConnection) is healthy
+        assert healthy.executed == ['SELECT 1']
+
+        healthy.broken = True
+        pool.putconn(healthy)
+        replacement = pool.getconn(FakeConnection)
+        assert replacement is not healthy and healthy.closed
+        stats = pool.stats()
+        assert (stats['failed_checks'], stats['opened'], stats['closed'], stats['size']) == (1, 2, 1, 1)
+
+    def test_replaces_connections_past_max_lifetime(self):
+        """Test an expired connection is closed when returned"""
+        pool = ConnectionPool('test', max_lifetime=0)
+        connection = pool.getconn(FakeConnection)
+        pool.putconn(connection)
+        assert connection.closed
+        assert pool.stats()['size'] == 0
+
+    def test_closes_idle_connections_over_min_size(self):
+        """Test connections idle past max_idle are closed down to min_size"""
+        pool = ConnectionPool('test', min_size=1, max_idle=0)
+        first, second = pool.getconn(FakeConnection), pool.getconn(FakeConnection)
+        pool.putconn(first)
+        pool.putconn(second)
+        kept = pool.getconn(FakeConnection)
+        assert kept is first and second.closed
+        assert pool.stats()['size'] == 1
+
+    def test_failed_connect_frees_its_slot(self):
+        """Test a connection that could not be opened does not count against max_size"""
+        def refuse():
+            raise psycopg2.OperationalError('connection refused')
+        pool = ConnectionPool('test', min_size=0, max_size=1, timeout=0.05)
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn(refuse)
+        assert pool.getconn(FakeConnection)
+
+
+class TestPooledBackend:
+    """Test the database backend takes and gives back pooled connections"""
+
+    settings_dict = {
+        'NAME': 'synk_db', 'USER': 'postgres', 'PASSWORD': 'postgres', 'HOST': 'db', 'PORT': '5432',
+        'OPTIONS': {'connect_timeout': 10, 'pool': {'max_size': 4}},
+    }
+
+    def wrapper(self):
+        return DatabaseWrapper({**self.settings_dict, 'OPTIONS': {**self.settings_dict['OPTIONS']}}, alias='default')
+
+    def test_pool_options_not_passed_to_psycopg(self):
+        """Test the pool sizing stays out of the connection parameters"""
+        params = self.wrapper().get_connection_params()
+        assert 'pool' not in params
+        assert (params['dbname'], params['connect_timeout']) == ('synk_db', 10)
+
+    def test_connections_shared_across_wrappers(self, mocker):
+        """Test closing returns the connection, which a wrapper of another thread reuses"""
+        connect = mocker.patch.object(PostgreSQLDatabaseWrapper, 'get_new_connection', side_effect=lambda params: FakeConnection())
+        first = self.wrapper()
+        connection = first.get_new_connection(first.get_connection_params())
+        first.connection = connection
+        first._close()
+        assert not connection.closed
+
+        second = self.wrapper()
+        assert second.get_new_connection(second.get_connection_params()) is connection
+        assert connect.call_count == 1
+        (name, stats), = pool_stats().items()
+        assert name == 'default:postgres@db:5432/synk_db'
+        assert (stats['max_size'], stats['in_use']) == (4, 1)
+
+    def test_one_pool_per_database(self, mocker):
+        """Test pointing the alias at another database (as the test runner does) uses another pool"""
+        mocker.patch.object(PostgreSQLDatabaseWrapper, 'get_new_connection', side_effect=lambda params: FakeConnection())
+        production, test = self.wrapper(), self.wrapper()
+        test.settings_dict['NAME'] = 'test_synk_db'
+        production.get_new_connection(production.get_connection_params())
+        test.get_new_connection(test.get_connection_params())
+        assert production.pool is not test.pool
+        assert len(pool_stats()) == 2
+
+
+@pytest.mark.django_db
+class TestDatabaseStatsView:
+    """Test the pool introspection endpoint"""
+
+    def test_staff_see_pool_stats(self, user):
+        """Test staff get the state of every pool of the process"""
+        get_pool('default:postgres@db:5432/synk_db', {'max_size': 5}).getconn(FakeConnection)
+        user.is_staff = True
+        user.save()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/database/stats/')
+        assert response.status_code == 200
+        stats = response.data['pools']['default:postgres@db:5432/synk_db']
+        assert (stats['max_size'], stats['in_use'], stats['saturation']) == (5, 1, 0.2)
+
+    def test_forbidden_for_other_users(self, authenticated_client):
+        """Test regular users cannot read the pool state"""
+        assert authenticated_client.get('/api/database/stats/').status_code == 403
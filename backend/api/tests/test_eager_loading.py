@@ -0,0 +1,60 @@
+"""
+Tests that list endpoints and signal-side serializations load relations in
+a fixed number of queries
+"""
+import pytest
+from datetime import date, timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.models import DailyConnection, DailyConnectionAnswer, InboxItem, Memory, Milestone
+from api.serializers import InboxItemSerializer
+
+
+def seed(couple, rows, start=0):
+    """Inbox items with answers, answered connections and memories with milestones"""
+    user, partner = couple.user1, couple.user2
+    for i in range(start, start + rows):
+        connection_row = DailyConnection.objects.create(couple=couple, date=date(2024, 1, 1) + timedelta(days=i), prompt='Hi?')
+        answer = DailyConnectionAnswer.objects.create(connection=connection_row, user=partner, answer_text='Hello')
+        DailyConnectionAnswer.objects.create(connection=connection_row, user=user, answer_text='Hey')
+        InboxItem.objects.create(
+            recipient=user, sender=partner, item_type='connection_answer', title='Answer', connection_answer=answer
+        )
+        milestone = Milestone.objects.create(user=partner, name=f'Milestone {i}', date='2024-01-01')
+        Memory.objects.create(user=user, title=f'Memory {i}', date=date(2024, 1, 1), milestone=milestone)
+
+
+def queries_for(client, url):
+    with CaptureQueriesContext(connection) as captured:
+        assert client.get(url).status_code == 200
+    return len(captured.captured_queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['/api/inbox/', '/api/inbox/unread/', '/api/daily-connections/', '/api/memories/'])
+def test_list_queries_do_not_grow_with_rows(client_for, user, user2, couple, url):
+    """Test a page of 1 and a page of 15 rows cost the same number of queries"""
+    client = client_for(user)
+    seed(couple, 1)
+    client.get(url)
+    small = queries_for(client, url)
+    seed(couple, 14, start=1)
+    assert queries_for(client, url) == small
+
+
+@pytest.mark.django_db
+def test_signal_serialization_loads_missing_relations_once(user, user2, couple, django_assert_num_queries):
+    """Test relations not yet loaded are fetched in one query each, cached ones not at all"""
+    connection_row = DailyConnection.objects.create(couple=couple, date=date(2024, 1, 1), prompt='Hi?')
+    answer = DailyConnectionAnswer.objects.create(connection=connection_row, user=user2, answer_text='Hello')
+    item = InboxItem.objects.create(
+        recipient=user, sender=user2, item_type='connection_answer', title='Answer', connection_answer=answer
+    )
+    fresh = InboxItem.objects.get(id=item.id)
+    # sender, connection_answer, connection_answer.user
+    with django_assert_num_queries(3):
+        InboxItemSerializer.load_related([fresh])
+    with django_assert_num_queries(0):
+        InboxItemSerializer.load_related([fresh])
+        assert InboxItemSerializer(fresh).data['connection_answer']['user_name'] == user2.username
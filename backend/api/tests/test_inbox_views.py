@@ -2,12 +2,13 @@
 Tests for Inbox and Daily Connection views
 """
 import pytest
+from django.db import transaction
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from datetime import date
 from api.models import (
-    DailyConnection, DailyConnectionAnswer, InboxItem, Couple
+    DailyConnection, DailyConnectionAnswer, InboxItem, InboxCounter, Couple
 )
 
 
@@ -131,6 +132,148 @@ class TestInboxViewSet(APITestCase):
         assert len(results) >= 1
 
 
+def counts_of(user):
+    counter = InboxCounter.objects.get(user=user)
+    return counter.unread, counter.total
+
+
+@pytest.mark.django_db
+class TestInboxCounts:
+    """Test the materialized inbox counters"""
+    
+    def message(self, recipient, sender, **fields):
+        return InboxItem.objects.create(recipient=recipient, sender=sender, item_type='message', title='Hi', **fields)
+    
+    def test_counts_endpoint(self, user, user2, authenticated_client, django_assert_num_queries):
+        """Test /api/inbox/counts/ reads the user's counter row"""
+        self.message(user, user2)
+        self.message(user, user2, is_read=True)
+        # The token's user and the counter row
+        with django_assert_num_queries(2):
+            response = authenticated_client.get('/api/inbox/counts/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'unread': 1, 'total': 2}
+    
+    def test_missing_counter_is_rebuilt(self, user, user2, authenticated_client):
+        """Test inbox rows written without signals are counted on first read"""
+        InboxItem.objects.bulk_create(
+            InboxItem(recipient=user, sender=user2, item_type='message', title=f'Hi {i}') for i in range(3)
+        )
+        assert authenticated_client.get('/api/inbox/counts/').data == {'unread': 3, 'total': 3}
+    
+    def test_counter_follows_writes(self, user, user2, authenticated_client, django_capture_on_commit_callbacks):
+        """Test creating, reading, re-saving and deleting items move the counts"""
+        item = self.message(user, user2)
+        other = self.message(user, user2)
+        assert counts_of(user) == (2, 2)
+        
+        authenticated_client.post(f'/api/inbox/{item.id}/mark_as_read/')
+        assert counts_of(user) == (1, 2)
+        authenticated_client.post(f'/api/inbox/{item.id}/react/')
+        assert counts_of(user) == (1, 2)
+        
+        # Deletes are recounted once they commit
+        with django_capture_on_commit_callbacks(execute=True):
+            other.delete()
+        assert counts_of(user) == (0, 1)
+        with django_capture_on_commit_callbacks(execute=True):
+            InboxItem.objects.get(id=item.id).delete()
+        assert counts_of(user) == (0, 0)
+    
+    def test_concurrent_mark_as_read_counted_once(self, user, user2):
+        """Test two saves marking the same loaded item read move the counter once"""
+        item = self.message(user, user2)
+        self.message(user, user2)
+        first, second = InboxItem.objects.get(id=item.id), InboxItem.objects.get(id=item.id)
+        first.is_read = second.is_read = True
+        first.save()
+        second.save()
+        assert counts_of(user) == (1, 2)
+    
+    def test_delete_recounts_from_the_database(self, user, user2, django_capture_on_commit_callbacks):
+        """Test deleting an item loaded before another request marked it read leaves the counts right"""
+        item = self.message(user, user2)
+        self.message(user, user2)
+        stale = InboxItem.objects.get(id=item.id)
+        InboxItem.objects.filter(id=item.id).update(is_read=True)
+        InboxCounter.rebuild(user.id)
+        with django_capture_on_commit_callbacks(execute=True):
+            stale.delete()
+        assert counts_of(user) == (1, 1)
+    
+    def test_bulk_delete_pushes_one_count_per_recipient(self, user, user2, mocker, django_capture_on_commit_callbacks):
+        """Test deleting many items sends a single inbox:counts to each recipient"""
+        for _ in range(3):
+            self.message(user, user2)
+            self.message(user2, user)
+        publish = mocker.patch('api.signals.publish')
+        with django_capture_on_commit_callbacks(execute=True):
+            InboxItem.objects.all().delete()
+        counts = [call.args[:3] for call in publish.call_args_list if call.args[1] == 'inbox:counts']
+        assert sorted(counts) == sorted([
+            ([f'user_{user.id}'], 'inbox:counts', {'unread': 0, 'total': 0}),
+            ([f'user_{user2.id}'], 'inbox:counts', {'unread': 0, 'total': 0}),
+        ])
+    
+    def test_delete_after_rolled_back_delete_recounts(self, user, user2, django_capture_on_commit_callbacks):
+        """Test a recount left pending by a rolled back delete does not swallow the next one"""
+        kept, deleted = self.message(user, user2), self.message(user, user2)
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(RuntimeError), transaction.atomic():
+                kept.delete()
+                raise RuntimeError
+            deleted.delete()
+        assert counts_of(user) == (1, 1)
+    
+    def test_counts_pushed_over_websocket(self, user, user2, mocker, django_capture_on_commit_callbacks):
+        """Test a change of counts publishes inbox:counts to the recipient"""
+        publish = mocker.patch('api.signals.publish')
+        item = self.message(user, user2)
+        publish.assert_any_call(['user_%s' % user.id], 'inbox:counts', {'unread': 1, 'total': 1})
+        
+        publish.reset_mock()
+        item = InboxItem.objects.get(id=item.id)
+        item.title = 'Edited'
+        item.save()
+        assert 'inbox:counts' not in [call.args[1] for call in publish.call_args_list]
+
+    
+    @pytest.mark.parametrize('rows', [1, 50])
+    def test_mark_all_as_read_is_set_based(self, user, user2, authenticated_client, mocker, rows, django_assert_max_num_queries):
+        """Test mark_all_as_read runs a fixed number of queries and sends one bulk event"""
+        InboxItem.objects.bulk_create(
+            InboxItem(recipient=user, sender=user2, item_type='message', title=f'Hi {i}') for i in range(rows)
+        )
+        own_read = self.message(user, user2, is_read=True)
+        other = self.message(user2, user)
+        InboxCounter.rebuild(user.id)
+        signal_publish = mocker.patch('api.signals.publish')
+        view_publish = mocker.patch('api.mixins.publish')
+        
+        # The token's user, the unread ids, one UPDATE, the counter and the savepoint pair
+        with django_assert_max_num_queries(7):
+            response = authenticated_client.post('/api/inbox/mark_all_as_read/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['detail'] == f'{rows} items marked as read'
+        
+        unread_ids = set(InboxItem.objects.filter(recipient=user).exclude(id=own_read.id).values_list('id', flat=True))
+        assert not InboxItem.objects.filter(recipient=user, is_read=False).exists()
+        assert InboxItem.objects.get(id=other.id).is_read is False
+        assert counts_of(user) == (0, rows + 1)
+        signal_publish.assert_not_called()
+        events = {call.args[1]: call.args[2] for call in view_publish.call_args_list}
+        assert set(events['inbox:bulk_read']['ids']) == unread_ids
+        assert events['inbox:counts'] == {'unread': 0, 'total': rows + 1}
+    
+    def test_mark_all_as_read_changes_etag(self, user, user2, authenticated_client, django_capture_on_commit_callbacks):
+        """Test the signal-free update still invalidates the inbox list"""
+        self.message(user, user2)
+        etag = authenticated_client.get('/api/inbox/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            authenticated_client.post('/api/inbox/mark_all_as_read/')
+        assert authenticated_client.get('/api/inbox/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
 @pytest.mark.django_db
 class TestDailyConnectionViewSet(APITestCase):
     """Test DailyConnection API endpoints"""
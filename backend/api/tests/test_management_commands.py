@@ -4,8 +4,13 @@ Tests for API management commands
 import pytest
 from django.contrib.auth.models import User
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from datetime import timedelta
+from django.utils import timezone
 from io import StringIO
 
+from api.models import Tombstone, UserProfile
+
 
 @pytest.mark.django_db
 class TestCreateTestUser:
@@ -47,3 +52,81 @@ class TestCreateTestUser:
         # Should only have one testuser
         assert User.objects.filter(username='testuser').count() == 1
         assert 'already exists' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestReconcileProfiles:
+    """Test reconcile_profiles management command"""
+
+    def make_users_without_profiles(self, count):
+        users = [User.objects.create_user(username=f'orphan{i}', email=f'Orphan{i}@Example.com') for i in range(count)]
+        UserProfile.objects.filter(user__in=users).delete()
+        return users
+
+    def test_creates_missing_profiles_in_batches(self):
+        """Test every missing profile is created, across several batches"""
+        users = self.make_users_without_profiles(5)
+        out = StringIO()
+        call_command('reconcile_profiles', '--batch-size', '2', stdout=out)
+        assert UserProfile.objects.filter(user__in=users).count() == 5
+        assert UserProfile.objects.get(user=users[0]).email_normalized == 'orphan0@example.com'
+        assert 'Created 5 missing profile(s); 0 conflict(s)' in out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        """Test --dry-run only reports"""
+        users = self.make_users_without_profiles(2)
+        out = StringIO()
+        call_command('reconcile_profiles', '--dry-run', stdout=out)
+        assert not UserProfile.objects.filter(user__in=users).exists()
+        assert 'Would create 2 missing profile(s)' in out.getvalue()
+
+    def test_skips_conflicting_emails(self):
+        """Test a user whose email another profile holds is reported, not created"""
+        User.objects.create_user(username='owner', email='shared@example.com')
+        orphan = User.objects.create_user(username='orphan', email='other@example.com')
+        UserProfile.objects.filter(user=orphan).delete()
+        User.objects.filter(pk=orphan.pk).update(email='Shared@Example.com')
+        out = StringIO()
+        call_command('reconcile_profiles', stdout=out)
+        assert not UserProfile.objects.filter(user=orphan).exists()
+        assert 'Skipped "orphan"' in out.getvalue()
+        assert '0 missing profile(s); 1 conflict(s)' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestPruneTombstones:
+    """Test prune_tombstones management command"""
+
+    def test_deletes_tombstones_past_retention(self, user, settings):
+        """Test only tombstones older than the retention period are deleted"""
+        settings.SYNC_TOMBSTONE_RETENTION_DAYS = 7
+        old, recent = Tombstone.objects.bulk_create([
+            Tombstone(model='task', object_id=1, user=user),
+            Tombstone(model='task', object_id=2, user=user),
+        ])
+        Tombstone.objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=8))
+        out = StringIO()
+        call_command('prune_tombstones', stdout=out)
+        assert list(Tombstone.objects.values_list('object_id', flat=True)) == [2]
+        assert 'Pruned 1 tombstone(s) older than 7 day(s)' in out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBenchmarkReadPath:
+    """Test benchmark_read_path management command"""
+
+    def test_measures_list_and_detail_on_both_handlers(self, user, task):
+        """Test each list and its first item are served by the sync and ASGI handlers"""
+        out = StringIO()
+        call_command(
+            'benchmark_read_path', '--username', user.username, '--requests', '4',
+            '--concurrency', '2', '--path', '/api/tasks/', stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        assert [line.split()[0] for line in lines] == ['/api/tasks/', f'/api/tasks/{task.id}/']
+        assert all('sync' in line and 'asgi' in line for line in lines)
+
+    def test_unknown_user(self):
+        """Test an unknown user is an error"""
+        with pytest.raises(CommandError):
+            call_command('benchmark_read_path', '--username', 'nobody', stdout=StringIO())
@@ -7,7 +7,7 @@ from django.utils import timezone
 from datetime import timedelta
 from api.models import (
     Task, Milestone, Activity, Suggestion, Collection,
-    UserPreferences, Couple, CouplingCode
+    UserPreferences, Couple, CouplingCode, COUPLE_SHARED_MODELS
 )
 
 
@@ -284,3 +284,29 @@ class TestCouplingCode:
         s = str(code)
         assert 'ABC12345' in s
         assert user.username in s
+
+
+@pytest.mark.django_db
+class TestCoupleScopedQuerySet:
+    """Test the for_couple queryset API and its ordering contract"""
+
+    def test_for_couple_single_user(self, user, user2):
+        """Test an uncoupled user only sees their own rows"""
+        own = Task.objects.create(user=user, title='Mine', category='Fun')
+        Task.objects.create(user=user2, title='Theirs', category='Fun')
+        assert list(Task.objects.for_couple(user)) == [own]
+
+    def test_for_couple_includes_partner(self, user, user2, couple):
+        """Test a coupled user sees both partners' rows, newest first"""
+        first = Task.objects.create(user=user, title='Mine', category='Fun')
+        second = Task.objects.create(user=user2, title='Theirs', category='Fun')
+        assert list(Task.objects.for_couple(user)) == [second, first]
+        assert list(Task.objects.for_couple(user2.id)) == [second, first]
+
+    @pytest.mark.parametrize('model', COUPLE_SHARED_MODELS)
+    def test_ordering_is_covered_by_indexes(self, model):
+        """Test every shared model has (couple, *ordering) and (user, *ordering) indexes"""
+        ordering = list(model._meta.ordering)
+        index_fields = [list(index.fields) for index in model._meta.indexes]
+        assert ['couple', *ordering] in index_fields
+        assert ['user', *ordering] in index_fields
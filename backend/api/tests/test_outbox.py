@@ -0,0 +1,149 @@
+"""
+Tests for the transactional outbox and its dispatcher
+"""
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import OutboxEvent
+from api.outbox import dispatch_batch, outbox_stats, purge_dispatched
+from api.realtime import publish, user_group
+from api.tests.test_realtime import channel_layer, join, received  # noqa: F401 (fixture)
+
+
+@pytest.fixture
+def outbox(settings, channel_layer):
+    settings.REALTIME_OUTBOX = True
+    settings.REALTIME_OUTBOX_MAX_ATTEMPTS = 3
+    return channel_layer
+
+
+def fail_group(mocker, layer, failing):
+    """Make sends to one group raise, others go through"""
+    send = layer.group_send
+
+    async def group_send(group, message):
+        if group == failing:
+            raise ConnectionError('channel layer down')
+        return await send(group, message)
+    return mocker.patch.object(layer, 'group_send', side_effect=group_send)
+
+
+@pytest.mark.django_db
+class TestOutboxWrites:
+    """Test events are written with the change instead of being sent"""
+
+    def test_event_written_not_sent(self, outbox, django_capture_on_commit_callbacks):
+        """Test publishing stores the event and sends nothing from the request"""
+        channel = join(outbox, user_group(1))
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            publish([user_group(1), user_group(1)], 'task:created', {'id': 1})
+        assert callbacks == []
+        assert received(outbox, channel) == []
+        event = OutboxEvent.objects.get()
+        assert event.groups == [user_group(1)]
+        assert event.message['type'] == 'send_encoded'
+
+    def test_rolled_back_event_is_dropped(self, outbox):
+        """Test the event goes away with a rolled-back change"""
+        with transaction.atomic():
+            publish([user_group(1)], 'task:created', {'id': 1})
+            transaction.set_rollback(True)
+        assert not OutboxEvent.objects.exists()
+
+    def test_api_writes_go_through_the_outbox(self, outbox, user):
+        """Test a write request leaves its event in the outbox"""
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.post('/api/tasks/', {'title': 'Outbox', 'category': 'Fun'}, format='json')
+        assert response.status_code == 201
+        assert OutboxEvent.objects.filter(groups=[user_group(user.id)]).count() == 1
+
+
+@pytest.mark.django_db
+class TestDispatch:
+    """Test the dispatcher sends, retries and reports"""
+
+    def test_sends_and_marks_dispatched(self, outbox):
+        """Test due events reach their groups once and are marked dispatched"""
+        channel = join(outbox, user_group(1))
+        publish([user_group(1)], 'task:created', {'id': 1})
+        publish([user_group(1)], 'task:created', {'id': 1})
+        publish([user_group(1)], 'task:updated', {'id': 1})
+        assert dispatch_batch() == (3, 0)
+        assert [m['event'] for m in received(outbox, channel)] == ['task:created', 'task:updated']
+        assert not OutboxEvent.objects.filter(dispatched_at__isnull=True).exists()
+        assert dispatch_batch() == (0, 0)
+
+    def test_retries_only_the_groups_missed(self, outbox, mocker):
+        """Test a partial failure is retried later, to the failed group only"""
+        reached, missed = join(outbox, user_group(1)), join(outbox, user_group(2))
+        publish([user_group(1), user_group(2)], 'task:created', {'id': 1})
+        fail_group(mocker, outbox, user_group(2))
+
+        assert dispatch_batch() == (0, 1)
+        event = OutboxEvent.objects.get()
+        assert (event.groups, event.attempts) == ([user_group(2)], 1)
+        assert 'channel layer down' in event.last_error
+        assert event.available_at > timezone.now()
+        # Held back until the backoff has passed
+        assert dispatch_batch() == (0, 0)
+
+        mocker.stopall()
+        OutboxEvent.objects.update(available_at=timezone.now())
+        assert dispatch_batch() == (1, 0)
+        assert len(received(outbox, reached)) == 1
+        assert len(received(outbox, missed)) == 1
+
+    def test_gives_up_after_max_attempts(self, outbox, mocker):
+        """Test an event failing every attempt is left dead and reported"""
+        publish([user_group(1)], 'task:created', {'id': 1})
+        fail_group(mocker, outbox, user_group(1))
+        for _ in range(3):
+            OutboxEvent.objects.update(available_at=timezone.now())
+            assert dispatch_batch() == (0, 1)
+        OutboxEvent.objects.update(available_at=timezone.now())
+        assert dispatch_batch() == (0, 0)
+        assert outbox_stats() == {'pending': 1, 'dead': 1, 'lag_seconds': 0}
+
+    def test_stats_lag(self, outbox):
+        """Test the lag is the age of the oldest pending event"""
+        publish([user_group(1)], 'task:created', {'id': 1})
+        OutboxEvent.objects.update(created_at=timezone.now() - timedelta(seconds=30))
+        stats = outbox_stats()
+        assert (stats['pending'], stats['dead']) == (1, 0)
+        assert 30 <= stats['lag_seconds'] < 40
+
+    def test_purge_keeps_pending_and_recent(self, outbox):
+        """Test only events dispatched before the cutoff are deleted"""
+        for i in range(3):
+            publish([user_group(1)], 'task:created', {'id': i})
+        old, recent, pending = OutboxEvent.objects.all()
+        OutboxEvent.objects.filter(pk=old.pk).update(dispatched_at=timezone.now() - timedelta(days=2))
+        OutboxEvent.objects.filter(pk=recent.pk).update(dispatched_at=timezone.now())
+        assert purge_dispatched(timezone.now() - timedelta(days=1)) == 1
+        assert set(OutboxEvent.objects.values_list('pk', flat=True)) == {recent.pk, pending.pk}
+
+    def test_command_drains_once(self, outbox):
+        """Test dispatch_outbox --once sends everything due and reports the backlog"""
+        channel = join(outbox, user_group(1))
+        for i in range(5):
+            publish([user_group(1)], 'task:created', {'id': i})
+        out = StringIO()
+        call_command('dispatch_outbox', '--once', '--batch-size', '2', stdout=out)
+        assert len(received(outbox, channel)) == 5
+        assert 'Outbox: 5 dispatched, 0 failed attempt(s); 0 pending (0 dead), lag 0s' in out.getvalue()
+
+    def test_realtime_stats_include_outbox(self, outbox, user):
+        """Test staff see the outbox backlog next to the connection counters"""
+        user.is_staff = True
+        user.save()
+        publish([user_group(1)], 'task:created', {'id': 1})
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/realtime/stats/')
+        assert response.data['outbox']['pending'] == 1
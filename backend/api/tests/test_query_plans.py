@@ -0,0 +1,340 @@
+"""
+Query plan regression suite for every API route.
+
+Seeds a realistic dataset, calls each route registered in api/urls.py and
+runs EXPLAIN on every SQL statement it issued. Fails when a query on a large
+table falls back to a full scan or a sort the indexes should have served.
+The same route cases are checked against the budgets their views declare
+(see api/budgets.py).
+"""
+import pytest
+from datetime import date, timedelta
+from importlib import import_module
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from rest_framework.views import APIView
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+import api.urls
+from api.budgets import budget_for
+from api.models import (
+    Task, Milestone, Activity, Suggestion, Collection, Memory, UserPreferences,
+    Couple, CouplingCode, DailyConnection, DailyConnectionAnswer, InboxItem
+)
+from api.pagination import DateFeedPagination, FeedPagination
+from api.tests.query_plans import is_explainable, plan_violations
+
+PASSWORD = 'PlanCheck123!'
+ROWS_PER_USER = {
+    Task: 200,
+    Milestone: 60,
+    Activity: 300,
+    Suggestion: 80,
+    Collection: 30,
+    Memory: 120,
+}
+DAYS_OF_CONNECTIONS = 90
+
+# (url name, client, method, path, payload); paths are formatted with seeded ids
+ROUTE_CASES = [
+    ('api-root', 'member', 'get', '/api/', None),
+    ('task-list', 'member', 'get', '/api/tasks/', None),
+    ('task-list', 'member', 'get', '/api/tasks/?count=false&page=2', None),
+    ('task-list', 'member', 'get', '/api/tasks/?count=cached', None),
+    ('task-list', 'member', 'post', '/api/tasks/', {'title': 'Plan check', 'category': 'Fun'}),
+    ('task-bulk', 'member', 'post', '/api/tasks/bulk/', {
+        'create': [{'title': 'Plan check', 'category': 'Fun'}],
+        'update': [{'id': '{task}', 'status': 'Upcoming'}],
+    }),
+    ('task-detail', 'member', 'get', '/api/tasks/{task}/', None),
+    ('task-detail', 'member', 'patch', '/api/tasks/{task}/', {'status': 'Planning'}),
+    ('task-detail', 'member', 'delete', '/api/tasks/{task}/', None),
+    ('milestone-list', 'member', 'get', '/api/milestones/', None),
+    ('milestone-list', 'member', 'post', '/api/milestones/', {'name': 'Trip', 'date': '2025', 'status': 'Upcoming', 'icon': 'star'}),
+    ('milestone-detail', 'member', 'get', '/api/milestones/{milestone}/', None),
+    ('milestone-detail', 'member', 'patch', '/api/milestones/{milestone}/', {'status': 'Completed'}),
+    ('milestone-detail', 'member', 'delete', '/api/milestones/{milestone}/', None),
+    ('activity-list', 'member', 'get', '/api/activities/', None),
+    ('activity-list', 'member', 'get', '/api/activities/?cursor={activity_cursor}', None),
+    ('activity-list', 'member', 'post', '/api/activities/', {'user': 'Sam', 'action': 'added', 'item': 'Plan', 'timestamp': 'Just now', 'avatar': 'a'}),
+    ('activity-detail', 'member', 'get', '/api/activities/{activity}/', None),
+    ('suggestion-list', 'member', 'get', '/api/suggestions/', None),
+    ('suggestion-list', 'member', 'post', '/api/suggestions/', {'title': 'Picnic', 'suggested_by': 'Sam', 'date': 'Today', 'description': 'Park', 'location': 'Park', 'category': 'Fun'}),
+    ('suggestion-detail', 'member', 'get', '/api/suggestions/{suggestion}/', None),
+    ('suggestion-detail', 'member', 'delete', '/api/suggestions/{suggestion}/', None),
+    ('collection-list', 'member', 'get', '/api/collections/', None),
+    ('collection-list', 'member', 'post', '/api/collections/', {'name': 'Ideas', 'icon': 'star'}),
+    ('collection-detail', 'member', 'get', '/api/collections/{collection}/', None),
+    ('collection-detail', 'member', 'patch', '/api/collections/{collection}/', {'name': 'Renamed'}),
+    ('collection-detail', 'member', 'delete', '/api/collections/{collection}/', None),
+    ('memory-list', 'member', 'get', '/api/memories/', None),
+    ('memory-list', 'member', 'get', '/api/memories/?cursor={memory_cursor}', None),
+    ('memory-list', 'member', 'post', '/api/memories/', {'title': 'Beach', 'date': '2024-07-01'}),
+    ('memory-detail', 'member', 'get', '/api/memories/{memory}/', None),
+    ('memory-detail', 'member', 'patch', '/api/memories/{memory}/', {'title': 'Lake'}),
+    ('memory-detail', 'member', 'delete', '/api/memories/{memory}/', None),
+    ('memory-toggle-favorite', 'member', 'post', '/api/memories/{memory}/toggle_favorite/', None),
+    ('preferences-list', 'member', 'get', '/api/preferences/', None),
+    ('preferences-detail', 'member', 'get', '/api/preferences/{preferences}/', None),
+    ('preferences-detail', 'member', 'patch', '/api/preferences/{preferences}/', {'anniversary': '2024-02-14'}),
+    ('user-list', 'member', 'get', '/api/users/', None),
+    ('user-detail', 'member', 'get', '/api/users/{member}/', None),
+    ('user-me', 'member', 'get', '/api/users/me/', None),
+    ('user-me', 'member', 'put', '/api/users/me/', {'first_name': 'Plan'}),
+    ('user-change-password', 'member', 'post', '/api/users/change_password/', {'current_password': PASSWORD, 'new_password': 'Changed123!', 'new_password_confirm': 'Changed123!'}),
+    ('user-delete-account', 'member', 'post', '/api/users/delete_account/', {'password': PASSWORD}),
+    ('register-list', 'anonymous', 'post', '/api/register/', {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'Welcome123!', 'password_confirm': 'Welcome123!', 'coupling_code': '{code}'}),
+    ('couple-list', 'member', 'get', '/api/couple/', None),
+    ('couple-detail', 'member', 'get', '/api/couple/{couple}/', None),
+    ('couple-uncouple', 'member', 'delete', '/api/couple/uncouple/', None),
+    ('coupling-code-list', 'single', 'get', '/api/coupling-codes/', None),
+    ('coupling-code-list', 'single', 'post', '/api/coupling-codes/', None),
+    ('coupling-code-detail', 'single', 'get', '/api/coupling-codes/{code_id}/', None),
+    ('coupling-code-use', 'other_single', 'post', '/api/coupling-codes/use/', {'code': '{code}'}),
+    ('daily-connection-list', 'member', 'get', '/api/daily-connections/', None),
+    ('daily-connection-list', 'member', 'get', '/api/daily-connections/?cursor={connection_cursor}', None),
+    ('daily-connection-today', 'member', 'get', '/api/daily-connections/today/', None),
+    ('daily-connection-detail', 'member', 'get', '/api/daily-connections/{connection}/', None),
+    ('daily-connection-answer', 'member', 'post', '/api/daily-connections/{connection}/answer/', {'answer_text': 'You make me laugh'}),
+    ('inbox-list', 'member', 'get', '/api/inbox/', None),
+    ('inbox-list', 'member', 'get', '/api/inbox/?cursor={inbox_cursor}', None),
+    ('inbox-unread', 'member', 'get', '/api/inbox/unread/', None),
+    ('inbox-unread', 'member', 'get', '/api/inbox/unread/?cursor={inbox_cursor}', None),
+    ('inbox-counts', 'member', 'get', '/api/inbox/counts/', None),
+    ('inbox-mark-all-as-read', 'member', 'post', '/api/inbox/mark_all_as_read/', None),
+    ('inbox-detail', 'member', 'get', '/api/inbox/{inbox}/', None),
+    ('inbox-mark-as-read', 'member', 'post', '/api/inbox/{inbox}/mark_as_read/', None),
+    ('inbox-react', 'member', 'post', '/api/inbox/{inbox}/react/', None),
+    ('inbox-share-response', 'member', 'post', '/api/inbox/{inbox}/share_response/', {'response': 'Aww'}),
+    ('auth-logout', 'member', 'post', '/api/auth/logout/', None),
+    ('bootstrap', 'member', 'get', '/api/bootstrap/', None),
+    ('bootstrap', 'single', 'get', '/api/bootstrap/', None),
+    ('batch', 'member', 'post', '/api/batch/', {'atomic': True, 'requests': [
+        {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'Plan check', 'category': 'Fun'}},
+        {'method': 'POST', 'path': '/api/inbox/{inbox}/mark_as_read/'},
+        {'method': 'GET', 'path': '/api/tasks/'},
+    ]}),
+    ('sync', 'member', 'get', '/api/sync/', None),
+    ('sync', 'member', 'get', '/api/sync/?since=2024-01-01T00:00:00Z', None),
+    ('sync', 'single', 'get', '/api/sync/?since=2024-01-01T00:00:00Z', None),
+    ('realtime-stats', 'staff', 'get', '/api/realtime/stats/', None),
+    ('database-stats', 'staff', 'get', '/api/database/stats/', None),
+    ('ai-plan-date', 'member', 'get', '/api/ai/plan-date/', None),
+    ('ai-pro-tip', 'member', 'get', '/api/ai/pro-tip/', None),
+    ('ai-daily-prompt', 'member', 'get', '/api/ai/daily-prompt/', None),
+]
+
+
+def registered_routes(patterns=None):
+    """Yield every route registered in api/urls.py"""
+    for pattern in api.urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            yield from registered_routes(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def registered_route_names():
+    """Collect the names of every route registered in api/urls.py"""
+    return {pattern.name for pattern in registered_routes() if pattern.name}
+
+
+def registered_view_actions():
+    """Collect the ``(view class, action)`` pairs every route dispatches to"""
+    view_actions = set()
+    for pattern in registered_routes():
+        callback = pattern.callback
+        if actions := getattr(callback, 'actions', None):
+            view_actions |= {(callback.cls, action) for action in actions.values()}
+        else:
+            view_class = callback.view_class
+            view_actions |= {
+                (view_class, method) for method in view_class.http_method_names
+                if hasattr(view_class, method) and not hasattr(APIView, method)
+            }
+    return view_actions
+
+
+def make_user(username):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password=PASSWORD)
+
+
+def seed_content(user, couple):
+    """Bulk-create a realistic amount of shared content for one user"""
+    for model, count in ROWS_PER_USER.items():
+        rows = []
+        for i in range(count):
+            if model is Task:
+                rows.append(Task(user=user, couple=couple, title=f'Task {i}', category='Fun', status=['Backlog', 'Planning', 'Upcoming', 'Completed'][i % 4]))
+            elif model is Milestone:
+                rows.append(Milestone(user=user, couple=couple, name=f'Milestone {i}', date='2025', icon='star'))
+            elif model is Activity:
+                rows.append(Activity(user=user, couple=couple, activity_user=user.username, action='added', item=f'Item {i}', timestamp='Just now', avatar='a'))
+            elif model is Suggestion:
+                rows.append(Suggestion(user=user, couple=couple, title=f'Idea {i}', suggested_by=user.username, date='Today', description='', location='', category='Fun'))
+            elif model is Collection:
+                rows.append(Collection(user=user, couple=couple, name=f'Collection {i}', icon='star'))
+            elif model is Memory:
+                rows.append(Memory(user=user, couple=couple, title=f'Memory {i}', date=date(2023, 1, 1) + timedelta(days=i)))
+        model.objects.bulk_create(rows)
+
+
+def seed_couple(prefix):
+    """Create a couple with content, daily connections and inbox items"""
+    user1, user2 = make_user(f'{prefix}_one'), make_user(f'{prefix}_two')
+    couple = Couple.objects.create(user1=user1, user2=user2)
+    for user in (user1, user2):
+        seed_content(user, couple)
+
+    today = date.today()
+    connections = DailyConnection.objects.bulk_create([
+        DailyConnection(couple=couple, date=today - timedelta(days=day), prompt=f'Prompt {day}')
+        for day in range(1, DAYS_OF_CONNECTIONS + 1)
+    ])
+    answers = DailyConnectionAnswer.objects.bulk_create([
+        DailyConnectionAnswer(connection=connection, user=user, answer_text='Answer')
+        for connection in connections for user in (user1, user2)
+    ])
+    InboxItem.objects.bulk_create([
+        InboxItem(
+            recipient=user1 if answer.user_id == user2.id else user2,
+            sender_id=answer.user_id,
+            item_type='connection_answer',
+            title='Answer shared',
+            connection_answer=answer,
+            is_read=i % 3 == 0,
+        )
+        for i, answer in enumerate(answers)
+    ])
+    return user1, user2, couple
+
+
+def apply_raw_sql_indexes():
+    """
+    Create the indexes that migrations add with RunSQL; the suite runs with
+    --nomigrations, which builds tables from the models alone.
+    """
+    migration = import_module('api.migrations.0016_user_lower_lookup_indexes').Migration
+    with connection.cursor() as cursor:
+        for operation in migration.operations:
+            cursor.execute(operation.sql)
+
+
+@pytest.fixture
+def dataset(db, settings):
+    """Two populated couples plus two single users"""
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    apply_raw_sql_indexes()
+    member, partner, couple = seed_couple('member')
+    seed_couple('neighbour')
+    single, other_single = make_user('single'), make_user('other_single')
+    code = CouplingCode.objects.create(
+        created_by=single, code='PLANCODE', expires_at=timezone.now() + timedelta(hours=24)
+    )
+    preferences = UserPreferences.objects.create(user=member)
+
+    staff = make_user('staff')
+    staff.is_staff = True
+    staff.save(update_fields=['is_staff'])
+
+    users = {'member': member, 'single': single, 'other_single': other_single, 'staff': staff, 'anonymous': None}
+    ids = {
+        'member': member.id,
+        'couple': couple.id,
+        'task': Task.objects.filter(user=partner).first().id,
+        'milestone': Milestone.objects.filter(user=partner).first().id,
+        'activity': Activity.objects.filter(user=partner).first().id,
+        'suggestion': Suggestion.objects.filter(user=partner).first().id,
+        'collection': Collection.objects.filter(user=partner).first().id,
+        'memory': Memory.objects.filter(user=partner).first().id,
+        'preferences': preferences.id,
+        'connection': DailyConnection.objects.filter(couple=couple).first().id,
+        'inbox': InboxItem.objects.filter(recipient=member, is_read=False).first().id,
+        'code': code.code,
+        'code_id': code.id,
+    }
+    # Keyset positions in the middle of each feed
+    feed, dated = FeedPagination(), DateFeedPagination()
+    ids.update({
+        'activity_cursor': feed.encode_cursor(Activity.objects.filter(couple=couple)[100]),
+        'inbox_cursor': feed.encode_cursor(InboxItem.objects.filter(recipient=member)[40]),
+        'memory_cursor': dated.encode_cursor(Memory.objects.filter(couple=couple)[100]),
+        'connection_cursor': dated.encode_cursor(DailyConnection.objects.filter(couple=couple)[40]),
+    })
+    return users, ids
+
+
+def format_payload(payload, ids):
+    if isinstance(payload, dict):
+        return {key: format_payload(value, ids) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [format_payload(value, ids) for value in payload]
+    return payload.format(**ids) if isinstance(payload, str) else payload
+
+
+def test_every_route_has_a_plan_case():
+    """Test new routes cannot ship without a query plan case"""
+    covered = {name for name, *_ in ROUTE_CASES}
+    assert registered_route_names() - covered == set()
+
+
+@pytest.mark.django_db
+def test_route_query_plans(dataset):
+    """Test no route issues a full scan or an unindexed sort on a large table"""
+    users, ids = dataset
+    failures = []
+
+    for name, client_name, method, path, payload in ROUTE_CASES:
+        client = APIClient()
+        if users[client_name] is not None:
+            # Fresh instance per case: views mutate request.user (e.g. set_password)
+            client.force_authenticate(user=User.objects.get(pk=users[client_name].pk))
+        url = path.format(**ids)
+
+        # Each case runs in a savepoint that is rolled back so cases stay independent
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, method)(url, format_payload(payload, ids), format='json')
+            assert response.status_code < 400, f'{method.upper()} {url} -> {response.status_code}: {response.data}'
+
+            for query in captured.captured_queries:
+                if is_explainable(query['sql']):
+                    failures.extend(
+                        f'{method.upper()} {url} [{name}]: {violation}\n    {query["sql"]}'
+                        for violation in plan_violations(query['sql'])
+                    )
+            transaction.set_rollback(True)
+        cache.clear()
+
+    assert not failures, 'Query plan regressions:\n' + '\n'.join(failures)
+
+
+def test_every_view_action_has_a_budget():
+    """Test new views and actions cannot ship without a declared budget"""
+    missing = [
+        f'{view_class.__name__}.{action}' for view_class, action in registered_view_actions()
+        if budget_for(view_class, action) is None
+    ]
+    assert not missing, f'No budget declared for: {", ".join(sorted(missing))}'
+
+
+def test_route_budgets(dataset, assert_within_budget):
+    """Test every route case stays within the budget of its view action"""
+    users, ids = dataset
+
+    for name, client_name, method, path, payload in ROUTE_CASES:
+        client = APIClient()
+        if users[client_name] is not None:
+            client.force_authenticate(user=User.objects.get(pk=users[client_name].pk))
+        url = path.format(**ids)
+
+        with transaction.atomic():
+            with assert_within_budget(method, url):
+                response = getattr(client, method)(url, format_payload(payload, ids), format='json')
+            assert response.status_code < 400, f'{method.upper()} {url} -> {response.status_code}: {response.data}'
+            transaction.set_rollback(True)
+        cache.clear()
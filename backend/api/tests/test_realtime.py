@@ -0,0 +1,206 @@
+"""
+Tests for transaction-aware, coalesced WebSocket event dispatch
+"""
+import asyncio
+import json
+import time
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from channels.layers import get_channel_layer
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+
+from api import realtime
+from api.realtime import BroadcastBufferMiddleware, EventLog, couple_group, encode_event, publish, user_group
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """Use in-memory channel layer for tests"""
+    settings.CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+    return get_channel_layer()
+
+
+def join(channel_layer, group):
+    """Subscribe a fresh channel to a group and return its name"""
+    channel = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(group, channel)
+    return channel
+
+
+def received(channel_layer, channel):
+    """Drain every frame currently queued for a channel, decoded"""
+    async def drain():
+        messages = []
+        while True:
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), 0.05)
+                messages.append(json.loads(message['text']))
+            except asyncio.TimeoutError:
+                return messages
+    return async_to_sync(drain)()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPublish:
+    """Test events are released only for committed transactions"""
+
+    def test_sent_after_commit(self, channel_layer):
+        """Test an event is held back until its transaction commits"""
+        channel = join(channel_layer, user_group(1))
+        with transaction.atomic():
+            publish([user_group(1)], 'task:created', {'id': 1})
+            assert received(channel_layer, channel) == []
+        messages = received(channel_layer, channel)
+        assert [m['event'] for m in messages] == ['task:created']
+        assert messages[0]['data'] == {'id': 1}
+
+    def test_rolled_back_event_is_dropped(self, channel_layer):
+        """Test a rolled-back write never reaches a client"""
+        channel = join(channel_layer, user_group(1))
+        with transaction.atomic():
+            publish([user_group(1)], 'task:created', {'id': 1})
+            transaction.set_rollback(True)
+        assert received(channel_layer, channel) == []
+
+    def test_request_events_flushed_once_and_deduplicated(self, channel_layer, mocker):
+        """Test a request's events go out in one flush with duplicates removed"""
+        own, partner = join(channel_layer, user_group(1)), join(channel_layer, user_group(2))
+        flush = mocker.spy(realtime, 'send_group_messages')
+
+        def view(request):
+            publish([user_group(1), user_group(2)], 'inbox:updated', {'id': 5})
+            publish([user_group(1), user_group(2)], 'inbox:updated', {'id': 5})
+            publish([user_group(1)], 'inbox:deleted', {'id': 6})
+            assert flush.call_count == 0
+            return HttpResponse()
+
+        BroadcastBufferMiddleware(view)(RequestFactory().post('/api/inbox/mark_all_as_read/'))
+
+        assert flush.call_count == 1
+        assert len(flush.call_args.args[0]) == 3
+        assert [m['event'] for m in received(channel_layer, own)] == ['inbox:updated', 'inbox:deleted']
+        assert [m['event'] for m in received(channel_layer, partner)] == ['inbox:updated']
+
+    def test_async_request_flush_awaited_on_event_loop(self, channel_layer, mocker):
+        """Test under ASGI the events of a sync view are flushed without async_to_sync"""
+        own = join(channel_layer, user_group(1))
+        sync_flush = mocker.spy(realtime, 'send_group_messages')
+
+        def view(request):
+            publish([user_group(1)], 'task:created', {'id': 1})
+            publish([user_group(1)], 'task:created', {'id': 1})
+            return HttpResponse()
+
+        middleware = BroadcastBufferMiddleware(sync_to_async(view))
+        assert iscoroutinefunction(middleware)
+        async_to_sync(middleware)(RequestFactory().post('/api/tasks/'))
+
+        assert sync_flush.call_count == 0
+        assert [m['event'] for m in received(channel_layer, own)] == ['task:created']
+
+
+class TestEventLog:
+    """Test the replay ring's storage"""
+
+    def append(self, stream, count):
+        return [EventLog.append(stream, encode_event('task:updated', {'n': n})) for n in range(count)]
+
+    def test_ring_leaves_default_cache_alone(self, settings):
+        """Test a full ring neither evicts other cached state nor loses its own frames"""
+        cache.set('couple_context:1', (7, 2))
+        position = async_to_sync(EventLog.position)('user_1')
+        frames = self.append('user_1', settings.WEBSOCKET_REPLAY_BUFFER_SIZE)
+        assert cache.get('couple_context:1') == (7, 2)
+        assert async_to_sync(EventLog.since)('user_1', position) == frames
+
+    def test_frames_and_idle_counters_expire(self, settings):
+        """Test nothing of a stream is kept past the replay TTL"""
+        settings.WEBSOCKET_REPLAY_TTL = 0.1
+        seqs = [json.loads(frame)['seq'] for frame in self.append('user_1', 3)]
+        time.sleep(0.15)
+        keys = [EventLog._seq_key('user_1')] + [EventLog._slot_key('user_1', seq) for seq in seqs]
+        assert caches[settings.REPLAY_CACHE].get_many(keys) == {}
+
+    def test_touch_keeps_counter_of_live_stream(self, settings):
+        """Test a stream whose sockets refresh it keeps its position past the TTL"""
+        settings.WEBSOCKET_REPLAY_TTL = 0.1
+        position = async_to_sync(EventLog.position)('user_1')
+        for _ in range(3):
+            time.sleep(0.05)
+            async_to_sync(EventLog.touch)(['user_1'])
+        assert async_to_sync(EventLog.position)('user_1') == position
+
+
+def test_sends_to_one_group_keep_their_order(mocker):
+    """Test a group's sends go out one after another while other groups run alongside"""
+    sent = []
+
+    async def group_send(group, message):
+        # The first event of a group is the slowest to send
+        await asyncio.sleep(0.02 if message['text'].endswith('1') else 0)
+        sent.append((group, message['text']))
+
+    layer = mocker.Mock(group_send=group_send)
+    sends = [
+        (user_group(1), {'type': 'send_encoded', 'text': 'created 1'}),
+        (user_group(2), {'type': 'send_encoded', 'text': 'created 3'}),
+        (user_group(1), {'type': 'send_encoded', 'text': 'updated 2'}),
+    ]
+    assert async_to_sync(realtime._send_concurrently)(layer, sends) == [None, None, None]
+    assert [text for group, text in sent if group == user_group(1)] == ['created 1', 'updated 2']
+    assert sent[0] == (user_group(2), 'created 3')
+
+
+@pytest.mark.django_db
+def test_view_broadcast_sent_once_to_couple_group(channel_layer, user, user2, couple, django_capture_on_commit_callbacks):
+    """Test a shared mutation is published once, on the couple group"""
+    shared = join(channel_layer, couple_group(couple.id))
+    own, partner = join(channel_layer, user_group(user.id)), join(channel_layer, user_group(user2.id))
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post('/api/tasks/', {'title': 'Shared', 'category': 'Fun'})
+        assert received(channel_layer, shared) == []
+
+    assert response.status_code == 201
+    messages = received(channel_layer, shared)
+    assert [m['event'] for m in messages] == ['task:created']
+    assert messages[0]['data']['title'] == 'Shared'
+    assert received(channel_layer, own) == received(channel_layer, partner) == []
+
+
+@pytest.mark.django_db
+def test_single_user_broadcast_uses_user_group(channel_layer, user, django_capture_on_commit_callbacks):
+    """Test an uncoupled user's events go to their own group"""
+    own = join(channel_layer, user_group(user.id))
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post('/api/tasks/', {'title': 'Solo', 'category': 'Fun'})
+
+    assert [m['event'] for m in received(channel_layer, own)] == ['task:created']
+
+
+@pytest.mark.django_db
+def test_broadcast_reuses_response_and_is_encoded_once(channel_layer, user, django_capture_on_commit_callbacks, mocker):
+    """Test the broadcast carries the response body, pre-encoded once"""
+    own = join(channel_layer, user_group(user.id))
+    encode = mocker.spy(realtime, 'encode_event')
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post('/api/tasks/', {'title': 'Solo', 'category': 'Fun'})
+
+    assert encode.call_count == 1
+    assert received(channel_layer, own)[0]['data'] == response.json()
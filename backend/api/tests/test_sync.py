@@ -0,0 +1,155 @@
+"""
+Tests for the delta sync endpoint and deletion tombstones
+"""
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.models import Couple, InboxItem, Memory, Milestone, Task, Tombstone
+
+
+def age(*querysets):
+    """Move rows (and any tombstones) an hour into the past"""
+    an_hour_ago = timezone.now() - timedelta(hours=1)
+    for queryset in querysets:
+        queryset.update(updated_at=an_hour_ago)
+    Tombstone.objects.update(deleted_at=an_hour_ago)
+
+
+def cursor(minutes_ago=30):
+    return (timezone.now() - timedelta(minutes=minutes_ago)).isoformat()
+
+
+@pytest.mark.django_db
+class TestTombstones:
+    """Test deleted rows are recorded"""
+
+    def test_view_delete_records_tombstone(self, client_for, user, couple, task):
+        """Test deleting through the API leaves a tombstone on the couple"""
+        response = client_for(user).delete(f'/api/tasks/{task.id}/')
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        tombstone = Tombstone.objects.get()
+        assert (tombstone.model, tombstone.object_id) == ('task', task.id)
+        assert (tombstone.user_id, tombstone.couple_id) == (user.id, couple.id)
+
+    def test_cascade_delete_records_tombstones(self, user, task, milestone):
+        """Test rows removed with their owner's account are recorded too"""
+        user.delete()
+        assert set(Tombstone.objects.values_list('model', flat=True)) == {'task', 'milestone'}
+
+    def test_uncouple_records_couple_tombstone_per_partner(self, client_for, user, user2, couple):
+        """Test dissolving a couple is recorded for both partners"""
+        couple_id = couple.id
+        response = client_for(user).delete('/api/couple/uncouple/')
+        assert response.status_code == status.HTTP_200_OK
+        assert set(Tombstone.objects.values_list('model', 'object_id', 'user_id')) == {
+            ('couple', couple_id, user.id), ('couple', couple_id, user2.id)
+        }
+
+    def test_inbox_tombstone_belongs_to_recipient(self, user, user2):
+        """Test inbox deletions are recorded for the recipient"""
+        item = InboxItem.objects.create(recipient=user, sender=user2, item_type='message', title='Hi')
+        item.delete()
+        assert Tombstone.objects.get(model='inboxitem').user_id == user.id
+
+
+@pytest.mark.django_db
+class TestSyncView:
+    """Test /api/sync/"""
+
+    def test_requires_authentication(self):
+        """Test anonymous clients cannot sync"""
+        assert APIClient().get('/api/sync/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_full_sync_without_cursor(self, client_for, user, user2, couple, task, milestone):
+        """Test a first sync returns every visible row and a cursor"""
+        Task.objects.create(user=user2, title='Partner task', category='Fun')
+        response = client_for(user).get('/api/sync/')
+        assert response.status_code == status.HTTP_200_OK
+        assert {t['title'] for t in response.data['changes']['tasks']} == {'Test Task', 'Partner task'}
+        assert [m['name'] for m in response.data['changes']['milestones']] == ['Test Milestone']
+        assert response.data['deleted']['tasks'] == []
+        assert response.data['cursor']
+        assert response.data['full_sync'] is True
+
+    def test_returns_only_changes_since_cursor(self, client_for, user, user2, couple, task, milestone):
+        """Test rows untouched since the cursor are left out"""
+        age(Task.objects.all(), Milestone.objects.all())
+        partner_task = Task.objects.create(user=user2, title='New from partner', category='Fun')
+        milestone.status = 'Completed'
+        milestone.save()
+
+        response = client_for(user).get('/api/sync/', {'since': cursor()})
+        assert response.status_code == status.HTTP_200_OK
+        assert [t['id'] for t in response.data['changes']['tasks']] == [str(partner_task.id)]
+        assert [m['status'] for m in response.data['changes']['milestones']] == ['Completed']
+        assert response.data['changes']['memories'] == []
+        assert response.data['full_sync'] is False
+
+    def test_reports_deletions_since_cursor(self, client_for, user, user2, couple, task):
+        """Test rows deleted by either partner come back as tombstones"""
+        old = Task.objects.create(user=user2, title='Deleted long ago', category='Fun')
+        old.delete()
+        age(Task.objects.all())
+        client_for(user2).delete(f'/api/tasks/{task.id}/')
+        item = InboxItem.objects.create(recipient=user, sender=user2, item_type='message', title='Hi')
+        item_id = item.id
+        item.delete()
+
+        response = client_for(user).get('/api/sync/', {'since': cursor()})
+        assert response.data['deleted']['tasks'] == [task.id]
+        assert response.data['deleted']['inbox'] == [item_id]
+        assert response.data['changes']['tasks'] == []
+
+    def test_other_users_rows_are_not_synced(self, client_for, user, user2, task):
+        """Test an uncoupled user sees neither content nor deletions of others"""
+        Task.objects.create(user=user2, title='Not yours', category='Fun').delete()
+        Memory.objects.create(user=user2, title='Private', date='2024-01-01')
+
+        response = client_for(user).get('/api/sync/', {'since': cursor()})
+        assert [t['title'] for t in response.data['changes']['tasks']] == ['Test Task']
+        assert response.data['changes']['memories'] == []
+        assert response.data['deleted']['tasks'] == []
+
+    def test_coupling_brings_partner_rows_into_next_sync(self, client_for, user, user2, task):
+        """Test content linked to a new couple shows up as changed"""
+        Task.objects.create(user=user2, title='Partner task', category='Fun')
+        age(Task.objects.all())
+        client = client_for(user)
+        since = cursor()
+        assert client.get('/api/sync/', {'since': since}).data['changes']['tasks'] == []
+
+        Couple.objects.create(user1=user, user2=user2)
+        tasks = client.get('/api/sync/', {'since': since}).data['changes']['tasks']
+        assert {t['title'] for t in tasks} == {'Test Task', 'Partner task'}
+
+    def test_cursor_older_than_retention_gets_full_sync(self, client_for, user, task, settings):
+        """Test a cursor from before the pruned tombstones gets every row instead of a delta"""
+        settings.SYNC_TOMBSTONE_RETENTION_DAYS = 1
+        age(Task.objects.all())
+        response = client_for(user).get('/api/sync/', {'since': cursor(minutes_ago=2 * 24 * 60)})
+        assert response.data['full_sync'] is True
+        assert [t['title'] for t in response.data['changes']['tasks']] == ['Test Task']
+
+    def test_uncoupling_gets_full_sync(self, client_for, user, user2, couple, task):
+        """Test partner rows that left the scope are dropped through a full sync"""
+        Task.objects.create(user=user2, title='Partner task', category='Fun')
+        age(Task.objects.all())
+        since = cursor()
+        client_for(user2).delete('/api/couple/uncouple/')
+
+        response = client_for(user).get('/api/sync/', {'since': since})
+        assert response.data['full_sync'] is True
+        assert [t['title'] for t in response.data['changes']['tasks']] == ['Test Task']
+        assert response.data['deleted']['tasks'] == []
+
+        age()
+        next_sync = client_for(user).get('/api/sync/', {'since': response.data['cursor']})
+        assert next_sync.data['full_sync'] is False
+
+    def test_invalid_cursor(self, client_for, user):
+        """Test a malformed cursor is rejected"""
+        response = client_for(user).get('/api/sync/', {'since': 'yesterday'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
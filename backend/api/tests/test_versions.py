@@ -0,0 +1,120 @@
+"""
+Tests for resource versions and conditional list requests
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from api.models import DailyConnection, DailyConnectionAnswer, InboxItem, Memory, Task
+from api.versions import ResourceVersions, couple_scope, user_scope
+
+
+def revalidate(client, url, etag):
+    return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+
+@pytest.mark.django_db
+class TestResourceVersions:
+    """Test the version counters"""
+
+    def test_bump_changes_version(self):
+        """Test a bump moves a resource to a new version in that scope only"""
+        before = ResourceVersions.current('tasks', couple_scope(1))
+        other = ResourceVersions.current('tasks', couple_scope(2))
+        ResourceVersions.bump(['tasks'], [couple_scope(1)])
+        assert ResourceVersions.current('tasks', couple_scope(1)) == before + 1
+        assert ResourceVersions.current('tasks', couple_scope(2)) == other
+
+    def test_write_bumps_after_commit(self, user, couple, django_capture_on_commit_callbacks):
+        """Test saving a shared row bumps its couple's and owner's versions on commit"""
+        shared, own = couple_scope(couple.id), user_scope(user.id)
+        before = ResourceVersions.current('tasks', shared), ResourceVersions.current('tasks', own)
+        with django_capture_on_commit_callbacks(execute=True):
+            Task.objects.create(user=user, title='New', category='Fun')
+            assert (ResourceVersions.current('tasks', shared), ResourceVersions.current('tasks', own)) == before
+        assert ResourceVersions.current('tasks', shared) == before[0] + 1
+        assert ResourceVersions.current('tasks', own) == before[1] + 1
+
+
+@pytest.mark.django_db
+class TestConditionalLists:
+    """Test ETag / If-None-Match on the list endpoints"""
+
+    @pytest.mark.parametrize('url', [
+        '/api/tasks/', '/api/milestones/', '/api/activities/', '/api/suggestions/',
+        '/api/collections/', '/api/memories/', '/api/inbox/', '/api/daily-connections/',
+    ])
+    def test_unchanged_list_is_not_modified(self, client_for, user, couple, url):
+        """Test every versioned list answers a matching If-None-Match with 304"""
+        client = client_for(user)
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert 'no-cache' in response['Cache-Control']
+
+        again = revalidate(client, url, response['ETag'])
+        assert again.status_code == status.HTTP_304_NOT_MODIFIED
+        assert again['ETag'] == response['ETag']
+        assert again.content == b''
+
+    def test_not_modified_skips_content_tables(self, client_for, user, couple, task):
+        """Test a 304 is answered without querying tasks"""
+        client = client_for(user)
+        etag = client.get('/api/tasks/')['ETag']
+        with CaptureQueriesContext(connection) as captured:
+            assert revalidate(client, '/api/tasks/', etag).status_code == status.HTTP_304_NOT_MODIFIED
+        assert not [q for q in captured.captured_queries if 'api_task' in q['sql']]
+
+    def test_partner_write_changes_etag(self, client_for, user, user2, couple, task, django_capture_on_commit_callbacks):
+        """Test a write by either partner invalidates the shared list"""
+        client = client_for(user)
+        etag = client.get('/api/tasks/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            client_for(user2).patch(f'/api/tasks/{task.id}/', {'status': 'Planning'})
+
+        response = revalidate(client, '/api/tasks/', etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+        assert response.data['results'][0]['status'] == 'Planning'
+
+    def test_partners_share_etag(self, client_for, user, user2, couple):
+        """Test both partners see the same version of the shared list"""
+        assert client_for(user).get('/api/tasks/')['ETag'] == client_for(user2).get('/api/tasks/')['ETag']
+
+    def test_query_string_is_part_of_etag(self, client_for, user):
+        """Test different pages of the same version do not match"""
+        client = client_for(user)
+        assert client.get('/api/activities/?limit=5')['ETag'] != client.get('/api/activities/?limit=10')['ETag']
+
+    def test_uncoupling_switches_scope(self, client_for, user, user2, couple, django_capture_on_commit_callbacks):
+        """Test a list cached while coupled does not match once uncoupled"""
+        Task.objects.create(user=user2, title='Partner task', category='Fun')
+        client = client_for(user)
+        etag = client.get('/api/tasks/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            client.delete('/api/couple/uncouple/')
+        assert revalidate(client, '/api/tasks/', etag).status_code == status.HTTP_200_OK
+
+    def test_milestone_rename_invalidates_memories(self, client_for, user, milestone, django_capture_on_commit_callbacks):
+        """Test memories, which show their milestone's name, are invalidated too"""
+        Memory.objects.create(user=user, title='Trip', date='2024-01-01', milestone=milestone)
+        client = client_for(user)
+        etag = client.get('/api/memories/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            milestone.name = 'Renamed'
+            milestone.save()
+        assert revalidate(client, '/api/memories/', etag).status_code == status.HTTP_200_OK
+
+    def test_edited_answer_invalidates_partner_inbox(self, client_for, user, user2, couple, django_capture_on_commit_callbacks):
+        """Test an edited answer invalidates the inbox items showing it"""
+        connection_row = DailyConnection.objects.create(couple=couple, date='2024-01-01', prompt='Hi?')
+        answer = DailyConnectionAnswer.objects.create(connection=connection_row, user=user, answer_text='Hello')
+        InboxItem.objects.create(
+            recipient=user2, sender=user, item_type='connection_answer', title='Answer', connection_answer=answer
+        )
+        client = client_for(user2)
+        etag = client.get('/api/inbox/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            answer.answer_text = 'Hello again'
+            answer.save()
+        assert revalidate(client, '/api/inbox/', etag).status_code == status.HTTP_200_OK
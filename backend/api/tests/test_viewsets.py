@@ -10,8 +10,9 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from api.models import (
     Task, Milestone, Activity, Suggestion, Collection,
-    UserPreferences, Couple, CouplingCode
+    UserPreferences, Couple, CouplingCode, Tombstone
 )
+from api.serializers import MAX_BULK_TASK_OPERATIONS
 from django.utils import timezone
 from datetime import timedelta
 
@@ -100,6 +101,93 @@ class TestTaskViewSet:
         assert response.status_code == status.HTTP_204_NO_CONTENT
 
 
+@pytest.mark.django_db
+class TestTaskBulk:
+    """Test POST /api/tasks/bulk/"""
+    
+    def post(self, client, body):
+        return client.post('/api/tasks/bulk/', body, format='json')
+    
+    def test_applies_creates_updates_and_deletes(self, user, user2, couple, task, authenticated_client, mocker):
+        """Test one request applies every operation and sends one task:bulk event"""
+        partner_task = Task.objects.create(user=user2, title='Partner task', category='Fun')
+        doomed = Task.objects.create(user=user, title='Doomed', category='Fun')
+        broadcast = mocker.patch('api.mixins.publish_shared')
+        
+        response = self.post(authenticated_client, {
+            'create': [{'title': 'New one', 'category': 'Fun'}, {'title': 'New two', 'category': 'Fun'}],
+            'update': [{'id': task.id, 'status': 'Completed'}, {'id': str(partner_task.id), 'status': 'Planning'}],
+            'delete': [doomed.id],
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert [t['title'] for t in response.data['created']] == ['New one', 'New two']
+        assert {t['status'] for t in response.data['updated']} == {'Completed', 'Planning'}
+        assert response.data['deleted'] == [doomed.id]
+        
+        created = Task.objects.filter(title__startswith='New')
+        assert {(t.user_id, t.couple_id) for t in created} == {(user.id, couple.id)}
+        task.refresh_from_db()
+        partner_task.refresh_from_db()
+        assert (task.status, partner_task.status) == ('Completed', 'Planning')
+        assert partner_task.updated_at > partner_task.created_at
+        assert not Task.objects.filter(id=doomed.id).exists()
+        assert Tombstone.objects.filter(model='task', object_id=doomed.id).exists()
+        
+        broadcast.assert_called_once()
+        assert broadcast.call_args.args[2] == 'task:bulk'
+        assert broadcast.call_args.args[3] == response.data
+    
+    def test_invalid_entry_writes_nothing(self, user, task, authenticated_client):
+        """Test a single invalid entry rejects the whole batch with per-entry errors"""
+        response = self.post(authenticated_client, {
+            'create': [{'title': 'Fine', 'category': 'Fun'}],
+            'update': [{'id': task.id, 'status': 'Someday'}],
+        })
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'status' in response.data['errors']['update'][0]
+        assert 'create' not in response.data['errors']
+        assert not Task.objects.filter(title='Fine').exists()
+    
+    def test_cannot_touch_other_couples_tasks(self, user, authenticated_client):
+        """Test ids outside the user's tasks, or repeated ids, are rejected"""
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='TestPass123!')
+        foreign = Task.objects.create(user=stranger, title='Not yours', category='Fun')
+        own = Task.objects.create(user=user, title='Mine', category='Fun')
+        
+        assert self.post(authenticated_client, {'delete': [foreign.id]}).status_code == status.HTTP_400_BAD_REQUEST
+        response = self.post(authenticated_client, {'update': [{'id': own.id, 'liked': True}], 'delete': [own.id]})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Task.objects.filter(id__in=[foreign.id, own.id]).count() == 2
+    
+    def test_empty_and_oversized_batches(self, authenticated_client, settings):
+        """Test a batch must contain between one and the maximum number of operations"""
+        assert self.post(authenticated_client, {}).status_code == status.HTTP_400_BAD_REQUEST
+        too_many = [{'title': f'Task {i}', 'category': 'Fun'} for i in range(MAX_BULK_TASK_OPERATIONS + 1)]
+        assert self.post(authenticated_client, {'create': too_many}).status_code == status.HTTP_400_BAD_REQUEST
+    
+    @pytest.mark.parametrize('rows', [2, 40])
+    def test_query_count_is_flat(self, user, authenticated_client, rows, django_assert_max_num_queries):
+        """Test creates and updates cost the same number of queries however many there are"""
+        existing = Task.objects.bulk_create(Task(user=user, title=f'Old {i}', category='Fun') for i in range(rows))
+        body = {
+            'create': [{'title': f'New {i}', 'category': 'Fun'} for i in range(rows)],
+            'update': [{'id': t.id, 'status': 'Upcoming'} for t in existing],
+        }
+        authenticated_client.get('/api/tasks/')
+        with django_assert_max_num_queries(10):
+            assert self.post(authenticated_client, body).status_code == status.HTTP_200_OK
+    
+    def test_list_version_and_count_follow_bulk_writes(self, user, authenticated_client, django_capture_on_commit_callbacks):
+        """Test the signal-free writes still move the ETag and the cached count"""
+        listing = authenticated_client.get('/api/tasks/?count=cached')
+        assert listing.data['count'] == 0
+        with django_capture_on_commit_callbacks(execute=True):
+            self.post(authenticated_client, {'create': [{'title': 'New', 'category': 'Fun'}]})
+        again = authenticated_client.get('/api/tasks/?count=cached', HTTP_IF_NONE_MATCH=listing['ETag'])
+        assert again.status_code == status.HTTP_200_OK
+        assert again.data['count'] == 1
+
+
 @pytest.mark.django_db
 class TestMilestoneViewSet:
     """Test Milestone endpoints"""
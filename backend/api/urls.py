@@ -5,10 +5,12 @@ from .views import (
     SuggestionViewSet, CollectionViewSet, UserPreferencesViewSet,
     UserViewSet, UserRegistrationViewSet, CoupleViewSet, CouplingCodeViewSet,
     DailyConnectionViewSet, InboxItemViewSet, MemoryViewSet,
-    PlanDateView, ProTipView, DailyPromptView, AuthLogoutView,
+    PlanDateView, ProTipView, DailyPromptView, AuthLogoutView, RealtimeStatsView, DatabaseStatsView,
+    SyncView, BootstrapView, BatchView, APIRootView,
 )
 
 router = DefaultRouter()
+router.APIRootView = APIRootView
 router.register(r'tasks', TaskViewSet, basename='task')
 router.register(r'milestones', MilestoneViewSet, basename='milestone')
 router.register(r'activities', ActivityViewSet, basename='activity')
@@ -28,6 +30,16 @@ urlpatterns = [
     path('', include(router.urls)),
     # Authentication endpoints
     path('auth/logout/', AuthLogoutView.as_view(), name='auth-logout'),
+    # App startup data in one request
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
+    # Several API requests in one round trip
+    path('batch/', BatchView.as_view(), name='batch'),
+    # Delta sync of shared content and inbox
+    path('sync/', SyncView.as_view(), name='sync'),
+    # Real-time connection monitoring
+    path('realtime/stats/', RealtimeStatsView.as_view(), name='realtime-stats'),
+    # Database connection pool monitoring
+    path('database/stats/', DatabaseStatsView.as_view(), name='database-stats'),
     # AI helper endpoints
     path('ai/plan-date/', PlanDateView.as_view(), name='ai-plan-date'),
     path('ai/pro-tip/', ProTipView.as_view(), name='ai-pro-tip'),
@@ -0,0 +1,134 @@
+"""
+Per-scope resource versions backing the ETags of the list endpoints.
+
+Every list endpoint shows the rows of one scope: the shared content of a
+couple, or the content and inbox of a single user. Each (resource, scope)
+pair has a version counter in the cache that is bumped once every write to
+the resource has committed (see the signals in ``api/signals.py``). List
+responses carry an ETag derived from the version, so a request whose
+``If-None-Match`` still matches is answered with 304 from the cache alone,
+before the content tables are queried.
+
+A new counter starts at the current time in nanoseconds rather than 0, so a
+counter lost from the cache never restarts at a version a client holds.
+
+The same signals keep ``ResourceCounts``, the row count of each list per
+scope, which ``?count=cached`` pagination serves instead of ``COUNT(*)``.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+
+def couple_scope(couple_id):
+    """Scope of the content shared by a couple"""
+    return f"couple:{couple_id}"
+
+
+def user_scope(user_id):
+    """Scope of a single user's content and inbox"""
+    return f"user:{user_id}"
+
+
+def context_scope(context):
+    """Scope of the shared content visible through a CoupleContext"""
+    return couple_scope(context.couple_id) if context.is_coupled else user_scope(context.user_id)
+
+
+def content_scopes(instance):
+    """
+    Scopes whose lists show a shared content row: its owner's and, while it is
+    linked to one, its couple's. Both are bumped so either list is right
+    after the couple is created or dissolved.
+    """
+    scopes = [user_scope(instance.user_id)]
+    if instance.couple_id:
+        scopes.append(couple_scope(instance.couple_id))
+    return scopes
+
+
+class ResourceVersions:
+    """Version counters stored in the cache under ``versions:{resource}:{scope}``"""
+
+    @staticmethod
+    def _key(resource, scope):
+        return f"versions:{resource}:{scope}"
+
+    @staticmethod
+    def _initial():
+        return time.time_ns()
+
+    @classmethod
+    def current(cls, resource, scope):
+        """Current version of a resource in a scope"""
+        key = cls._key(resource, scope)
+        if (version := cache.get(key)) is None:
+            cache.add(key, cls._initial(), None)
+            version = cache.get(key)
+        return version
+
+    @classmethod
+    def bump(cls, resources, scopes):
+        """Move every listed resource of every listed scope to a new version"""
+        for resource in resources:
+            for scope in scopes:
+                key = cls._key(resource, scope)
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    # No counter yet: any fresh one differs from what clients hold
+                    cache.add(key, cls._initial(), None)
+
+
+def bump_versions(resources, scopes):
+    """
+    Bump resource versions once the current transaction commits.
+
+    Bumping after the commit means a list read concurrently with the write
+    can only pair new rows with the old version (the client refetches on its
+    next request), never old rows with the new one.
+    """
+    resources, scopes = tuple(resources), tuple(dict.fromkeys(scopes))
+    if resources and scopes:
+        transaction.on_commit(lambda: ResourceVersions.bump(resources, scopes))
+
+
+class ResourceCounts:
+    """
+    Row counts of each list per scope, stored in the cache under
+    ``counts:{resource}:{scope}``.
+
+    A count is computed once with ``COUNT(*)`` and then moved by one on every
+    committed insert or delete. Counts expire after ``TIMEOUT`` so any drift
+    (e.g. from a bulk write that bypasses signals) heals on its own.
+    """
+
+    TIMEOUT = 60 * 60  # 1 hour
+
+    @staticmethod
+    def _key(resource, scope):
+        return f"counts:{resource}:{scope}"
+
+    @classmethod
+    def get(cls, resource, scope, compute):
+        """Cached count of a list; ``compute()`` runs the COUNT on a miss"""
+        key = cls._key(resource, scope)
+        if (count := cache.get(key)) is None:
+            count = compute()
+            cache.add(key, count, cls.TIMEOUT)
+        return count
+
+    @classmethod
+    def adjust(cls, resource, scopes, delta):
+        for scope in scopes:
+            try:
+                cache.incr(cls._key(resource, scope), delta)
+            except ValueError:
+                # Not cached: the next read counts from the table
+                pass
+
+
+def track_count(resource, scopes, delta):
+    """Move a list's cached counts by ``delta`` once the current transaction commits"""
+    scopes = tuple(dict.fromkeys(scopes))
+    transaction.on_commit(lambda: ResourceCounts.adjust(resource, scopes, delta))
@@ -1,34 +1,91 @@
-from rest_framework import viewsets, status
+from rest_framework import routers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.views import APIView
-from rest_framework.serializers import ValidationError
+from rest_framework.settings import api_settings
 from contextlib import suppress
 import logging
-from django.db import models as django_models
+import math
+from django.db import models as django_models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta, date
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from .models import (
     Task, Milestone, Activity, Suggestion, Collection, UserPreferences,
-    Couple, CouplingCode, DailyConnection, DailyConnectionAnswer, InboxItem, Memory,
-    DailyConnectionPrompt
+    Couple, CouplingCode, DailyConnection, DailyConnectionAnswer, InboxItem, InboxCounter, Memory,
+    DailyConnectionPrompt, UserProfile, users_matching
 )
 from .serializers import (
     TaskSerializer, MilestoneSerializer, ActivitySerializer,
     SuggestionSerializer, CollectionSerializer, UserPreferencesSerializer,
     UserSerializer, UserRegistrationSerializer, CoupleSerializer, CouplingCodeSerializer,
     UserDetailSerializer, UserProfileSerializer, DailyConnectionSerializer,
-    DailyConnectionAnswerSerializer, InboxItemSerializer, MemorySerializer, ChangePasswordSerializer
+    DailyConnectionAnswerSerializer, TaskBulkSerializer, BatchSerializer, InboxItemSerializer, InboxCounterSerializer, MemorySerializer, ChangePasswordSerializer
 )
-from .mixins import PartnerResolutionMixin, BroadcastMixin
+from .mixins import PartnerResolutionMixin, BroadcastMixin, VersionedListMixin
+from .pagination import ActivityPagination, DateFeedPagination, FeedPagination
+from .couples import get_couple_context
+from .websocket import connection_stats
+from .sync import SHARED_RESOURCES, changes_since, parse_cursor
+from .batch import run_batch
+from .cascades import batched_deletes
+from .outbox import outbox_stats
+from .pooled_postgresql.pool import pool_stats
+from .profiles import get_profile_document, profile_queryset
+from .budgets import Budget
+from .versions import bump_versions, content_scopes, track_count, user_scope
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PREFERENCES = {
+    'anniversary': '2024-01-15',
+    'is_private': True,
+    'notifications': True,
+    'vibe': 'Feeling adventurous'
+}
+
+# Budgets of the shared content viewsets (see api/budgets.py); a write bumps
+# list versions and counts and sends one event to the couple
+CONTENT_BUDGETS = {
+    'list': Budget(queries=3, cache_calls=9),
+    'retrieve': Budget(queries=2, cache_calls=4),
+    'create': Budget(queries=2, cache_calls=13, channel_sends=1),
+    'update': Budget(queries=3, cache_calls=11, channel_sends=1),
+    'partial_update': Budget(queries=3, cache_calls=11, channel_sends=1),
+    'destroy': Budget(queries=4, cache_calls=13, channel_sends=1),
+}
+# Deleting a couple or an account does the side effects of its rows once per
+# scope (see api/cascades.py): its cache calls and channel sends are fixed,
+# and only its queries grow with the rows Django collects and deletes (and
+# the tombstones it inserts) in chunks, by at most one per
+# CASCADE_ROWS_PER_QUERY rows. Budgeted for CASCADE_BUDGET_ROWS rows, e.g. a
+# couple with two years of daily connections.
+CASCADE_ROWS_PER_QUERY = 50
+CASCADE_BUDGET_ROWS = 2500
+
+
+def cascade_delete_budget(queries, cache_calls, channel_sends, rows=CASCADE_BUDGET_ROWS):
+    """Budget of a cascading delete: its fixed ``queries`` plus the chunks of ``rows`` rows"""
+    return Budget(
+        queries=queries + math.ceil(rows / CASCADE_ROWS_PER_QUERY),
+        cache_calls=cache_calls,
+        channel_sends=channel_sends
+    )
+
+
+class APIRootView(routers.APIRootView):
+    """The router's API root, with its budget"""
+    budgets = {'get': Budget(queries=0, cache_calls=2)}
+
+
+def couple_status(request):
+    """Couple status of the requesting user, as returned by GET /api/couple/"""
+    if not (couple := get_couple_context(request).couple):
+        return {'is_coupled': False, 'partner': None}
+    return {'is_coupled': True, **CoupleSerializer(couple, context={'request': request}).data}
+
 
 
 
@@ -36,6 +93,7 @@ logger = logging.getLogger(__name__)
 class PlanDateView(APIView):
     """Placeholder view for AI plan date endpoint"""
     permission_classes = [AllowAny]
+    budgets = {'get': Budget(queries=0, cache_calls=2)}
 
     def get(self, request, *args, **kwargs):
         return Response({'detail': 'plan date placeholder'}, status=status.HTTP_200_OK)
@@ -44,6 +102,7 @@ class PlanDateView(APIView):
 class ProTipView(APIView):
     """Placeholder view for AI pro tip endpoint"""
     permission_classes = [AllowAny]
+    budgets = {'get': Budget(queries=0, cache_calls=2)}
 
     def get(self, request, *args, **kwargs):
         return Response({'detail': 'pro tip placeholder'}, status=status.HTTP_200_OK)
@@ -52,6 +111,7 @@ class ProTipView(APIView):
 class DailyPromptView(APIView):
     """Placeholder view for AI daily prompt endpoint"""
     permission_classes = [AllowAny]
+    budgets = {'get': Budget(queries=0, cache_calls=2)}
 
     def get(self, request, *args, **kwargs):
         return Response({'detail': 'daily prompt placeholder'}, status=status.HTTP_200_OK)
@@ -63,6 +123,7 @@ class AuthLogoutView(APIView):
     Ends user session by invalidating refresh token
     """
     permission_classes = [IsAuthenticated]
+    budgets = {'post': Budget(queries=0, cache_calls=2)}
 
     def post(self, request):
         """
@@ -88,51 +149,222 @@ class AuthLogoutView(APIView):
             )
 
 
-class TaskViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class RealtimeStatsView(APIView):
+    """
+    GET /api/realtime/stats/ - WebSocket connection counters (staff only)
+    Totals of accepted, rejected (unauthenticated or over the per-user cap)
+    and reaped (idle) connections across all workers, plus the outbox
+    backlog and lag when REALTIME_OUTBOX is on
+    """
+    permission_classes = [IsAdminUser]
+    # One more query with the outbox on
+    budgets = {'get': Budget(queries=0, cache_calls=3)}
+
+    def get(self, request):
+        stats = connection_stats()
+        if settings.REALTIME_OUTBOX:
+            stats['outbox'] = outbox_stats()
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class DatabaseStatsView(APIView):
+    """
+    GET /api/database/stats/ - Connection pool state of this process (staff only)
+    Size, idle and in-use connections, saturation, checkouts that waited
+    and their wait time, per pool (empty without DB_POOL)
+    """
+    permission_classes = [IsAdminUser]
+    budgets = {'get': Budget(queries=0, cache_calls=2)}
+
+    def get(self, request):
+        return Response({'pools': pool_stats()}, status=status.HTTP_200_OK)
+
+
+class SyncView(PartnerResolutionMixin, APIView):
+    """
+    GET /api/sync/?since=<cursor> - Tasks, milestones, activities, suggestions,
+    collections, memories and inbox items changed or deleted since a previous
+    sync. Omit ``since`` for a full sync; pass the returned ``cursor`` next time.
+    """
+    permission_classes = [IsAuthenticated]
+    budgets = {'get': Budget(queries=10, cache_calls=4)}
+
+    def get(self, request):
+        since = parse_cursor(request.query_params.get('since'))
+        return Response(changes_since(request, self.couple_context, since), status=status.HTTP_200_OK)
+
+
+class BootstrapView(PartnerResolutionMixin, APIView):
+    """
+    GET /api/bootstrap/ - Everything the app needs to start, in one request:
+    the user, couple status, preferences, the first page of each board
+    (``has_more`` tells whether a second page exists), the unread inbox count
+    and today's daily connection. Boards are read without a COUNT query.
+    """
+    permission_classes = [IsAuthenticated]
+    budgets = {'get': Budget(queries=24, cache_calls=7)}
+
+    def get(self, request):
+        context = self.couple_context
+        serializer_context = {'request': request}
+        page_size = api_settings.PAGE_SIZE
+
+        def first_page(queryset, serializer_class, size=page_size):
+            rows = list(queryset[:size + 1])
+            return {
+                'results': serializer_class(rows[:size], many=True, context=serializer_context).data,
+                'has_more': len(rows) > size
+            }
+
+        boards = {
+            name: first_page(
+                model.objects.for_couple(context).select_related(*related),
+                serializer_class,
+                ActivityPagination.page_size if model is Activity else page_size
+            )
+            for name, (model, serializer_class, related) in SHARED_RESOURCES.items()
+        }
+        inbox = InboxItem.objects.filter(recipient=request.user)
+        boards['inbox'] = first_page(InboxItemSerializer.setup_eager_loading(inbox), InboxItemSerializer)
+        preferences, created = UserPreferences.objects.get_or_create(
+            user=request.user,
+            defaults=DEFAULT_PREFERENCES
+        )
+
+        return Response({
+            'user': UserSerializer(request.user).data,
+            'couple': couple_status(request),
+            'preferences': UserPreferencesSerializer(preferences).data,
+            'boards': boards,
+            'inbox_unread_count': InboxCounter.for_user(request.user.id).unread,
+            'daily_connection': todays_connection_data(context.couple),
+        }, status=status.HTTP_200_OK)
+
+
+class BatchView(APIView):
+    """
+    POST /api/batch/ - Run several API requests in one round trip.
+    
+    Body: ``{"requests": [{"method": "POST", "path": "/api/memories/",
+    "body": {...}}, ...], "atomic": false}``. Sub-requests run in order and
+    the response lists ``{status, headers, body}`` for each. With ``atomic``
+    the batch is all-or-nothing: the first failing sub-request rolls back
+    every write and ``committed`` is false. See ``api/batch.py``.
+    """
+    permission_classes = [IsAuthenticated]
+    budgets = {
+        # The batch's own work; each sub-request adds the budget of its view
+        'post': Budget(queries=2, cache_calls=2),
+    }
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses, committed = run_batch(
+            request, serializer.validated_data['requests'], serializer.validated_data['atomic']
+        )
+        return Response({'committed': committed, 'responses': responses}, status=status.HTTP_200_OK)
+
+
+class TaskViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    version_resource = 'tasks'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'bulk': Budget(queries=6, cache_calls=15, channel_sends=1),
+    }
     
     def get_queryset(self):
-        user = self.request.user
         # Get tasks for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Task.objects.filter(user__in=[user, partner])
-        return Task.objects.filter(user=user)
+        return Task.objects.for_couple(self.couple_context)
     
     def perform_create(self, serializer):
-        task = serializer.save()
-        self.broadcast('task:created', TaskSerializer(task).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('task:created', serializer.data)
     
     def perform_update(self, serializer):
-        task = serializer.save()
-        self.broadcast('task:updated', TaskSerializer(task).data)
+        serializer.save()
+        self.broadcast('task:updated', serializer.data)
     
     def perform_destroy(self, instance):
         task_id = instance.id
         instance.delete()
         self.broadcast('task:deleted', {'id': task_id})
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create, update and delete many tasks in one transaction.
+        
+        Body: ``{"create": [task, ...], "update": [{"id": ..., field: value},
+        ...], "delete": [id, ...]}``. Nothing is written unless every entry
+        is valid. Creates and updates are written with one bulk_create and
+        one bulk_update, which skip the Task save signals, so the list
+        versions and counts are moved here; deletes go through the regular
+        delete so tombstones are recorded. One ``task:bulk`` event carries
+        the whole batch.
+        """
+        serializer = TaskBulkSerializer(
+            data=request.data,
+            context={'request': request, 'tasks': self.get_queryset()}
+        )
+        serializer.is_valid(raise_exception=True)
+        creates, updates, deletes = (serializer.validated_data[key] for key in ('create', 'update', 'delete'))
+        
+        with transaction.atomic():
+            created = Task.objects.bulk_create(
+                Task(user=request.user, couple_id=self.couple_context.couple_id, **data) for data in creates
+            )
+            updated = [task for task, changes in updates]
+            if updates:
+                now = timezone.now()
+                for task, changes in updates:
+                    for field, value in changes.items():
+                        setattr(task, field, value)
+                    task.updated_at = now
+                fields = {field for task, changes in updates for field in changes} | {'updated_at'}
+                Task.objects.bulk_update(updated, sorted(fields))
+            deleted_ids = [task.id for task in deletes]
+            if deleted_ids:
+                Task.objects.filter(id__in=deleted_ids).delete()
+            
+            if created:
+                track_count('tasks', content_scopes(created[0]), len(created))
+            bump_versions(['tasks'], [scope for task in created + updated for scope in content_scopes(task)])
+            
+            data = {
+                'created': TaskSerializer(created, many=True).data,
+                'updated': TaskSerializer(updated, many=True).data,
+                'deleted': deleted_ids,
+            }
+            self.broadcast('task:bulk', data)
+        return Response(data, status=status.HTTP_200_OK)
 
 
-class MilestoneViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class MilestoneViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = MilestoneSerializer
     permission_classes = [IsAuthenticated]
+    version_resource = 'milestones'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'create': Budget(queries=2, cache_calls=17, channel_sends=1),
+        'update': Budget(queries=3, cache_calls=15, channel_sends=1),
+        'partial_update': Budget(queries=3, cache_calls=15, channel_sends=1),
+        'destroy': Budget(queries=5, cache_calls=17, channel_sends=1),
+    }
     
     def get_queryset(self):
-        user = self.request.user
         # Get milestones for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Milestone.objects.filter(user__in=[user, partner])
-        return Milestone.objects.filter(user=user)
+        return Milestone.objects.for_couple(self.couple_context)
     
     def perform_create(self, serializer):
-        milestone = serializer.save()
-        self.broadcast('milestone:created', MilestoneSerializer(milestone).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('milestone:created', serializer.data)
     
     def perform_update(self, serializer):
-        milestone = serializer.save()
-        self.broadcast('milestone:updated', MilestoneSerializer(milestone).data)
+        serializer.save()
+        self.broadcast('milestone:updated', serializer.data)
     
     def perform_destroy(self, instance):
         milestone_id = instance.id
@@ -140,39 +372,44 @@ class MilestoneViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelVie
         self.broadcast('milestone:deleted', {'id': milestone_id})
 
 
-class ActivityViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class ActivityViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ActivityPagination
+    version_resource = 'activities'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'update': Budget(queries=3, cache_calls=8),
+        'partial_update': Budget(queries=3, cache_calls=8),
+        'destroy': Budget(queries=4, cache_calls=10),
+    }
     
     def get_queryset(self):
-        user = self.request.user
-        limit = int(self.request.query_params.get('limit', 50))
         # Get activities for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Activity.objects.filter(user__in=[user, partner])[:limit]
-        return Activity.objects.filter(user=user)[:limit]
+        return Activity.objects.for_couple(self.couple_context)
     
     def perform_create(self, serializer):
-        activity = serializer.save()
-        self.broadcast('activity:created', ActivitySerializer(activity).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('activity:created', serializer.data)
 
 
-class SuggestionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class SuggestionViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = SuggestionSerializer
     permission_classes = [IsAuthenticated]
+    version_resource = 'suggestions'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'update': Budget(queries=3, cache_calls=8),
+        'partial_update': Budget(queries=3, cache_calls=8),
+    }
     
     def get_queryset(self):
-        user = self.request.user
         # Get suggestions for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Suggestion.objects.filter(user__in=[user, partner])
-        return Suggestion.objects.filter(user=user)
+        return Suggestion.objects.for_couple(self.couple_context)
     
     def perform_create(self, serializer):
-        suggestion = serializer.save()
-        self.broadcast('suggestion:created', SuggestionSerializer(suggestion).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('suggestion:created', serializer.data)
     
     def perform_destroy(self, instance):
         suggestion_id = instance.id
@@ -180,25 +417,23 @@ class SuggestionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelVi
         self.broadcast('suggestion:deleted', {'id': suggestion_id})
 
 
-class CollectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class CollectionViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = CollectionSerializer
     permission_classes = [IsAuthenticated]
+    version_resource = 'collections'
+    budgets = CONTENT_BUDGETS
     
     def get_queryset(self):
-        user = self.request.user
         # Get collections for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Collection.objects.filter(user__in=[user, partner]).order_by('-created_at')
-        return Collection.objects.filter(user=user).order_by('-created_at')
+        return Collection.objects.for_couple(self.couple_context)
     
     def perform_create(self, serializer):
-        collection = serializer.save()
-        self.broadcast('collection:created', CollectionSerializer(collection).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('collection:created', serializer.data)
     
     def perform_update(self, serializer):
-        collection = serializer.save()
-        self.broadcast('collection:updated', CollectionSerializer(collection).data)
+        serializer.save()
+        self.broadcast('collection:updated', serializer.data)
     
     def perform_destroy(self, instance):
         collection_id = instance.id
@@ -206,9 +441,17 @@ class CollectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelVi
         self.broadcast('collection:deleted', {'id': collection_id})
 
 
-class UserPreferencesViewSet(viewsets.ModelViewSet):
+class UserPreferencesViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     serializer_class = UserPreferencesSerializer
     permission_classes = [IsAuthenticated]
+    budgets = {
+        'list': Budget(queries=1, cache_calls=2),
+        'retrieve': Budget(queries=1, cache_calls=2),
+        'create': Budget(queries=2, cache_calls=9, channel_sends=1),
+        'update': Budget(queries=3, cache_calls=9, channel_sends=1),
+        'partial_update': Budget(queries=3, cache_calls=9, channel_sends=1),
+        'destroy': Budget(queries=2, cache_calls=4),
+    }
     
     def get_queryset(self):
         return UserPreferences.objects.filter(user=self.request.user)
@@ -216,61 +459,30 @@ class UserPreferencesViewSet(viewsets.ModelViewSet):
     def list(self, request):
         preferences, created = UserPreferences.objects.get_or_create(
             user=request.user,
-            defaults={
-                'anniversary': '2024-01-15',
-                'is_private': True,
-                'notifications': True,
-                'vibe': 'Feeling adventurous'
-            }
+            defaults=DEFAULT_PREFERENCES
         )
         serializer = self.get_serializer(preferences)
         return Response(serializer.data)
     
     def perform_update(self, serializer):
-        preferences = serializer.save()
-        self._broadcast('preferences:updated', UserPreferencesSerializer(preferences).data)
-    
-    def _get_partner(self, user):
-        """Helper to get user's partner if coupled"""
-        try:
-            couple = Couple.objects.get(user1=user)
-            return couple.user2
-        except Couple.DoesNotExist:
-            try:
-                couple = Couple.objects.get(user2=user)
-                return couple.user1
-            except Couple.DoesNotExist:
-                return None
-    
-    def _broadcast(self, event_type, data):
-        channel_layer = get_channel_layer()
-        # Broadcast to current user
-        async_to_sync(channel_layer.group_send)(
-            f"user_{self.request.user.id}",
-            {
-                "type": "send_message",
-                "event": event_type,
-                "data": data
-            }
-        )
-        # Broadcast to partner if coupled
-        if partner := self._get_partner(self.request.user):
-            async_to_sync(channel_layer.group_send)(
-                f"user_{partner.id}",
-                {
-                    "type": "send_message",
-                    "event": event_type,
-                    "data": data
-                }
-            )
+        serializer.save()
+        self.broadcast('preferences:updated', serializer.data)
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserDetailSerializer
     permission_classes = [IsAuthenticated]
+    budgets = {
+        'list': Budget(queries=6, cache_calls=2),
+        'retrieve': Budget(queries=5, cache_calls=2),
+        'me': Budget(queries=9, cache_calls=10),
+        'change_password': Budget(queries=3, cache_calls=6),
+        # Cascades through the user's content and couple, row by row
+        'delete_account': cascade_delete_budget(queries=43, cache_calls=60, channel_sends=4),
+    }
     
     def get_queryset(self):
-        return User.objects.filter(id=self.request.user.id)
+        return profile_queryset().filter(id=self.request.user.id)
     
     @action(detail=False, methods=['get', 'put'], permission_classes=[IsAuthenticated])
     def me(self, request):
@@ -292,11 +504,10 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         user = request.user
         
         if request.method == 'GET':
-            serializer = UserDetailSerializer(user)
             return Response({
                 'status': 'success',
                 'message': 'User profile retrieved successfully.',
-                'data': serializer.data
+                'data': get_profile_document(user)
             }, status=status.HTTP_200_OK)
         
         elif request.method == 'PUT':
@@ -311,7 +522,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
                 user.last_name = last_name
             if email is not None:
                 # Check if email already exists for another user
-                if User.objects.filter(email__iexact=email.lower()).exclude(id=user.id).exists():
+                if users_matching('email', email).exclude(id=user.id).exists():
                     return Response(
                         {
                             'status': 'error',
@@ -322,19 +533,13 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
                     )
                 user.email = email.lower()
             
+            # The profile's email_normalized follows by signal, only if the email changed
             user.save()
             
-            # Update UserProfile email_normalized
-            with suppress(Exception):
-                user.profile.email_normalized = user.email.lower()
-                user.profile.updated_at = timezone.now()
-                user.profile.save(update_fields=['email_normalized', 'updated_at'])
-            
-            serializer = UserDetailSerializer(user)
             return Response({
                 'status': 'success',
                 'message': 'Profile updated successfully.',
-                'data': serializer.data
+                'data': get_profile_document(user)
             }, status=status.HTTP_200_OK)
 
     
@@ -357,7 +562,8 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         
         try:
             # Delete all associated data (cascading deletes handled by Django models)
-            user.delete()
+            with batched_deletes():
+                user.delete()
             
             return Response(
                 {'status': 'success', 'detail': 'Account successfully deleted.'}, 
@@ -422,63 +628,37 @@ class UserRegistrationViewSet(viewsets.GenericViewSet):
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
     queryset = User.objects.none()  # Empty queryset since we're not listing users
+    budgets = {'create': Budget(queries=21, cache_calls=16, channel_sends=2)}
     
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)  # Let error handler deal with validation errors
-        
-        # Let exceptions propagate to global handler for consistent error formatting
-        user = serializer.save()
-        
-        # Ensure UserProfile was created via signal
-        try:
-            profile = user.profile  # This will raise DoesNotExist if profile wasn't created
-            logger.debug(f'UserProfile verified for user {user.username}: {profile.id_uuid}')
-        except Exception as e:
-            logger.error(f'UserProfile missing for user {user.username}: {e}')
-            # Try to create it manually as a fallback
-            try:
-                from .models import UserProfile
-                profile, created = UserProfile.objects.get_or_create(
-                    user=user,
-                    defaults={'email_normalized': user.email.lower()}
-                )
-                if created:
-                    logger.info(f'Manually created UserProfile for user {user.username}')
-            except Exception as profile_error:
-                logger.error(f'Failed to create UserProfile for user {user.username}: {profile_error}')
-        
-        # If a coupling code is provided, try to couple the accounts
-        if coupling_code := request.data.get('coupling_code', '').strip().upper():
-            with suppress(CouplingCode.DoesNotExist):
-                code_obj = CouplingCode.objects.get(
-                    code=coupling_code,
-                    used_by__isnull=True,
-                    expires_at__gt=timezone.now()
-                )
-                # Create couple relationship
-                couple = Couple.objects.create(
-                    user1=code_obj.created_by,
-                    user2=user
-                )
-                # Mark code as used
-                code_obj.used_by = user
-                code_obj.used_at = timezone.now()
-                code_obj.save()
-        
-        # Update UserProfile with last login
-        try:
-            user.profile.last_login_at = timezone.now()
-            user.profile.save(update_fields=['last_login_at'])
-        except Exception as e:
-            logger.warning(f'Failed to update last_login_at for user {user.username}: {e}')
-        
-        # Verify user and profile are in database before returning
-        db_user = User.objects.filter(username=user.username).first()
-        if not db_user:
-            logger.error(f'User {user.username} not found in database after creation!')
-            raise ValidationError({'detail': 'Failed to create user account. Please try again.'})
-        
+        coupling_code = request.data.get('coupling_code', '').strip().upper()
+
+        # One transaction: the user, its profile (created by signal, see
+        # reconcile_profiles for repairs) and the optional coupling
+        with transaction.atomic():
+            # Let exceptions propagate to global handler for consistent error formatting
+            user = serializer.save()
+
+            # If a coupling code is provided, try to couple the accounts
+            if coupling_code:
+                with suppress(CouplingCode.DoesNotExist), transaction.atomic():
+                    code_obj = CouplingCode.objects.select_related('created_by').get(
+                        code=coupling_code,
+                        used_by__isnull=True,
+                        expires_at__gt=timezone.now()
+                    )
+                    # Create couple relationship (signal links existing shared content)
+                    Couple.objects.create(user1=code_obj.created_by, user2=user)
+                    # Mark code as used
+                    code_obj.used_by = user
+                    code_obj.used_at = timezone.now()
+                    code_obj.save(update_fields=['used_by', 'used_at'])
+
+            # One UPDATE: the profile row itself is not needed here
+            UserProfile.objects.filter(user=user).update(last_login_at=timezone.now())
+
         # Return standardized success response (frontend logs in separately to get tokens)
         return Response(
             {
@@ -493,6 +673,15 @@ class UserRegistrationViewSet(viewsets.GenericViewSet):
 class CoupleViewSet(viewsets.ModelViewSet):
     serializer_class = CoupleSerializer
     permission_classes = [IsAuthenticated]
+    budgets = {
+        'list': Budget(queries=1, cache_calls=4),
+        'retrieve': Budget(queries=4, cache_calls=4),
+        'create': Budget(queries=0, cache_calls=2),
+        'update': Budget(queries=5, cache_calls=5),
+        'partial_update': Budget(queries=5, cache_calls=5),
+        'destroy': cascade_delete_budget(queries=21, cache_calls=22, channel_sends=4),
+        'uncouple': cascade_delete_budget(queries=21, cache_calls=24, channel_sends=4),
+    }
     
     def get_queryset(self):
         user = self.request.user
@@ -503,46 +692,43 @@ class CoupleViewSet(viewsets.ModelViewSet):
     
     def list(self, request):
         """Get current user's couple status"""
-        user = request.user
-        try:
-            couple = Couple.objects.get(user1=user)
-        except Couple.DoesNotExist:
-            try:
-                couple = Couple.objects.get(user2=user)
-            except Couple.DoesNotExist:
-                return Response({'is_coupled': False, 'partner': None})
-        
-        serializer = self.get_serializer(couple, context={'request': request})
-        return Response({'is_coupled': True, **serializer.data})
+        return Response(couple_status(request))
     
     def create(self, request):
         """Coupling should only happen via code - this endpoint is for admin use"""
         return Response({'detail': 'Use coupling codes to couple accounts'}, status=status.HTTP_400_BAD_REQUEST)
     
+    def perform_destroy(self, instance):
+        with batched_deletes():
+            instance.delete()
+    
     @action(detail=False, methods=['delete'])
     def uncouple(self, request):
         """Remove couple relationship"""
-        user = request.user
+        if not (couple := get_couple_context(request).couple):
+            return Response(
+                {'detail': 'You are not currently coupled'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        try:
-            couple = Couple.objects.get(user1=user)
+        # Shared content is unlinked by the couple FK's SET_NULL in the same delete transaction
+        with batched_deletes():
             couple.delete()
-            return Response({'detail': 'Successfully uncoupled'}, status=status.HTTP_200_OK)
-        except Couple.DoesNotExist:
-            try:
-                couple = Couple.objects.get(user2=user)
-                couple.delete()
-                return Response({'detail': 'Successfully uncoupled'}, status=status.HTTP_200_OK)
-            except Couple.DoesNotExist:
-                return Response(
-                    {'detail': 'You are not currently coupled'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        return Response({'detail': 'Successfully uncoupled'}, status=status.HTTP_200_OK)
 
 
 class CouplingCodeViewSet(viewsets.ModelViewSet):
     serializer_class = CouplingCodeSerializer
     permission_classes = [IsAuthenticated]
+    budgets = {
+        'list': Budget(queries=2, cache_calls=2),
+        'retrieve': Budget(queries=1, cache_calls=2),
+        'create': Budget(queries=3, cache_calls=4),
+        'update': Budget(queries=2, cache_calls=2),
+        'partial_update': Budget(queries=2, cache_calls=2),
+        'destroy': Budget(queries=2, cache_calls=2),
+        'use': Budget(queries=13, cache_calls=12, channel_sends=2),
+    }
     
     def get_queryset(self):
         # Only show codes created by current user that are not used
@@ -557,7 +743,7 @@ class CouplingCodeViewSet(viewsets.ModelViewSet):
         user = request.user
         
         # Check if user is already coupled
-        if Couple.objects.filter(user1=user).exists() or Couple.objects.filter(user2=user).exists():
+        if get_couple_context(request).is_coupled:
             return Response(
                 {'detail': 'You are already coupled with someone. Please uncouple first.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -586,7 +772,7 @@ class CouplingCodeViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Code is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Check if user is already coupled
-        if Couple.objects.filter(user1=user).exists() or Couple.objects.filter(user2=user).exists():
+        if get_couple_context(request).is_coupled:
             return Response(
                 {'detail': 'You are already coupled with someone. Please uncouple first.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -606,16 +792,17 @@ class CouplingCodeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Create couple relationship
-            couple = Couple.objects.create(
-                user1=code_obj.created_by,
-                user2=user
-            )
-            
-            # Mark code as used
-            code_obj.used_by = user
-            code_obj.used_at = timezone.now()
-            code_obj.save()
+            with transaction.atomic():
+                # Create couple relationship (signal links existing shared content)
+                couple = Couple.objects.create(
+                    user1=code_obj.created_by,
+                    user2=user
+                )
+                
+                # Mark code as used
+                code_obj.used_by = user
+                code_obj.used_at = timezone.now()
+                code_obj.save()
             
             serializer = CoupleSerializer(couple, context={'request': request})
             return Response({'is_coupled': True, **serializer.data}, status=status.HTTP_201_CREATED)
@@ -627,7 +814,63 @@ class CouplingCodeViewSet(viewsets.ModelViewSet):
             )
 
 
-class DailyConnectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+def _get_next_prompt(couple):
+    """Get a random prompt from the pool, avoiding the same one as yesterday"""
+    # Get all active prompts
+    prompts = DailyConnectionPrompt.objects.filter(is_active=True)
+    
+    if not prompts.exists():
+        # Fallback if no prompts in database
+        return 'Connect with your partner to share daily prompts.'
+    
+    # Get yesterday's prompt to avoid repeating it
+    yesterday = date.today() - timedelta(days=1)
+    if yesterday_connection := DailyConnection.objects.filter(
+        couple=couple,
+        date=yesterday
+    ).first():
+        available_prompts = prompts.exclude(prompt_text=yesterday_connection.prompt)
+        # If we have prompts available that aren't yesterday's, use those
+        if available_prompts.exists():
+            import random
+            return random.choice(available_prompts).prompt_text
+    
+    # Otherwise, select from all prompts
+    import random
+    return random.choice(prompts).prompt_text
+
+
+def todays_connection_data(couple):
+    """
+    Serialized daily connection of today for a couple, created on first access.
+    Uncoupled users get a placeholder with no answers.
+    """
+    today = date.today()
+    if couple is None:
+        # Return an empty daily connection if user is not coupled
+        return {
+            'id': None,
+            'date': str(today),
+            'prompt': 'Connect with your partner to share daily prompts.',
+            'answers': [],
+            'created_at': None,
+            'updated_at': None
+        }
+    
+    # A prompt is only picked when today's connection does not exist yet
+    connection = DailyConnectionSerializer.setup_eager_loading(
+        DailyConnection.objects.filter(couple=couple, date=today)
+    ).first()
+    if connection is None:
+        connection, created = DailyConnection.objects.get_or_create(
+            couple=couple,
+            date=today,
+            defaults={'prompt': _get_next_prompt(couple)}
+        )
+    return DailyConnectionSerializer(connection).data
+
+
+class DailyConnectionViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing daily connections and answers.
     - GET /api/daily-connections/ - Get all daily connections for couple
@@ -636,84 +879,30 @@ class DailyConnectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.Mo
     """
     serializer_class = DailyConnectionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DateFeedPagination
+    version_resource = 'daily-connections'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'list': Budget(queries=5, cache_calls=9),
+        'retrieve': Budget(queries=4, cache_calls=4),
+        'today': Budget(queries=8, cache_calls=7),
+        'answer': Budget(queries=20, cache_calls=16, channel_sends=2),
+        'update': Budget(queries=8, cache_calls=6),
+        'partial_update': Budget(queries=8, cache_calls=6),
+        'destroy': Budget(queries=15, cache_calls=21, channel_sends=2),
+    }
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if partner := self.get_partner(user):
-            # Get couple that includes current user
-            if couple := Couple.objects.filter(
-                django_models.Q(user1=user) | django_models.Q(user2=user)
-            ).first():
-                return DailyConnection.objects.filter(couple=couple)
+        # Get connections for the couple that includes current user
+        if couple_id := self.couple_context.couple_id:
+            return DailyConnectionSerializer.setup_eager_loading(DailyConnection.objects.filter(couple_id=couple_id))
         
         return DailyConnection.objects.none()
     
-    def _get_next_prompt(self, couple):
-        """Get a random prompt from the pool, avoiding the same one as yesterday"""
-        # Get all active prompts
-        prompts = DailyConnectionPrompt.objects.filter(is_active=True)
-        
-        if not prompts.exists():
-            # Fallback if no prompts in database
-            return 'Connect with your partner to share daily prompts.'
-        
-        # Get yesterday's prompt to avoid repeating it
-        yesterday = date.today() - timedelta(days=1)
-        if yesterday_connection := DailyConnection.objects.filter(
-            couple=couple,
-            date=yesterday
-        ).first():
-            available_prompts = prompts.exclude(prompt_text=yesterday_connection.prompt)
-            # If we have prompts available that aren't yesterday's, use those
-            if available_prompts.exists():
-                import random
-                return random.choice(available_prompts).prompt_text
-        
-        # Otherwise, select from all prompts
-        import random
-        return random.choice(prompts).prompt_text
-    
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get today's daily connection for the couple"""
-        user = request.user
-        
-        if not (partner := self.get_partner(user)):
-            # Return an empty daily connection if user is not coupled
-            return Response({
-                'id': None,
-                'date': str(date.today()),
-                'prompt': 'Connect with your partner to share daily prompts.',
-                'answers': [],
-                'created_at': None,
-                'updated_at': None
-            }, status=status.HTTP_200_OK)
-        
-        if not (couple := Couple.objects.filter(
-            django_models.Q(user1=user) | django_models.Q(user2=user)
-        ).first()):
-            # Fallback if couple relationship not found despite partner existing
-            return Response({
-                'id': None,
-                'date': str(date.today()),
-                'prompt': 'Connect with your partner to share daily prompts.',
-                'answers': [],
-                'created_at': None,
-                'updated_at': None
-            }, status=status.HTTP_200_OK)
-        
-        today = date.today()
-        prompt = self._get_next_prompt(couple)
-        
-        connection, created = DailyConnection.objects.get_or_create(
-            couple=couple,
-            date=today,
-            defaults={'prompt': prompt}
-        )
-        
-        serializer = self.get_serializer(connection)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(todays_connection_data(self.couple_context.couple), status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def answer(self, request, pk=None):
@@ -737,10 +926,10 @@ class DailyConnectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.Mo
         logger.info(f"User {request.user.id} submitted answer to connection {connection.id}")
         
         # Create inbox item for partner (signal will handle broadcast)
-        if partner := self.get_partner(request.user):
+        if partner_id := self.couple_context.partner_id:
             try:
                 inbox_item = InboxItem.objects.create(
-                    recipient=partner,
+                    recipient_id=partner_id,
                     sender=request.user,
                     item_type='connection_answer',
                     title=f'{request.user.username} shared their daily connection answer',
@@ -748,7 +937,7 @@ class DailyConnectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.Mo
                     content={'prompt': connection.prompt, 'answer': answer_text},
                     connection_answer=answer
                 )
-                logger.info(f"Created inbox item {inbox_item.id} for partner {partner.id}")
+                logger.info(f"Created inbox item {inbox_item.id} for partner {partner_id}")
                 # Signal will automatically broadcast inbox:created to partner
             except Exception as e:
                 logger.error(f"Error creating inbox item for partner: {str(e)}", exc_info=True)
@@ -759,20 +948,40 @@ class DailyConnectionViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.Mo
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
-class InboxItemViewSet(BroadcastMixin, viewsets.ModelViewSet):
+class InboxItemViewSet(VersionedListMixin, BroadcastMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing inbox items.
     - GET /api/inbox/ - Get all inbox items for current user
     - GET /api/inbox/unread/ - Get unread inbox items
+    - GET /api/inbox/counts/ - Get the unread and total counts (for badges)
     - POST /api/inbox/{id}/mark-as-read/ - Mark inbox item as read
     
     Real-time updates are handled automatically via Django signals.
     """
     serializer_class = InboxItemSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FeedPagination
+    version_resource = 'inbox'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'list': Budget(queries=2, cache_calls=7),
+        'unread': Budget(queries=2, cache_calls=2),
+        'counts': Budget(queries=8, cache_calls=2),
+        'retrieve': Budget(queries=1, cache_calls=2),
+        'update': Budget(queries=2, cache_calls=7, channel_sends=1),
+        'partial_update': Budget(queries=2, cache_calls=7, channel_sends=1),
+        'destroy': Budget(queries=4, cache_calls=8, channel_sends=1),
+        'mark_as_read': Budget(queries=11, cache_calls=10, channel_sends=2),
+        'mark_all_as_read': Budget(queries=12, cache_calls=10, channel_sends=2),
+        'react': Budget(queries=2, cache_calls=7, channel_sends=1),
+        'share_response': Budget(queries=2, cache_calls=7, channel_sends=1),
+    }
     
     def get_queryset(self):
-        return InboxItem.objects.filter(recipient=self.request.user)
+        return InboxItemSerializer.setup_eager_loading(InboxItem.objects.filter(recipient=self.request.user))
+    
+    def get_version_scope(self):
+        return user_scope(self.request.user.id)
     
     @action(detail=False, methods=['get'])
     def unread(self, request):
@@ -787,6 +996,12 @@ class InboxItemViewSet(BroadcastMixin, viewsets.ModelViewSet):
         serializer = self.get_serializer(unread_items, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def counts(self, request):
+        """Get the unread and total inbox counts from the user's counter row"""
+        counter = InboxCounter.for_user(request.user.id)
+        return Response(InboxCounterSerializer(counter).data, status=status.HTTP_200_OK)
+    
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """Mark an inbox item as read"""
@@ -799,15 +1014,22 @@ class InboxItemViewSet(BroadcastMixin, viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        """Mark all inbox items as read"""
-        items = self.get_queryset().filter(is_read=False)
+        """
+        Mark all inbox items as read with a single UPDATE.
         
-        # Update and broadcast each item
-        updated = 0
-        for item in items:
-            item.is_read = True
-            item.save()  # This will trigger the signal and broadcast
-            updated += 1
+        The update skips the InboxItem signals, so the counter, the list
+        version and the user's sockets are brought up to date here: one
+        ``inbox:bulk_read`` event carries the ids of the items marked read.
+        """
+        with transaction.atomic():
+            unread = self.get_queryset().filter(is_read=False)
+            item_ids = list(unread.values_list('id', flat=True))
+            updated = unread.filter(id__in=item_ids).update(is_read=True, updated_at=timezone.now())
+            if updated:
+                counter = InboxCounter.apply(request.user.id, unread=-updated)
+                bump_versions(['inbox'], [user_scope(request.user.id)])
+                self.broadcast_to_user(request.user, 'inbox:bulk_read', {'ids': item_ids})
+                self.broadcast_to_user(request.user, 'inbox:counts', InboxCounterSerializer(counter).data)
         
         return Response(
             {'detail': f'{updated} items marked as read'},
@@ -843,7 +1065,7 @@ class InboxItemViewSet(BroadcastMixin, viewsets.ModelViewSet):
         serializer = self.get_serializer(item)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-class MemoryViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
+class MemoryViewSet(VersionedListMixin, PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing shared memories.
     - GET /api/memories/ - Get all memories for current user and partner
@@ -857,22 +1079,24 @@ class MemoryViewSet(PartnerResolutionMixin, BroadcastMixin, viewsets.ModelViewSe
     """
     serializer_class = MemorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DateFeedPagination
+    version_resource = 'memories'
+    budgets = {
+        **CONTENT_BUDGETS,
+        'toggle_favorite': Budget(queries=3, cache_calls=11, channel_sends=1),
+    }
     
     def get_queryset(self):
-        user = self.request.user
         # Get memories for user and their partner if coupled
-        partner = self.get_partner(user)
-        if partner:
-            return Memory.objects.filter(user__in=[user, partner])
-        return Memory.objects.filter(user=user)
+        return MemorySerializer.setup_eager_loading(Memory.objects.for_couple(self.couple_context))
     
     def perform_create(self, serializer):
-        memory = serializer.save()
-        self.broadcast('memory:created', MemorySerializer(memory).data)
+        serializer.save(couple_id=self.couple_context.couple_id)
+        self.broadcast('memory:created', serializer.data)
     
     def perform_update(self, serializer):
-        memory = serializer.save()
-        self.broadcast('memory:updated', MemorySerializer(memory).data)
+        serializer.save()
+        self.broadcast('memory:updated', serializer.data)
     
     def perform_destroy(self, instance):
         memory_id = instance.id
@@ -0,0 +1,116 @@
+"""
+WebSocket admission control and connection accounting.
+
+- ``JWTAuthMiddleware`` authenticates sockets from the ``?token=`` query
+  string (browsers cannot set an Authorization header on a WebSocket).
+- ``ConnectionSlots`` caps concurrent sockets per user with one key per
+  socket in the shared cache, so the limit holds across workers. Each socket
+  refreshes its key on every heartbeat; a key not refreshed for twice the idle
+  timeout expires, so slots held by crashed workers are given back without
+  skewing the slots of live sockets.
+- ``record`` / ``connection_stats`` keep the accepted, rejected and reaped
+  connection counters exposed by ``RealtimeStatsView``.
+"""
+import logging
+from urllib.parse import parse_qs
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_COUNTERS = ('accepted', 'rejected', 'reaped')
+
+
+@database_sync_to_async
+def _authenticate(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed) as e:
+        logger.info(f"Rejected WebSocket token: {str(e)}")
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Set ``scope['user']`` from a JWT access token passed as ``?token=``.
+
+    Sockets without a token keep the user resolved by the session middleware
+    (an ``AnonymousUser`` for API clients).
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if raw_token := query.get('token', [None])[0]:
+            if (user := await _authenticate(raw_token)) is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """Session auth (for the admin and same-origin pages) plus JWT query auth"""
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
+
+
+class ConnectionSlots:
+    """
+    Per-user socket slots stored in the cache.
+
+    Slot ``n`` of a user is the key ``ws_connections:<user id>:<n>`` holding
+    the id of the connection that took it, so only that connection gives it
+    back and releasing twice is harmless.
+    """
+
+    @staticmethod
+    def _key(user_id, slot):
+        return f"ws_connections:{user_id}:{slot}"
+
+    @staticmethod
+    def _timeout():
+        return settings.WEBSOCKET_IDLE_TIMEOUT * 2
+
+    @classmethod
+    async def acquire(cls, user_id, connection_id):
+        """Take a free slot; returns its number, or None when the user is at the cap"""
+        for slot in range(settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER):
+            if await cache.aadd(cls._key(user_id, slot), connection_id, cls._timeout()):
+                return slot
+        return None
+
+    @classmethod
+    async def release(cls, user_id, slot, connection_id):
+        """Give back a slot taken by ``connection_id``; a no-op once released or expired"""
+        key = cls._key(user_id, slot)
+        if await cache.aget(key) == connection_id:
+            await cache.adelete(key)
+
+    @classmethod
+    async def touch(cls, user_id, slot, connection_id):
+        """Keep the slot of a live socket, taking it again if its key was evicted"""
+        if not await cache.atouch(cls._key(user_id, slot), cls._timeout()):
+            await cache.aadd(cls._key(user_id, slot), connection_id, cls._timeout())
+
+
+def _counter_key(name):
+    return f"ws_stats:{name}"
+
+
+async def record(name):
+    """Increment one of ``CONNECTION_COUNTERS``"""
+    key = _counter_key(name)
+    await cache.aadd(key, 0, None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, None)
+
+
+def connection_stats():
+    """Current value of every connection counter"""
+    values = cache.get_many([_counter_key(name) for name in CONNECTION_COUNTERS])
+    return {name: values.get(_counter_key(name), 0) for name in CONNECTION_COUNTERS}
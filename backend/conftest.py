@@ -2,6 +2,7 @@
 Pytest configuration and shared fixtures for Django tests
 """
 import pytest
+from contextlib import contextmanager
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from api.models import (
@@ -9,6 +10,9 @@ from api.models import (
     UserPreferences, Couple
 )
 from django.conf import settings
+from django.core.cache import caches
+from api.budgets import Meter, budget_for_request
+from api.realtime import buffered_broadcasts
 
 
 # Ensure test settings are applied
@@ -20,6 +24,15 @@ def configure_django_settings():
     settings.CSRF_COOKIE_SECURE = False
     settings.DEBUG = True
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with empty caches (couple contexts, rate limits, replay rings, ...)"""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    yield
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
 @pytest.fixture
 def user(db):
     """Create a test user"""
@@ -57,6 +70,15 @@ def authenticated_client(user):
         client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
     return client
 
+@pytest.fixture
+def client_for():
+    """Make API clients authenticated as a given user, without a token round trip"""
+    def make(user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+    return make
+
 @pytest.fixture
 def task(user):
     """Create a test task"""
@@ -128,3 +150,22 @@ def couple(user, user2):
         user1=user,
         user2=user2
     )
+
+@pytest.fixture
+def assert_within_budget(django_capture_on_commit_callbacks):
+    """
+    Context manager asserting the request made inside it stays within the
+    budget its view declares for it (see api/budgets.py). Commit callbacks
+    and buffered WebSocket events are run, so their cost is counted.
+    Requests must authenticate with force_authenticate.
+    """
+    @contextmanager
+    def within_budget(method, path):
+        budget = budget_for_request(method, path)
+        assert budget is not None, f"No budget declared for {method} {path}"
+        with Meter() as meter:
+            with buffered_broadcasts(), django_capture_on_commit_callbacks(execute=True):
+                yield meter
+        violations = budget.violations(meter)
+        assert not violations, f"{method} {path} over budget: {', '.join(violations)}"
+    return within_budget
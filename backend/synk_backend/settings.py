@@ -85,6 +85,10 @@ MIDDLEWARE = [
     'api.middleware.InputValidationMiddleware',
     # Error handling and logging
     'api.error_handling.ErrorLoggingMiddleware',
+    # Log sampled requests over their view's query/cache/send budget
+    'api.budgets.RequestBudgetMiddleware',
+    # Flush WebSocket events committed during the request in one batch
+    'api.realtime.BroadcastBufferMiddleware',
 ]
 
 ROOT_URLCONF = 'synk_backend.urls'
@@ -117,9 +121,12 @@ DB_HOST = os.environ.get('DB_HOST', 'localhost')
 
 if DB_HOST and DB_HOST != 'localhost':
     # Use PostgreSQL (for Docker)
+    # Connections come from a per-process pool (api/pooled_postgresql) unless DB_POOL=False;
+    # they go back to the pool at the end of each request (CONN_MAX_AGE 0)
+    DB_POOL = os.environ.get('DB_POOL', 'True') == 'True'
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'api.pooled_postgresql' if DB_POOL else 'django.db.backends.postgresql',
             'NAME': os.environ.get('DB_NAME', 'synk_db'),
             'USER': os.environ.get('DB_USER', 'postgres'),
             'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
@@ -130,6 +137,12 @@ if DB_HOST and DB_HOST != 'localhost':
             },
         }
     }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
 else:
     # Use SQLite for local development (when DB_HOST is localhost or not set)
     DATABASES = {
@@ -192,7 +205,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageNumberCountPagination',
     'PAGE_SIZE': 100,
     'EXCEPTION_HANDLER': 'api.error_handling.synk_exception_handler',
     # Rate limiting (throttling) for DRF
@@ -238,6 +251,21 @@ CORS_ALLOWED_ORIGINS = _default_cors_origins
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Caches. WebSocket replay rings (see api/realtime.py) live in their own
+# cache, so a busy stream culls old frames of other streams at worst and never
+# evicts couple contexts, rate limits or connection slots from the default one
+REPLAY_CACHE = 'replay'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    REPLAY_CACHE: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': REPLAY_CACHE,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('WEBSOCKET_REPLAY_CACHE_ENTRIES', 50000))},
+    },
+}
+
 # Channels settings
 if DEBUG:
     # Development: Allow all origins and use in-memory channel layer
@@ -260,6 +288,20 @@ else:
                 },
             },
         }
+        # Share the caches (couple contexts, list versions, replay rings)
+        # between workers as well; replay keys expire after WEBSOCKET_REPLAY_TTL
+        _redis_location = f"redis://{REDIS_HOST}:{int(os.environ.get('REDIS_PORT', 6379))}"
+        CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': _redis_location,
+            },
+            REPLAY_CACHE: {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': _redis_location,
+                'KEY_PREFIX': REPLAY_CACHE,
+            },
+        }
     else:
         # Fall back to in-memory if Redis is not configured
         # This allows single-instance deployments without Redis
@@ -269,6 +311,25 @@ else:
             },
         }
 
+# WebSocket admission and liveness (see api/websocket.py)
+WEBSOCKET_MAX_CONNECTIONS_PER_USER = int(os.environ.get('WEBSOCKET_MAX_CONNECTIONS_PER_USER', 5))
+WEBSOCKET_HEARTBEAT_INTERVAL = int(os.environ.get('WEBSOCKET_HEARTBEAT_INTERVAL', 25))  # seconds between server pings
+WEBSOCKET_IDLE_TIMEOUT = int(os.environ.get('WEBSOCKET_IDLE_TIMEOUT', 60))  # seconds of silence before a socket is reaped
+WEBSOCKET_REPLAY_BUFFER_SIZE = int(os.environ.get('WEBSOCKET_REPLAY_BUFFER_SIZE', 500))  # frames kept per stream for reconnects
+WEBSOCKET_REPLAY_TTL = int(os.environ.get('WEBSOCKET_REPLAY_TTL', 60 * 60))  # seconds frames, and counters of streams no socket listens to, are kept
+
+# Write WebSocket events to the outbox table for the dispatch_outbox worker
+# instead of sending them from the request (see api/outbox.py)
+REALTIME_OUTBOX = os.environ.get('REALTIME_OUTBOX', 'False') == 'True'
+REALTIME_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('REALTIME_OUTBOX_MAX_ATTEMPTS', 10))  # sends tried before an event is given up
+
+# Days tombstones of deleted rows are kept for the delta sync endpoint; older
+# cursors get a full sync (see api/sync.py and the prune_tombstones command)
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+# Share of requests measured against their view's budget (see api/budgets.py); 0 disables
+REQUEST_BUDGET_SAMPLE_RATE = float(os.environ.get('REQUEST_BUDGET_SAMPLE_RATE', '0'))
+
 # ============================================================================
 # PRODUCTION SECURITY SETTINGS (OWASP ASVS Compliance)
 # ============================================================================
@@ -54,6 +54,7 @@ vi.mock('./services/djangoApi', () => ({
     toggleFavorite: vi.fn().mockResolvedValue({}),
   },
   coupleApi: { get: vi.fn().mockResolvedValue(null), uncouple: vi.fn() },
+  bootstrapApi: { get: vi.fn().mockResolvedValue({ boards: {} }) },
   couplingCodeApi: { create: vi.fn(), use: vi.fn() },
   accountApi: { deleteAccount: vi.fn() },
 }))
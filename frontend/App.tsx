@@ -19,7 +19,7 @@ import Toast, { ToastType } from './components/Toast';
 import ConfirmDialog, { ConfirmDialogProps } from './components/ConfirmDialog';
 import { djangoAuthService, User } from './services/djangoAuth';
 import { djangoRealtimeService } from './services/djangoRealtime';
-import { tasksApi, milestonesApi, activitiesApi, suggestionsApi, collectionsApi, preferencesApi, inboxApi, memoriesApi, coupleApi } from './services/djangoApi';
+import { tasksApi, milestonesApi, activitiesApi, suggestionsApi, collectionsApi, coupleApi, bootstrapApi } from './services/djangoApi';
 import { getUserAvatar } from './utils/avatar';
 import { getDisplayName } from './utils/userDisplay';
 
@@ -41,6 +41,7 @@ const App: React.FC = () => {
   const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
   const [collections, setCollections] = useState<Collection[]>([]);
   const [inboxItems, setInboxItems] = useState<InboxItem[]>([]);
+  const [inboxUnreadCount, setInboxUnreadCount] = useState(0);
   const [memories, setMemories] = useState<Memory[]>([]);
   const [isRightSidebarOpen, setIsRightSidebarOpen] = useState(() => {
     if (typeof window === 'undefined') return true;
@@ -208,50 +209,18 @@ const App: React.FC = () => {
   // Load data from API
   const loadData = async () => {
     try {
-      const [tasksData, milestonesData, activitiesData, suggestionsData, collectionsData, preferencesData, inboxItemsData, memoriesData] = await Promise.all([
-        tasksApi.getAll().catch((err) => {
-          console.error('Error loading tasks:', err);
-          return [];
-        }),
-        milestonesApi.getAll().catch((err) => {
-          console.error('Error loading milestones:', err);
-          return [];
-        }),
-        activitiesApi.getAll(50).catch((err) => {
-          console.error('Error loading activities:', err);
-          return [];
-        }),
-        suggestionsApi.getAll().catch((err) => {
-          console.error('Error loading suggestions:', err);
-          return [];
-        }),
-        collectionsApi.getAll().catch((err) => {
-          console.error('Error loading collections:', err, err?.data);
-          return [];
-        }),
-        preferencesApi.get().catch((err) => {
-          console.error('Error loading preferences:', err);
-          return null;
-        }),
-        inboxApi.getAll().catch((err) => {
-          console.error('Error loading inbox items:', err);
-          return [];
-        }),
-        memoriesApi.getAll().catch((err) => {
-          console.error('Error loading memories:', err);
-          return [];
-        }),
-      ]);
-
-      // Only set data if arrays are returned (not empty errors)
-      setTasks((tasksData as any[]).length > 0 ? (tasksData as any[]).map(transformTask) : []);
-      setMilestones((milestonesData as any[]).length > 0 ? (milestonesData as any[]).map(transformMilestone) : []);
-      setActivities((activitiesData as any[]).length > 0 ? (activitiesData as any[]).map(transformActivity) : []);
-      setSuggestions((suggestionsData as any[]).length > 0 ? (suggestionsData as any[]).map(transformSuggestion) : []);
-      const transformedCollections = (collectionsData as any[]).length > 0 ? (collectionsData as any[]).map(transformCollection) : [];
-      setCollections(transformedCollections);
-      setInboxItems((inboxItemsData as any[]).length > 0 ? (inboxItemsData as any[]).map(transformInboxItem) : []);
-      setMemories((memoriesData as any[]).length > 0 ? (memoriesData as any[]).map(transformMemory) : []);
+      // One request returns the first page of every board
+      const { boards, inbox_unread_count } = await bootstrapApi.get() as any;
+      const rows = (board: string) => (boards?.[board]?.results ?? []) as any[];
+
+      setTasks(rows('tasks').map(transformTask));
+      setMilestones(rows('milestones').map(transformMilestone));
+      setActivities(rows('activities').map(transformActivity));
+      setSuggestions(rows('suggestions').map(transformSuggestion));
+      setCollections(rows('collections').map(transformCollection));
+      setInboxItems(rows('inbox').map(transformInboxItem));
+      setMemories(rows('memories').map(transformMemory));
+      setInboxUnreadCount(inbox_unread_count ?? 0);
     } catch (error) {
       console.error('Error loading data:', error);
     }
@@ -283,6 +252,17 @@ const App: React.FC = () => {
         const taskId = typeof data.id === 'number' ? data.id.toString() : data.id;
         setTasks(prev => prev.filter(t => t.id !== taskId));
       },
+      'task:bulk': (data: { created: any[]; updated: any[]; deleted: Array<string | number> }) => {
+        const deletedIds = new Set(data.deleted.map(String));
+        const updated = new Map(data.updated.map(task => [String(task.id), transformTask(task)]));
+        setTasks(prev => {
+          const kept = prev
+            .filter(t => !deletedIds.has(t.id))
+            .map(t => updated.get(t.id) ?? t);
+          const created = data.created.map(transformTask).filter(task => !kept.some(t => t.id === task.id));
+          return [...created, ...kept];
+        });
+      },
       'milestone:created': (data: any) => {
         const transformed = transformMilestone(data);
         setMilestones(prev => {
@@ -343,6 +323,17 @@ const App: React.FC = () => {
         const itemId = typeof data.id === 'number' ? data.id.toString() : data.id;
         setInboxItems(prev => prev.filter(item => item.id !== itemId));
       },
+      'inbox:bulk_deleted': (data: { ids: Array<string | number> }) => {
+        const deletedIds = new Set(data.ids.map(String));
+        setInboxItems(prev => prev.filter(item => !deletedIds.has(item.id)));
+      },
+      'inbox:bulk_read': (data: { ids: Array<string | number> }) => {
+        const readIds = new Set(data.ids.map(String));
+        setInboxItems(prev => prev.map(item => readIds.has(item.id) ? { ...item, isRead: true } : item));
+      },
+      'inbox:counts': (data: { unread: number; total: number }) => {
+        setInboxUnreadCount(data.unread);
+      },
       'memory:created': (data: any) => {
         const transformed = transformMemory(data);
         setMemories(prev => {
@@ -365,6 +356,10 @@ const App: React.FC = () => {
         const memoryId = typeof data.id === 'number' ? data.id.toString() : data.id;
         setMemories(prev => prev.filter(m => m.id !== memoryId));
       },
+      // Sent on reconnect when more events were missed than the server can replay
+      'sync:required': () => {
+        loadData();
+      },
     };
 
     // Register handlers
@@ -848,7 +843,7 @@ const App: React.FC = () => {
                 onAddCollection={addCollection}
                 onDeleteCollection={deleteCollection}
                 onToggle={toggleLeftSidebar}
-                suggestionsCount={suggestions.length}
+                suggestionsCount={suggestions.length + inboxUnreadCount}
                 theme={theme}
               />
             </div>
@@ -2,7 +2,7 @@
  * Tests for Django API service
  */
 import { describe, it, expect, vi, beforeEach } from 'vitest'
-import { tasksApi, coupleApi, couplingCodeApi } from '../djangoApi'
+import { tasksApi, coupleApi, couplingCodeApi, syncApi, inboxApi, batchApi } from '../djangoApi'
 
 // Mock djangoAuthService
 vi.mock('../djangoAuth', () => ({
@@ -50,6 +50,21 @@ describe('djangoApi', () => {
       expect(result).toEqual(mockTask)
     })
 
+    it('posts a bulk batch', async () => {
+      const mockBatch = { created: [], updated: [{ id: '1', status: 'Completed' }], deleted: [2] }
+      ;(global.fetch as any).mockResolvedValueOnce({
+        ok: true,
+        json: async () => mockBatch
+      })
+
+      const result = await tasksApi.bulk({ update: [{ id: 1, status: 'Completed' }], delete: [2] })
+      expect(result).toEqual(mockBatch)
+      const [url, options] = (global.fetch as any).mock.calls[0]
+      expect(url).toContain('/api/tasks/bulk/')
+      expect(options.method).toBe('POST')
+      expect(JSON.parse(options.body)).toEqual({ update: [{ id: 1, status: 'Completed' }], delete: [2] })
+    })
+
     it('handles errors', async () => {
       ;(global.fetch as any).mockResolvedValueOnce({
         ok: false,
@@ -110,6 +125,50 @@ describe('djangoApi', () => {
     })
   })
 
+  describe('syncApi', () => {
+    it('requests changes since a cursor', async () => {
+      const mockDelta = { cursor: '2024-01-02T00:00:00+00:00', changes: {}, deleted: {} }
+      ;(global.fetch as any).mockResolvedValueOnce({
+        ok: true,
+        json: async () => mockDelta
+      })
+
+      const result = await syncApi.since('2024-01-01T00:00:00+00:00')
+      expect(result).toEqual(mockDelta)
+      expect((global.fetch as any).mock.calls[0][0]).toContain('/api/sync/?since=2024-01-01T00%3A00%3A00%2B00%3A00')
+    })
+  })
+
+  describe('batchApi', () => {
+    it('posts the sub-requests in order', async () => {
+      const mockBatch = { committed: true, responses: [{ status: 201, headers: {}, body: {} }] }
+      ;(global.fetch as any).mockResolvedValueOnce({
+        ok: true,
+        json: async () => mockBatch
+      })
+
+      const requests = [{ method: 'POST' as const, path: '/api/memories/', body: { title: 'Picnic' } }]
+      const result = await batchApi.run(requests, true)
+      expect(result).toEqual(mockBatch)
+      const [url, options] = (global.fetch as any).mock.calls[0]
+      expect(url).toContain('/api/batch/')
+      expect(JSON.parse(options.body)).toEqual({ requests, atomic: true })
+    })
+  })
+
+  describe('inboxApi', () => {
+    it('fetches the inbox counts', async () => {
+      ;(global.fetch as any).mockResolvedValueOnce({
+        ok: true,
+        json: async () => ({ unread: 2, total: 5 })
+      })
+
+      const result = await inboxApi.getCounts()
+      expect(result).toEqual({ unread: 2, total: 5 })
+      expect((global.fetch as any).mock.calls[0][0]).toContain('/api/inbox/counts/')
+    })
+  })
+
   describe('accountApi', () => {
     it('deletes account with password', async () => {
       const { accountApi } = await import('../djangoApi')
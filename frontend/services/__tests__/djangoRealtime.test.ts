@@ -8,6 +8,7 @@ import * as djangoAuth from '../djangoAuth'
 vi.mock('../djangoAuth', () => ({
   djangoAuthService: {
     getCurrentUser: vi.fn(),
+    getAccessToken: vi.fn(),
   },
 }))
 
@@ -20,6 +21,7 @@ describe('djangoRealtimeService', () => {
 
   beforeEach(() => {
     vi.clearAllMocks()
+    vi.mocked(djangoAuth.djangoAuthService.getAccessToken).mockResolvedValue('access-token')
     djangoRealtimeService.disconnect()
     mockWs = {
       readyState: CONNECTING,
@@ -57,6 +59,66 @@ describe('djangoRealtimeService', () => {
     expect(WsConstructor).toHaveBeenCalledWith(expect.stringMatching(/\/ws\/1\//))
   })
 
+  it('connect passes the access token and answers server pings', async () => {
+    vi.mocked(djangoAuth.djangoAuthService.getCurrentUser).mockResolvedValue({ id: 1 } as any)
+    const send = vi.fn()
+    Object.assign(mockWs, { send })
+    await djangoRealtimeService.connect()
+    expect(WsConstructor).toHaveBeenCalledWith(expect.stringMatching(/\/ws\/1\/\?token=access-token$/))
+
+    const onmessage = (mockWs as any).onmessage
+    onmessage({ data: JSON.stringify({ event: 'ping', data: {} }) })
+    expect(send).toHaveBeenCalledWith(JSON.stringify({ type: 'pong' }))
+  })
+
+  it('drops already seen events and resumes from the last sequence number', async () => {
+    vi.mocked(djangoAuth.djangoAuthService.getCurrentUser).mockResolvedValue({ id: 1 } as any)
+    await djangoRealtimeService.connect()
+    const cb = vi.fn()
+    djangoRealtimeService.on('task:created', cb)
+
+    const onmessage = (mockWs as any).onmessage
+    onmessage({ data: JSON.stringify({ event: 'stream:position', data: { user_1: 10 } }) })
+    onmessage({ data: JSON.stringify({ stream: 'user_1', seq: 10, event: 'task:created', data: { id: 1 } }) })
+    onmessage({ data: JSON.stringify({ stream: 'user_1', seq: 11, event: 'task:created', data: { id: 2 } }) })
+    expect(cb).toHaveBeenCalledTimes(1)
+    expect(cb).toHaveBeenCalledWith({ id: 2 })
+
+    // Simulate a fresh connection attempt after the socket dropped
+    ;(mockWs as any).onopen()
+    await djangoRealtimeService.connect()
+    expect(WsConstructor).toHaveBeenLastCalledWith(
+      expect.stringContaining(`last_seq=${encodeURIComponent(JSON.stringify({ user_1: 11 }))}`)
+    )
+    djangoRealtimeService.off('task:created', cb)
+  })
+
+  it('asks for a replay on a sequence gap instead of dropping the missing events', async () => {
+    vi.mocked(djangoAuth.djangoAuthService.getCurrentUser).mockResolvedValue({ id: 1 } as any)
+    const send = vi.fn()
+    Object.assign(mockWs, { send })
+    await djangoRealtimeService.connect()
+    const cb = vi.fn()
+    djangoRealtimeService.on('task:updated', cb)
+
+    const onmessage = (mockWs as any).onmessage
+    const frame = (seq: number, id: number) =>
+      ({ data: JSON.stringify({ stream: 'user_1', seq, event: 'task:updated', data: { id } }) })
+    onmessage({ data: JSON.stringify({ event: 'stream:position', data: { user_1: 10 } }) })
+    onmessage(frame(12, 2))
+    onmessage(frame(13, 3))
+    expect(cb).not.toHaveBeenCalled()
+    expect(send).toHaveBeenCalledTimes(1)
+    expect(send).toHaveBeenCalledWith(JSON.stringify({ type: 'replay', last_seq: { user_1: 10 } }))
+
+    // The late frame arrives, then the replay
+    onmessage(frame(11, 1))
+    onmessage({ data: JSON.stringify({ event: 'stream:position', data: { user_1: 10 } }) })
+    ;[11, 12, 13].forEach((seq) => onmessage(frame(seq, seq - 10)))
+    expect(cb.mock.calls.map(([data]) => data.id)).toEqual([1, 2, 3])
+    djangoRealtimeService.off('task:updated', cb)
+  })
+
   it('on and off register and unregister listeners', () => {
     const cb = vi.fn()
     djangoRealtimeService.on('task:created', cb)
@@ -96,6 +96,11 @@ export const tasksApi = {
   delete: (id: number) => request(`/api/tasks/${id}/`, {
     method: 'DELETE',
   }),
+  // Many creates, updates ({ id, ...fields }) and deletes applied in one transaction
+  bulk: (operations: { create?: any[]; update?: any[]; delete?: (string | number)[] }) => request('/api/tasks/bulk/', {
+    method: 'POST',
+    body: JSON.stringify(operations),
+  }),
 };
 
 // Milestones API
@@ -202,10 +207,26 @@ export const dailyConnectionApi = {
   }),
 };
 
+// Batch API: several requests in one round trip
+export interface BatchSubRequest {
+  method: 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE';
+  path: string;
+  body?: any;
+}
+
+export const batchApi = {
+  // With atomic, the first failing request rolls back the whole batch
+  run: (requests: BatchSubRequest[], atomic = false) => request('/api/batch/', {
+    method: 'POST',
+    body: JSON.stringify({ requests, atomic }),
+  }),
+};
+
 // Inbox API
 export const inboxApi = {
   getAll: () => request('/api/inbox/'),
   getUnread: () => request('/api/inbox/unread/'),
+  getCounts: () => request('/api/inbox/counts/'),
   markAsRead: (itemId: number) => request(`/api/inbox/${itemId}/mark_as_read/`, {
     method: 'POST',
   }),
@@ -238,3 +259,13 @@ export const memoriesApi = {
     method: 'POST',
   }),
 };
+
+// Bootstrap API: everything the app needs at startup in one request
+export const bootstrapApi = {
+  get: () => request('/api/bootstrap/'),
+};
+
+// Delta sync API: rows changed and deleted since a cursor from a previous sync
+export const syncApi = {
+  since: (cursor?: string) => request(cursor ? `/api/sync/?since=${encodeURIComponent(cursor)}` : '/api/sync/'),
+};
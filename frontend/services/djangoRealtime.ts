@@ -11,6 +11,10 @@ class DjangoRealtimeService {
   private maxReconnectAttempts = 5;
   private isIntentiallyClosed = false;
   private isConnecting = false;
+  // Last sequence number seen per stream, sent on reconnect so the server replays only missed events
+  private lastSeq: Record<string, number> = {};
+  // Streams with a replay requested after a gap, until the server answers with their position
+  private replayRequested: Set<string> = new Set();
 
   connect = async () => {
     // Prevent multiple simultaneous connection attempts
@@ -30,8 +34,17 @@ class DjangoRealtimeService {
         return;
       }
 
+      // Sockets are authenticated with the JWT access token (browsers cannot set headers)
+      const token = await djangoAuthService.getAccessToken();
+      if (!token) {
+        return;
+      }
+
       this.userId = user.id;
-      const wsUrl = `${WS_BASE_URL}/ws/${this.userId}/`;
+      let wsUrl = `${WS_BASE_URL}/ws/${this.userId}/?token=${encodeURIComponent(token)}`;
+      if (Object.keys(this.lastSeq).length > 0) {
+        wsUrl += `&last_seq=${encodeURIComponent(JSON.stringify(this.lastSeq))}`;
+      }
       
       this.ws = new WebSocket(wsUrl);
 
@@ -44,6 +57,35 @@ class DjangoRealtimeService {
       this.ws.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data);
+          // Answer server heartbeats so the connection is not reaped as idle
+          if (message.event === 'ping') {
+            this.ws?.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          // Positions the server will replay from (or resume after a sync:required)
+          if (message.event === 'stream:position') {
+            // Never move back: frames seen while a replay was in flight stay seen
+            Object.entries(message.data as Record<string, number>).forEach(([stream, seq]) => {
+              this.lastSeq[stream] = Math.max(this.lastSeq[stream] ?? seq, seq);
+              this.replayRequested.delete(stream);
+            });
+            return;
+          }
+          if (message.stream !== undefined) {
+            const last = this.lastSeq[message.stream];
+            if (last !== undefined) {
+              // Replayed and live copies of the same event can overlap right after a reconnect
+              if (message.seq <= last) {
+                return;
+              }
+              // A frame is missing: hold this one back, the replay resends it after the missing ones
+              if (message.seq > last + 1) {
+                this.requestReplay(message.stream);
+                return;
+              }
+            }
+            this.lastSeq[message.stream] = message.seq;
+          }
           this.emit(message.event, message.data);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
@@ -68,6 +110,14 @@ class DjangoRealtimeService {
     }
   };
 
+  private requestReplay = (stream: string) => {
+    if (this.replayRequested.has(stream)) {
+      return;
+    }
+    this.replayRequested.add(stream);
+    this.ws?.send(JSON.stringify({ type: 'replay', last_seq: { [stream]: this.lastSeq[stream] } }));
+  };
+
   private attemptReconnect = () => {
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++;
@@ -90,6 +140,8 @@ class DjangoRealtimeService {
     }
     // Don't clear listeners on disconnect - let the component handle cleanup
     this.userId = null;
+    this.lastSeq = {};
+    this.replayRequested.clear();
   };
 
   private emit = (event: string, data: any) => {